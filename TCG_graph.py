@@ -53,12 +53,7 @@ def build_subgraphs(G, induced='vertex', subgraph_filter=lambda x:True):
         subgraphs = [G.subgraph(nbunch) for nbunch in node_power_set] # Builds all the node induced subgraphs.
     if induced == 'vertex':
         vertex_powerset = list_powerset(G.edges(data=True))
-        subgraphs = []
-        for v_list in vertex_powerset:
-            subG = DiGraph(v_list) # Creating subraph from vertices
-            for n in subG.node.keys():
-                subG.node[n] = G.node[n] # Transfering node attributes
-            subgraphs.append(subG)
+        subgraphs = [vertex_subgraph(G, v_list) for v_list in vertex_powerset]
             
         # Adding single nodes
         for n, d in G.nodes(data=True):
@@ -71,6 +66,15 @@ def build_subgraphs(G, induced='vertex', subgraph_filter=lambda x:True):
     
     return subgraphs
         
+def vertex_subgraph(G, v_list):
+    """
+    Returns the subgraph of G made of the vertices (edges with data) in v_list, with the node attributes of G.
+    """
+    subG = DiGraph(v_list) # Creating subraph from vertices
+    for n in subG.node.keys():
+        subG.node[n] = G.node[n] # Transfering node attributes
+    return subG
+        
 def list_powerset(lst):
     """
     Returns the powerset of all the elements in lst
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Victor Barres
+
+Shared incremental match network between construction SemFrames and the SemRep (Rete-style).
+
+All the SemFrames of a set of construction schemas are compiled into a single discrimination network:
+    - alpha nodes test a single SemRep element against a SemFrame node (concept is_a + frame) or a SemFrame edge (relation concept is_a + end nodes tests).
+    Identical tests are shared by all the constructions.
+    - join nodes extend the partial matches of their parent by one SemFrame edge, checking the consistency of the node bindings.
+    Constructions whose SemFrames start with the same sequence of edge tests share the same chain of join nodes (and partial matches).
+
+SemRep elements are fed to the network once. Each new element only meets the partial matches it can extend, so the cost of an update
+is proportional to the SemRep changes instead of (constructions x SemRep subgraphs).
+
+Uses NetworkX module for the SemRep and SemFrame graphs.
+"""
+from __future__ import division
+
+class MATCH_JOIN(object):
+    """
+    Join node of the match network.
+
+    Data:
+        - parent (MATCH_JOIN): Parent join node (None for the first SemFrame edge).
+        - alpha (DICT): The edge alpha node providing the SemRep edges.
+        - var_from (INT), var_to (INT): Variables bound by the SemFrame edge end nodes.
+        - num_vars (INT): Number of variables bound by the parent's partial matches.
+        - tokens ([TUPLE]): Partial matches (tuples of SemRep node names, indexed by variable).
+        - children ([MATCH_JOIN]): Join nodes extending the partial matches.
+        - terminals ([(INT, [SemFrame node])]): Constructions (index, variables to SemFrame nodes) completely matched at this node.
+        - left_index (DICT): Parent's partial matches indexed by the values of the variables already bound by the SemFrame edge.
+    """
+    def __init__(self, parent, alpha, var_from, var_to, num_vars):
+        self.parent = parent
+        self.alpha = alpha
+        self.var_from = var_from
+        self.var_to = var_to
+        self.num_vars = num_vars
+        self.tokens = []
+        self.children = []
+        self.terminals = []
+        self.left_index = {}
+
+    def left_key(self, token):
+        """
+        Returns the values, in the partial match token, of the variables that the edge end nodes share with it.
+        """
+        return (token[self.var_from] if self.var_from < self.num_vars else None,
+                token[self.var_to] if self.var_to < self.num_vars else None)
+
+    def right_key(self, edge):
+        """
+        Returns the left_key() that the partial matches joined with edge need to have.
+        """
+        return (edge[0] if self.var_from < self.num_vars else None,
+                edge[1] if self.var_to < self.num_vars else None)
+
+    def alpha_edges(self, token):
+        """
+        Returns the SemRep edges of the alpha node that are compatible with the partial match token.
+        """
+        (u, v) = self.left_key(token)
+        if u is not None and v is not None:
+            return [(u, v)] if (u, v) in self.alpha['edges'] else []
+        if u is not None:
+            return self.alpha['by_from'].get(u, [])
+        if v is not None:
+            return self.alpha['by_to'].get(v, [])
+        return self.alpha['items']
+
+    def extend(self, token, edge):
+        """
+        Returns the partial match token extended by edge (None if the node bindings are inconsistent).
+        """
+        (u, v) = edge
+        new_token = token
+        if self.var_from >= self.num_vars:
+            if u in token:
+                return None
+            new_token += (u,)
+        if self.var_to >= len(new_token):
+            if v in new_token:
+                return None
+            new_token += (v,)
+        elif new_token[self.var_to] != v:
+            return None
+        return new_token
+
+    def clear(self):
+        self.tokens = []
+        self.left_index = {}
+
+class CXN_MATCH_NET(object):
+    """
+    Shared match network for the SemFrames of a list of construction schemas.
+
+    Data:
+        - cxn_schemas ([CXN_SCHEMA]): The compiled construction schemas.
+        - node_alphas ({KEY:DICT}): Single node SemFrames tests. {'concept':CONCEPT, 'frame':BOOL, 'terminals':[(INT, SemFrame node)]}
+        - edge_alphas ({KEY:DICT}): SemFrame edge tests. {'concept':CONCEPT, 'from':KEY, 'to':KEY, 'items':[(STR,STR)], 'edges':set, 'by_from':DICT, 'by_to':DICT, 'joins':[MATCH_JOIN]}
+        - first_joins ([MATCH_JOIN]): Join nodes of the first SemFrame edges.
+        - joins ({KEY:MATCH_JOIN}): Join nodes indexed by the sequence of tests they implement.
+        - SemRep (DiGraph): The SemRep currently bound to the network.
+        - matches ([(INT, [SemFrame node], TUPLE, [(STR,STR)])]): Complete matches (cxn index, variable nodes, token, SemRep edges) emitted by the last update.
+
+    Notes:
+        - SemFrames made of a single node are matched on single SemRep nodes. SemFrames with several nodes are matched on sets of SemRep edges,
+        and are never matched if one of their nodes is not linked by an edge (as in the exhaustive subgraph search).
+        - The SemRep is assumed to grow monotonically (see SEMANTIC_WM.update_SemRep()). Binding a different SemRep resets the network memories.
+    """
+    def __init__(self, cxn_schemas):
+        self.cxn_schemas = cxn_schemas[:]
+        self.node_alphas = {}
+        self.edge_alphas = {}
+        self.first_joins = []
+        self.joins = {}
+        self.SemRep = None
+        self.matches = []
+        self._is_a = {}
+        for i, cxn_schema in enumerate(self.cxn_schemas):
+            self._compile(i, cxn_schema.content.SemFrame.graph)
+        self.reset()
+
+    ###################
+    ### COMPILATION ###
+    ###################
+    @staticmethod
+    def _node_key(data):
+        return (data['concept'].id, data['frame'])
+
+    def _compile(self, cxn_index, SemFrame_graph):
+        """
+        Adds the SemFrame graph of the construction cxn_index to the network.
+        """
+        if SemFrame_graph.number_of_edges() == 0:
+            if SemFrame_graph.number_of_nodes() == 1:
+                node, data = SemFrame_graph.nodes(data=True)[0]
+                alpha = self.node_alphas.setdefault(CXN_MATCH_NET._node_key(data), {'concept':data['concept'], 'frame':data['frame'], 'terminals':[]})
+                alpha['terminals'].append((cxn_index, node))
+            return
+        if any(SemFrame_graph.degree(node) == 0 for node in SemFrame_graph.nodes()):
+            return
+
+        # Join order: each edge shares a bound node with the previous ones whenever possible.
+        edges = SemFrame_graph.edges(data=True)
+        ordered = []
+        bound = set()
+        while edges:
+            next_edge = next((e for e in edges if e[0] in bound or e[1] in bound), edges[0])
+            edges.remove(next_edge)
+            ordered.append(next_edge)
+            bound.update(next_edge[:2])
+
+        var_nodes = []
+        join = None
+        for (node_from, node_to, data) in ordered:
+            num_vars = len(var_nodes)
+            for node in (node_from, node_to):
+                if node not in var_nodes:
+                    var_nodes.append(node)
+            alpha_key = (data['concept'].id, CXN_MATCH_NET._node_key(SemFrame_graph.node[node_from]), CXN_MATCH_NET._node_key(SemFrame_graph.node[node_to]))
+            alpha = self.edge_alphas.get(alpha_key, None)
+            if not alpha:
+                alpha = {'concept':data['concept'], 'from':alpha_key[1], 'to':alpha_key[2],
+                         'from_test':(SemFrame_graph.node[node_from]['concept'], SemFrame_graph.node[node_from]['frame']),
+                         'to_test':(SemFrame_graph.node[node_to]['concept'], SemFrame_graph.node[node_to]['frame']),
+                         'items':[], 'edges':set(), 'by_from':{}, 'by_to':{}, 'joins':[]}
+                self.edge_alphas[alpha_key] = alpha
+            join_key = (id(join), alpha_key, var_nodes.index(node_from), var_nodes.index(node_to))
+            next_join = self.joins.get(join_key, None)
+            if not next_join:
+                next_join = MATCH_JOIN(join, alpha, var_nodes.index(node_from), var_nodes.index(node_to), num_vars)
+                self.joins[join_key] = next_join
+                alpha['joins'].append(next_join)
+                if join:
+                    join.children.append(next_join)
+                else:
+                    self.first_joins.append(next_join)
+            join = next_join
+        join.terminals.append((cxn_index, var_nodes, [(var_nodes.index(e[0]), var_nodes.index(e[1])) for e in ordered]))
+
+    #############
+    ### TESTS ###
+    #############
+    def is_a(self, cpt1, cpt2):
+        """
+        Memoized cpt1.match(cpt2, match_type="is_a")
+        """
+        key = (cpt1.id, cpt2.id)
+        res = self._is_a.get(key, None)
+        if res is None:
+            res = bool(cpt1.match(cpt2, match_type="is_a"))
+            self._is_a[key] = res
+        return res
+
+    def node_test(self, data, test):
+        """
+        Returns True if the SemRep node data passes the SemFrame node test (concept, frame).
+        """
+        (concept, frame) = test
+        return self.is_a(data['concept'], concept) and data.get('frame', False) == frame
+
+    ###############
+    ### UPDATES ###
+    ###############
+    def reset(self):
+        """
+        Clears all the network memories.
+        """
+        self.SemRep = None
+        self.matches = []
+        for alpha in self.edge_alphas.values():
+            alpha['items'] = []
+            alpha['edges'] = set()
+            alpha['by_from'] = {}
+            alpha['by_to'] = {}
+        for join in self.joins.values():
+            join.clear()
+        for join in self.first_joins:
+            join.left_index[(None, None)] = [()]
+
+    def update(self, SemRep, nodes, edges):
+        """
+        Feeds the new SemRep nodes and edges to the network and returns the complete matches they create.
+        If SemRep is not the SemRep bound to the network, the network is reset and all the SemRep elements are fed.
+
+        Args:
+            - SemRep (DiGraph)
+            - nodes ([STR]): New SemRep nodes.
+            - edges ([(STR,STR)]): New SemRep edges.
+
+        Returns:
+            - matches ([(INT, [SemFrame node], TUPLE, [(STR, STR)])]): (cxn index, variables to SemFrame nodes, variables to SemRep nodes, SemRep edges) for each match.
+        """
+        if SemRep is not self.SemRep:
+            self.reset()
+            self.SemRep = SemRep
+            nodes = SemRep.nodes()
+            edges = SemRep.edges()
+        self.matches = []
+        for n in nodes:
+            data = SemRep.node[n]
+            for alpha in self.node_alphas.itervalues():
+                if self.node_test(data, (alpha['concept'], alpha['frame'])):
+                    for (cxn_index, node) in alpha['terminals']:
+                        self.matches.append((cxn_index, [node], (n,), []))
+        for e in edges:
+            self._add_edge(SemRep, e)
+        return self.matches
+
+    def _add_edge(self, SemRep, edge):
+        """
+        Adds edge to the alpha nodes it passes and right-activates their join nodes.
+        """
+        rel_cpt = SemRep.get_edge_data(*edge)['concept']
+        from_data = SemRep.node[edge[0]]
+        to_data = SemRep.node[edge[1]]
+        for alpha in self.edge_alphas.itervalues():
+            if not(self.is_a(rel_cpt, alpha['concept'])):
+                continue
+            if not(self.node_test(from_data, alpha['from_test']) and self.node_test(to_data, alpha['to_test'])):
+                continue
+            alpha['items'].append(edge)
+            alpha['edges'].add(edge)
+            alpha['by_from'].setdefault(edge[0], []).append(edge)
+            alpha['by_to'].setdefault(edge[1], []).append(edge)
+            for join in alpha['joins']:
+                for token in join.left_index.get(join.right_key(edge), [])[:]:
+                    new_token = join.extend(token, edge)
+                    if new_token is not None:
+                        self._activate(join, new_token)
+
+    def _activate(self, join, token):
+        """
+        Stores a new partial match in join and propagates it to the join children and terminals.
+        """
+        join.tokens.append(token)
+        for (cxn_index, var_nodes, var_edges) in join.terminals:
+            self.matches.append((cxn_index, var_nodes, token, [(token[i], token[j]) for (i, j) in var_edges]))
+        for child in join.children:
+            child.left_index.setdefault(child.left_key(token), []).append(token)
+            for edge in child.alpha_edges(token)[:]:
+                new_token = child.extend(token, edge)
+                if new_token is not None:
+                    self._activate(child, new_token)
@@ -47,6 +47,8 @@ def parameters(system_names):
     'Conceptualizer':{},
     
     'Cxn_retrieval_P':{},
+    
+    'Cxn_retrieval_C':{},
         
     'Grammatical_WM_P':{
         'dyn.tau':100.0, # Need to analyze the impact of that factor with respect to the rates of input to other WM and their own tau.
@@ -288,7 +290,7 @@ def TCG_comprehension_system(name='language_system_C',
     model.add_connection(control, 'to_grammatical_WM_C', grammaticalWM_C, 'from_control')
     
     model.set_input_ports([phonWM_C.find_port('from_input')])
-    model.set_output_ports([semanticWM.find_port('to_visual_WM')])
+    model.set_output_ports([semanticWM.find_port('to_visual_WM'), grammaticalWM_C.find_port('to_output')])
     
     
     # Parameters
@@ -615,6 +617,85 @@ def SALVIA_P_light(name='SALVIA_P_verbal_guidance',
     grammaticalLTM.initialize(my_grammar)
     
     return model
+
+##################
+### PROTOTYPES ###
+##################
+PROTOTYPES = {} # Stores the models built by model_from_prototype, keyed by factory name and arguments.
+
+def model_from_prototype(factory, **kwargs):
+    """
+    Returns a fresh copy of the model built by factory(**kwargs).
+    The model is only built the first time and stored as a prototype. All calls return clones of the prototype,
+    which share its LTM content (grammar, conceptual and perceptual knowledge) but are otherwise independent (see MODEL.clone()).
+    
+    Args:
+        - factory (FUNCTION): A model creation function (e.g. TCG_production_system, SALVIA_P)
+        - kwargs: The arguments of the factory.
+    
+    Example:
+        model = model_from_prototype(TCG_production_system, grammar_name='TCG_grammar_VB_main')
+    """
+    key = (factory.__name__, tuple(sorted(kwargs.iteritems())))
+    if key not in PROTOTYPES:
+        PROTOTYPES[key] = factory(**kwargs)
+    return PROTOTYPES[key].clone()
+
+def check_clone(model, set_input, max_time=300, seed=0):
+    """
+    Checks that a clone of model (see MODEL.clone()) behaves as model.
+    A clone is made, then both the clone and model are given an input by set_input and run for max_time steps with the same seed.
+    
+    Args:
+        - model (MODEL): A freshly built model. It is run by the check.
+        - set_input (FUNCTION): set_input(model) sets up the input of a model (called once per model since the simulations can modify the input).
+        - max_time (INT)
+        - seed (INT)
+    
+    Returns:
+        - diff (TUPLE): None if the outputs are the same, else (t, model output, clone output) at the first step t where they differ.
+    
+    Notes:
+        - Schema instance names are compared without their numerical id (the ids are global counters).
+        - An exception raised at time t is recorded as the output at t, and ends the run.
+    """
+    import random
+    import re
+    
+    def normalize(data):
+        if isinstance(data, dict):
+            return dict((normalize(k), normalize(v)) for k, v in data.iteritems())
+        if isinstance(data, (list, tuple)):
+            return [normalize(v) for v in data]
+        if isinstance(data, basestring):
+            return re.sub(r'_\d+', '', data)
+        if data is None or isinstance(data, (bool, int, long, float)):
+            return data
+        return normalize(getattr(data, 'name', type(data).__name__))
+    
+    def run(a_model):
+        set_input(a_model)
+        random.seed(seed)
+        a_model.initialize_states()
+        outputs = []
+        for t in range(max_time):
+            try:
+                a_model.update()
+            except Exception as e:
+                outputs.append('%s: %s' %(type(e).__name__, e))
+                break
+            outputs.append(normalize(a_model.get_output()))
+        return outputs
+    
+    clone = model.clone()
+    clone_outputs = run(clone)
+    model_outputs = run(model)
+    for t in range(max(len(model_outputs), len(clone_outputs))):
+        model_output = model_outputs[t] if t < len(model_outputs) else None
+        clone_output = clone_outputs[t] if t < len(clone_outputs) else None
+        if model_output != clone_output:
+            return (t, model_output, clone_output)
+    return None
     
 #def SALVIA_P_saliency(name='SALVIA_P_saliency'):
 #    """
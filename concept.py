@@ -92,7 +92,7 @@ class CONCEPTUAL_KNOWLEDGE(K_NET):
             Note however, that this would lead to a different treatment in terms of similarity based on distances.
         """
         self.neutral = CONCEPT(name=val, meaning=val, conceptual_knowledge=self)
-        self.nodes.append(self.neutral)
+        self._add_node(self.neutral)
     
     def add_ent(self, concept):
         """
@@ -8,9 +8,7 @@ The Template Classes define all the basic template elements that are used to bui
 Uses NetworkX module to represent construction SemFrame graph and SynForm graph.
 """
 from __future__ import division
-import matplotlib.pyplot as plt
 import networkx as nx
-import viewer
 
 ########################
 ### Template Classes ###
@@ -218,6 +216,7 @@ class TP_SEMFRAME(TP_ELEM):
         return (new_semframe, name_corr)
     
     def draw(self):
+        import matplotlib.pyplot as plt
         self._create_NX_graph()
         plt.figure(facecolor='white')
         plt.axis('off')
@@ -544,6 +543,7 @@ class CXN:
         Display the construction.
         Uses the display method defined in TCG_VIEWER class
         """
+        import viewer
         viewer.TCG_VIEWER.display_cxn(self)
         
 ####################################
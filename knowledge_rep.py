@@ -7,7 +7,6 @@ For now only implements semantic net.
 Uses NetworkX module to represent the semantic net.
 """
 from __future__ import division
-import matplotlib.pyplot as plt
 import networkx as nx
 
 ####################
@@ -72,11 +71,33 @@ class K_NET(object):
         - graph (networkx.DiGraph): A NetworkX implementation of the semantic net.
             Each node has an additional attribute meaning = k_ent.meaning
             Each edge has an additional attribute type = k_rel.type
+        - ent_ids ({INT:K_ENT}): Maps entity ids onto entities.
+        - ent_names ({STR:K_ENT}): Maps entity names onto entities.
+        - ent_meanings ({STR:K_ENT}): Maps entity meanings onto entities.
+        - rel_succ ({STR:{INT:[K_ENT]}}): For each relation type, maps the id of an entity onto the targets of the relations of that type it is the source of.
+        - rel_pred ({STR:{INT:[K_ENT]}}): For each relation type, maps the id of an entity onto the sources of the relations of that type it is the target of.
+        - rel_keys (set((STR, INT, INT))): (type, source id, target id) of all the relations in edges.
+    
+    Notes:
+        - The graph and the indexes are updated incrementally by add_ent and add_relation. 
+        The nodes and edges lists should therefore not be modified directly.
+        - As for the graph, only the last relation added between two entities is indexed.
     """
     def __init__(self, nodes=[], edges=[]):
-        self.nodes = nodes[:]
-        self.edges = edges[:]
+        self.nodes = []
+        self.edges = []
         self.graph = None
+        self.ent_ids = {}
+        self.ent_names = {}
+        self.ent_meanings = {}
+        self.rel_succ = {}
+        self.rel_pred = {}
+        self.rel_keys = set([])
+        self.clear()
+        for k_ent in nodes:
+            self._add_node(k_ent)
+        for k_rel in edges:
+            self._add_edge(k_rel)
     
     def clear(self):
         """
@@ -84,7 +105,13 @@ class K_NET(object):
         """
         self.nodes = []
         self.edges = []
-        self._create_NX_graph()
+        self.graph = nx.DiGraph()
+        self.ent_ids = {}
+        self.ent_names = {}
+        self.ent_meanings = {}
+        self.rel_succ = {}
+        self.rel_pred = {}
+        self.rel_keys = set([])
     
     def add_ent(self, k_ent):
         """
@@ -102,8 +129,7 @@ class K_NET(object):
             return False
         
         # Add new semantic entity
-        self.nodes.append(k_ent)
-        self._create_NX_graph()
+        self._add_node(k_ent)
         return True
         
     def add_relation(self, k_rel):
@@ -121,17 +147,17 @@ class K_NET(object):
             return False
         
         # Check duplication
-        for r in self.edges:
-            if r == k_rel:
-                return False
+        if (k_rel.type, k_rel.pFrom.id, k_rel.pTo.id) in self.rel_keys:
+            for r in self.edges:
+                if r == k_rel:
+                    return False
         
         # Check that source and target of relation are defined.
         if not(self.find_meaning(k_rel.pFrom.meaning)) or not(self.find_meaning(k_rel.pTo.meaning)):
             return False
         
         # Add new relation
-        self.edges.append(k_rel)
-        self._create_NX_graph()
+        self._add_edge(k_rel)
         return True
     
     def shortest_path(self, from_ent, to_ent, rel_types=['is_a']):
@@ -141,26 +167,32 @@ class K_NET(object):
         
         If no path exists, returns -1
         
-        Relies on NetworkX implementation of path length
+        Breadth first search over the relation type adjacency.
         
         Args:
             - from_ent (K_ENT): Origin
             - to_ent (K_ENT): Target
         """
         path_len = -1
-        graph = self.graph.copy() # Not efficient...
+        if from_ent.id == to_ent.id:
+            return 0
         
-        #Only keep the relevant edges
-        to_remove =[]
-        for u,v,d in graph.edges_iter(data=True):
-            if not(d['type'] in rel_types):
-                to_remove.append((u,v))
-        graph.remove_edges_from(to_remove)
-        
-        try:
-            path_len = nx.shortest_path_length(graph, source=from_ent.id, target=to_ent.id, weight=None)
-        except nx.NetworkXNoPath:
-            return path_len
+        adjacency = [self.rel_succ[rel_type] for rel_type in rel_types if rel_type in self.rel_succ]
+        visited = set([from_ent.id])
+        frontier = [from_ent.id]
+        dist = 0
+        while frontier:
+            dist += 1
+            next_frontier = []
+            for ent_id in frontier:
+                for succ in adjacency:
+                    for ent in succ.get(ent_id, []):
+                        if ent.id == to_ent.id:
+                            return dist
+                        if ent.id not in visited:
+                            visited.add(ent.id)
+                            next_frontier.append(ent.id)
+            frontier = next_frontier
             
         return path_len
             
@@ -171,11 +203,7 @@ class K_NET(object):
         Args:
             - meaning (): Meaning of a knowledge entity.
         """
-        for n in self.nodes:
-            if n.meaning == meaning:
-                return n
-        
-        return None
+        return self.ent_meanings.get(meaning, None)
     
     def satisfy_rel(self, ent1, rel_type, ent2):
         """
@@ -192,26 +220,25 @@ class K_NET(object):
                 else:
                     return []     
         elif ent1 and not(ent2):
-            successors = self.graph.successors(ent1.id)
+            if rel_type:
+                return [(ent1, rel_type, ent2) for ent2 in self.rel_succ.get(rel_type, {}).get(ent1.id, [])]
             res = []
-            for s in successors:
-                node_data = self.graph.node[s]
-                ent2 = self.find_meaning(node_data['meaning'])
+            for s in self.graph.successors(ent1.id):
+                ent2 = self.ent_ids[s]
                 res.extend(self.satisfy_rel(ent1, rel_type, ent2))
             return res
         elif not(ent1) and ent2:
-            predecessors = self.graph.predecessors(ent2.id)
+            if rel_type:
+                return [(ent1, rel_type, ent2) for ent1 in self.rel_pred.get(rel_type, {}).get(ent2.id, [])]
             res = []
-            for p in predecessors:
-                node_data = self.graph.node[p]
-                ent1 = self.find_meaning(node_data['meaning'])
+            for p in self.graph.predecessors(ent2.id):
+                ent1 = self.ent_ids[p]
                 res.extend(self.satisfy_rel(ent1, rel_type, ent2))
             return res
         else:
             res = []
             for ent1 in self.nodes:
-                for ent2 in self.nodes:
-                    res.extend(self.satisfy_rel(ent1, rel_type, ent2))
+                res.extend(self.satisfy_rel(ent1, rel_type, None))
             return res
     
     def similarity(self, ent1, ent2):
@@ -267,6 +294,7 @@ class K_NET(object):
     def show(self):
         """
         """
+        import matplotlib.pyplot as plt
         plt.figure()
         node_labels = dict((n, d) for n,d in self.graph.nodes(data=True))
         pos = nx.spring_layout(self.graph)        
@@ -275,14 +303,42 @@ class K_NET(object):
 
 
     def _create_NX_graph(self):
-        graph = nx.DiGraph()
-        for node in self.nodes:
-            graph.add_node(node.id, meaning=node.meaning)
-        for edge in self.edges:
-            graph.add_edge(edge.pFrom.id, edge.pTo.id, type= edge.type)
-        
-        self.graph = graph
-        
+        """
+        Rebuilds the graph and the indexes from the nodes and edges lists.
+        """
+        nodes = self.nodes
+        edges = self.edges
+        self.clear()
+        for node in nodes:
+            self._add_node(node)
+        for edge in edges:
+            self._add_edge(edge)
+    
+    def _add_node(self, k_ent):
+        """
+        Adds k_ent (K_ENT) to the nodes, the graph and the indexes. No validity check.
+        """
+        self.nodes.append(k_ent)
+        self.graph.add_node(k_ent.id, meaning=k_ent.meaning)
+        self.ent_ids[k_ent.id] = k_ent
+        self.ent_names.setdefault(k_ent.name, k_ent)
+        self.ent_meanings.setdefault(k_ent.meaning, k_ent)
+    
+    def _add_edge(self, k_rel):
+        """
+        Adds k_rel (K_REL) to the edges, the graph and the indexes. No validity check.
+        """
+        from_id = k_rel.pFrom.id
+        to_id = k_rel.pTo.id
+        if self.graph.has_edge(from_id, to_id): # The graph only keeps the last relation between two entities.
+            old_type = self.graph.get_edge_data(from_id, to_id)['type']
+            self.rel_succ[old_type][from_id] = [e for e in self.rel_succ[old_type][from_id] if e.id != to_id]
+            self.rel_pred[old_type][to_id] = [e for e in self.rel_pred[old_type][to_id] if e.id != from_id]
+        self.edges.append(k_rel)
+        self.rel_keys.add((k_rel.type, from_id, to_id))
+        self.graph.add_edge(from_id, to_id, type=k_rel.type)
+        self.rel_succ.setdefault(k_rel.type, {}).setdefault(from_id, []).append(self.ent_ids.get(to_id, k_rel.pTo))
+        self.rel_pred.setdefault(k_rel.type, {}).setdefault(to_id, []).append(self.ent_ids.get(from_id, k_rel.pFrom))
     
     def _has_entity(self, ent_name):
         """
@@ -291,8 +347,4 @@ class K_NET(object):
         Args:
             - entt_name (STR):
         """
-        for n in self.nodes:
-            if n.name == ent_name:
-                return n
-        return None
-        
\ No newline at end of file
+        return self.ent_names.get(ent_name, None)
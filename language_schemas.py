@@ -6,7 +6,7 @@ Defines language schemas for TCG.
 Dependencies:
     - Uses NetworkX for the implementation of the content of the Semantic Working Memory (SemRep graph)
     - Uses Numpy for vectorial operations.
-    - Uses pyttsx for the text to speech implementation (optional!)
+    - Uses pyttsx for the text to speech implementation (optional! imported on first use)
     - Uses re for regular expression parsing of sem inputs
     
     - Uses schema_theory
@@ -14,18 +14,17 @@ Dependencies:
     - Uses TCG_graph
 """
 from __future__ import division
-import matplotlib.pyplot as plt
 import re
 import os
 import json
 
 import networkx as nx
-import pyttsx
 
 
 from schema_theory import KNOWLEDGE_SCHEMA, SCHEMA_INST, SYSTEM_SCHEMA, LTM, WM, ASSEMBLAGE
 import construction
 import TCG_graph
+from TCG_match_net import CXN_MATCH_NET
 
 #######################################
 ##### LANGUAGE KNOWLEDGE SCHEMAS ######
@@ -69,12 +68,15 @@ class CXN_SCHEMA_INST(SCHEMA_INST):
             - alive (bool): status flag
             - trace ({"SemRep":{"nodes":[], "edges"=[]}, "schemas":[CXN_SCHEMA]}): Pointer to the elements that triggered the instantiation.
         - covers ({"nodes":{}, "edges"={}}): maps CXN.SemFrame nodes and edges (in content) to SemRep elements (in the trace) (Maps the nodes and edges names to SemRep obj)
+        - origin ({STR:STR}): maps the names of the content copy elements to the names of the elements of the construction in LTM (empty if content is not a copy).
     """
     def __init__(self, cxn_schema, trace, mapping, copy=True):
         SCHEMA_INST.__init__(self, schema=cxn_schema, trace=trace)
+        self.origin = {}
         if copy:
             (cxn_copy, c) = cxn_schema.content.copy()
             self.content = cxn_copy
+            self.origin = dict([(v, k) for k,v in c.iteritems()])
             if mapping:
                 new_node_mapping  = dict([(c[k], v) for k,v in mapping['nodes'].iteritems()])
                 new_edge_mapping  = dict([((c[k[0]], c[k[1]]), v) for k,v in mapping['edges'].iteritems()])
@@ -307,6 +309,14 @@ class PHON_SCHEMA_INST(SCHEMA_INST):
 #################
 class CONCEPTUALIZER(SYSTEM_SCHEMA):
     """
+    Data:
+        - conceptualization (CONCEPTUALIZATION)
+        - version (INT): Version of the last SceneRep delta consumed (see VISUAL_WM).
+    
+    Notes:
+        - Only the SceneRep elements listed in the deltas received are conceptualized. If a delta was missed, 
+        all the SceneRep elements still flagged as new are conceptualized.
+        - The removed percept instances are ignored: the SemRep grows monotonically.
     """
     def __init__(self, name='Conceptualizer'):
         SYSTEM_SCHEMA.__init__(self, name)
@@ -314,6 +324,13 @@ class CONCEPTUALIZER(SYSTEM_SCHEMA):
         self.add_port('IN', 'from_concept_LTM')
         self.add_port('OUT', 'to_semantic_WM')
         self.conceptualization = None
+        self.version = 0
+    
+    def reset(self):
+        """
+        """
+        super(CONCEPTUALIZER, self).reset()
+        self.version = 0
     
     def initialize(self, conceptualization):
         """
@@ -322,54 +339,84 @@ class CONCEPTUALIZER(SYSTEM_SCHEMA):
         """
         self.conceptualization = conceptualization
     
+    def shared_content(self):
+        """
+        """
+        return [self.conceptualization]
+    
+    def idle(self):
+        """
+        Idle if no SceneRep delta is received.
+        """
+        return not(self.pending_inputs(['from_visual_WM']))
+    
+    def needs_update(self):
+        """
+        Only woken when a SceneRep delta is received (the LTM content is kept by the static port).
+        """
+        return self.pending_inputs(['from_visual_WM'])
+    
     def process(self):
         """
         """
-        SceneRep = self.inputs['from_visual_WM']
+        delta = self.inputs['from_visual_WM']
         cpt_schemas = self.inputs['from_concept_LTM']
-        if cpt_schemas and SceneRep:
-            cpt_insts  = self.conceptualize(SceneRep, cpt_schemas)
+        if cpt_schemas and delta:
+            SceneRep = delta['SceneRep']
+            if delta['version'] == self.version + 1:
+                nodes = delta['nodes']
+                edges = delta['edges']
+            else: # Missed delta(s): falls back on the SceneRep flags.
+                nodes = [n for n, d in SceneRep.nodes_iter(data=True) if d['new']]
+                edges = [(u, v) for u, v, d in SceneRep.edges_iter(data=True) if d['new']]
+            self.version = delta['version']
+            
+            cpt_insts  = self.conceptualize(SceneRep, cpt_schemas, nodes, edges)
             self.outputs['to_semantic_WM'] =  cpt_insts
-        
-            # Set all SceneRep elements to new=False
-            for n in SceneRep.nodes_iter():
-                SceneRep.node[n]['new'] = False
-            for e in SceneRep.edges_iter():
-                d = SceneRep.get_edge_data(e[0], e[1])
-                d['new'] = False
     
-    def conceptualize(self, SceneRep, cpt_schemas):
+    def conceptualize(self, SceneRep, cpt_schemas, nodes=None, edges=None):
         """
         For a given SceneRep, returns the set of CPT_SCHEMA_INSTS that conceptualize the SceneRep
+        The conceptualized SceneRep elements are set to new=False.
 
         Args:
             - SceneRep ()
             - cpt_schemas ()
+            - nodes ([STR]), edges ([(STR,STR)]): The SceneRep elements to conceptualize. If None, all the elements flagged as new.
             
         Notes:
             - For now the conceptualization scheme is trivial: many-to-one mapping.
         """
         FRAMES  = ['ENTITY_SCENE', 'ACTION_SCENE', 'EVENT_SCENE']
         
+        if nodes is None:
+            nodes = [n for n, d in SceneRep.nodes_iter(data=True) if d['new']]
+        if edges is None:
+            edges = [(u, v) for u, v, d in SceneRep.edges_iter(data=True) if d['new']]
+        
+        cpt_LTM = cpt_schemas[0].LTM # Uses the concept index of the LTM the schemas belong to.
         cpt_insts  = []
-        for n,d in SceneRep.nodes(data=True): # First process the nodes.
+        for n in nodes: # First process the nodes.
+            d = SceneRep.node[n]
             if d['new']:
                 per_name = d['percept'].name
                 per_inst = d['per_inst']
                 cpt_name = self.conceptualization.conceptualize(per_name)
-                cpt_schema = [schema for schema in cpt_schemas if schema.name == cpt_name][0]
+                cpt_schema = cpt_LTM.find_cpt_schema(cpt_name)
                 cpt_inst = CPT_SCHEMA_INST(cpt_schema, trace={'per_inst':per_inst, 'cpt_schema':cpt_schema})
                 cpt_inst.frame = per_name in FRAMES
                 cpt_inst.set_activation(per_inst.activity) # THIS MIGHT NEED TO BE PARAMETRIZED!!
                 per_inst.covers['cpt_inst'] = cpt_inst
                 cpt_insts.append(cpt_inst)
+                d['new'] = False
         
-        for u,v,d in SceneRep.edges(data=True): # Then the relations.
+        for (u, v) in edges: # Then the relations.
+            d = SceneRep.get_edge_data(u, v)
             if d['new']:
                 per_name = d['percept'].name
                 per_inst = d['per_inst']
                 cpt_name = self.conceptualization.conceptualize(per_name)
-                cpt_schema = [schema for schema in cpt_schemas if schema.name == cpt_name][0]
+                cpt_schema = cpt_LTM.find_cpt_schema(cpt_name)
                 cpt_inst = CPT_SCHEMA_INST(cpt_schema, trace={'per_inst':per_inst, 'cpt_schema':cpt_schema})
                 cpt_inst.set_activation(per_inst.activity) # THIS MIGHT NEED TO BE PARAMETRIZED!!
                 pFrom = SceneRep.node[u]['per_inst'].covers['cpt_inst']
@@ -377,6 +424,7 @@ class CONCEPTUALIZER(SYSTEM_SCHEMA):
                 cpt_inst.content['pFrom'] = pFrom
                 cpt_inst.content['pTo'] = pTo
                 cpt_insts.append(cpt_inst)
+                d['new'] = False
                 
         return cpt_insts
 
@@ -389,6 +437,25 @@ class CONCEPT_LTM(LTM):
         self.add_port('OUT', 'to_semantic_WM')
         self.cpt_knowledge = None
         self.params['init_act'] = 1
+        self.concept_index = {}
+    
+    def add_schema(self, schema):
+        """
+        Adds schema to the LTM and indexes it by the name of its concept.
+        """
+        super(CONCEPT_LTM, self).add_schema(schema)
+        self.concept_index[schema.content['concept'].name] = schema
+    
+    def find_cpt_schema(self, concept_name):
+        """
+        Returns the concept schema associated with the concept named concept_name (STR), None if no such schema exists.
+        """
+        return self.concept_index.get(concept_name, None)
+    
+    def shared_content(self):
+        """
+        """
+        return super(CONCEPT_LTM, self).shared_content() + [self.cpt_knowledge, self.concept_index]
         
     def initialize(self, cpt_knowledge):
         """
@@ -447,6 +514,14 @@ class CONCEPT_LTM(LTM):
         
 class SEMANTIC_WM(WM):
     """
+    Data:
+        - SemRep (DiGraph): The semantic representation. On top of the node and edge flags 'new' and 'expressed', SemRep.graph stores:
+            - 'new' ({'nodes':set(STR), 'edges':set((STR,STR))}): The elements whose 'new' flag is True.
+            - 'unexpressed' ({'nodes':{STR:CPT_SCHEMA_INST}, 'edges':{(STR,STR):CPT_SCHEMA_INST}}): The elements whose 'expressed' flag is False.
+    
+    Notes:
+        - The 'new' and 'unexpressed' tables are maintained alongside the flags so that the per-tick queries only visit the elements that changed.
+        Any schema that resets the 'new' flags (e.g. CXN_RETRIEVAL_P) needs to clear SemRep.graph['new'] as well.
     """
     def __init__(self, name='Semantic_WM'):
         WM.__init__(self, name)
@@ -462,13 +537,29 @@ class SEMANTIC_WM(WM):
         self.add_port('OUT', 'to_output')
         self.params['dyn'] = {'tau':1000.0, 'int_weight':1.0, 'ext_weight':1.0, 'act_rest':0.001, 'k':10.0, 'noise_mean':0.0, 'noise_std':0.0}
         self.params['C2'] = {'coop_weight':0.0, 'comp_weight':0.0, 'prune_threshold':0.01, 'confidence_threshold':0.0, 'coop_asymmetry':1.0, 'comp_asymmetry':0.0, 'max_capacity':None, 'P_comp':1.0, 'P_coop':1.0} # C2 is not implemented in this WM.
-        self.SemRep = nx.DiGraph() # Uses networkx to easily handle graph structure.
+        self.SemRep = SEMANTIC_WM._create_SemRep()
     
     def reset(self):
         """
         """
         super(SEMANTIC_WM, self).reset()
-        self.SemRep = nx.DiGraph()
+        self.SemRep = SEMANTIC_WM._create_SemRep()
+    
+    @staticmethod
+    def _create_SemRep():
+        """
+        Returns an empty SemRep graph along with its new and unexpressed element tables.
+        """
+        SemRep = nx.DiGraph() # Uses networkx to easily handle graph structure.
+        SemRep.graph['new'] = {'nodes':set([]), 'edges':set([])}
+        SemRep.graph['unexpressed'] = {'nodes':{}, 'edges':{}}
+        return SemRep
+    
+    def idle(self):
+        """
+        Idle if the SemRep is empty and no semantic content is received.
+        """
+        return not(self.insts) and not(self.pending_inputs(['from_conceptualizer', 'from_grammatical_WM_C', 'from_grammatical_WM_P']))
     
     def process(self):
         """
@@ -501,11 +592,14 @@ class SEMANTIC_WM(WM):
         
         if self.inputs['from_grammatical_WM_P']:
             # Note nodes and edges as expressed
+            unexpressed = self.SemRep.graph['unexpressed']
             for name in self.inputs['from_grammatical_WM_P']['nodes']:
                 self.SemRep.node[name]['expressed'] = True
+                unexpressed['nodes'].pop(name, None)
             for name in self.inputs['from_grammatical_WM_P']['edges']:
                 d = self.SemRep.get_edge_data(name[0], name[1])
                 d['expressed'] = True
+                unexpressed['edges'].pop((name[0], name[1]), None)
     
         self.outputs['to_grammatical_WM_P'] = self.gram_WM_P_ouput()
         
@@ -530,16 +624,17 @@ class SEMANTIC_WM(WM):
             - Also, because the SemFrame is derived from the eq_inst, it is not clear how I can define the SemRep covers of cxn_instances (or, the cxn_inst cover of the SemRep).
             - This, later on, should evolve into a function that should possibly find already existing nodes and, rather than creating new instances, generate the proper bindings.
         """
+        cpt_LTM = cpt_schemas[0].LTM # Uses the concept index of the LTM the schemas belong to.
         cpt_insts = []
         name_table = {}
         for node in SemFrame.nodes:
-            cpt_schema = [schema for schema in cpt_schemas if schema.name == node.concept.name][0]
+            cpt_schema = cpt_LTM.find_cpt_schema(node.concept.name)
             cpt_inst = CPT_SCHEMA_INST(cpt_schema, trace={'cpt_schema':cpt_schema})
             cpt_insts.append(cpt_inst)
             name_table[node] = cpt_inst
         
         for edge in SemFrame.edges:
-            cpt_schema = [schema for schema in cpt_schemas if schema.name == edge.concept.name][0]
+            cpt_schema = cpt_LTM.find_cpt_schema(edge.concept.name)
             cpt_inst = CPT_SCHEMA_INST(cpt_schema, trace={'cpt_schema':cpt_schema})
             cpt_inst.content['pFrom'] = name_table[edge.pFrom]
             cpt_inst.content['pTo'] = name_table[edge.pTo]
@@ -557,11 +652,15 @@ class SEMANTIC_WM(WM):
             SemMatch between SemRep graph and SemFrames (graphs needs to have same data key).
         """
         if cpt_insts:
+            new = self.SemRep.graph['new']
+            unexpressed = self.SemRep.graph['unexpressed']
             # First process all the instances that are not relations.
             for inst in [i for i in cpt_insts if not(isinstance(i.trace['cpt_schema'], CPT_RELATION_SCHEMA))]:
                 if self.SemRep.has_node(inst.name):
                     continue
                 self.SemRep.add_node(inst.name, cpt_inst=inst, concept=inst.content['concept'], frame=inst.frame, new=True, expressed=False)
+                new['nodes'].add(inst.name)
+                unexpressed['nodes'][inst.name] = inst
             
             # Then add the relations
             for rel_inst in [i for i in cpt_insts if isinstance(i.trace['cpt_schema'], CPT_RELATION_SCHEMA)]:
@@ -570,6 +669,8 @@ class SEMANTIC_WM(WM):
                 if self.SemRep.has_edge(node_from, node_to):
                     continue
                 self.SemRep.add_edge(node_from, node_to, cpt_inst=rel_inst, concept=rel_inst.content['concept'], frame=inst.frame,  new=True, expressed=False)
+                new['edges'].add((node_from, node_to))
+                unexpressed['edges'][(node_from, node_to)] = rel_inst
             
 #            # Update concept frames
 #            self.update_cpt_frames()
@@ -589,13 +690,12 @@ class SEMANTIC_WM(WM):
         Returns the output to send to gram_WM_P.
         The signal sent to gram_WM_P contains the activation levels of the node and edge instance that so far have not been expressed.
         """
+        unexpressed = self.SemRep.graph['unexpressed']
         output = {'nodes':{}, 'edges':{}}
-        for n,d in self.SemRep.nodes(data=True):
-            if not(d['expressed']):
-                output['nodes'][n] = d['cpt_inst'].activity
-        for u,v,d in self.SemRep.edges(data=True):
-            if not(d['expressed']):
-                output['edges'][(u,v)] = d['cpt_inst'].activity
+        for n, inst in unexpressed['nodes'].iteritems():
+            output['nodes'][n] = inst.activity
+        for e, inst in unexpressed['edges'].iteritems():
+            output['edges'][e] = inst.activity
         return output
     
     def vis_WM_output(self):
@@ -619,34 +719,23 @@ class SEMANTIC_WM(WM):
         """
         Returns true if there is at least 1 new element in the SemRep. False otherwise.
         """
-        for n,d in self.SemRep.nodes(data=True):
-            if d['new']:
-                return True
-        
-        for u,v,d in self.SemRep.edges(data=True):
-            if d['new']:
-                return True
-        return False
+        new = self.SemRep.graph['new']
+        return bool(new['nodes'] or new['edges'])
     
     def has_unexpressed_sem(self):
         """
-        Returns true if there is at least 1 unexpresed node or relation in the SemRep. False otherwise.
+        Returns true if there is at least 1 unexpresed node in the SemRep. False otherwise.
         
+        Notes:
+            - Only the nodes are considered, unexpressed relations alone do not count.
         """
-        for n,d in self.SemRep.nodes(data=True):
-            if not(d['expressed']):
-                return True
-        return False
-        
-        for u,v,d in self.SemRep.edges(data=True):
-            if d['expressed']:
-                return True
-        return False
+        return bool(self.SemRep.graph['unexpressed']['nodes'])
         
     #######################
     ### DISPLAY METHODS ###
     #######################
     def show_SemRep(self):
+        import matplotlib.pyplot as plt
         node_labels = dict((n, '%s(%.1f)' %(n, d['cpt_inst'].activity)) for n,d in self.SemRep.nodes(data=True))
         edge_labels = dict(((u,v), '%s(%.1f)' %(d['concept'].meaning, d['cpt_inst'].activity)) for u,v,d in self.SemRep.edges(data=True))
         pos = nx.spring_layout(self.SemRep)  
@@ -663,6 +752,18 @@ class SEMANTIC_WM(WM):
 ###################
 class GRAMMATICAL_LTM(LTM):
     """
+    Data:
+        - grammar (GRAMMAR)
+        - class_index ({STR:[CXN_SCHEMA]}): Construction schemas indexed by construction class.
+        - node_roles ({(STR, STR):DICT}): Role (see node_role()) of each SemFrame node, indexed by (cxn name, node name).
+        - coop_table ({(STR, STR, STR, STR):INT}): Quality of match (see coop_qual()) indexed by (parent cxn name, parent node name, child cxn name, child node name),
+        for each parent SemFrame node linked to a slot and each child head node.
+        - left_corners ({STR:set}): Classes predicted by the first SynForm slot of the constructions of each class.
+        - prediction_closure ({STR:{STR:INT}}): For each construction class, the classes reachable through left_corners with their prediction depth (the class itself at depth 0).
+    
+    Notes:
+        - node_roles and coop_table hold the part of GRAMMATICAL_WM_P.comp_link() and coop_link() decisions that only depends on the construction types.
+        - prediction_closure holds the recursive predictions of CXN_RETRIEVAL_C.instantiate_cxns(), which only depend on the grammar.
     """
     def __init__(self, name='Grammatical_LTM'):
         LTM.__init__(self, name)
@@ -670,6 +771,33 @@ class GRAMMATICAL_LTM(LTM):
         self.add_port('OUT', 'to_cxn_retrieval_P')
         self.add_port('OUT', 'to_cxn_retrieval_C')
         self.params['init_act'] = 0.5 #The initial activation value for cxn schema.
+        self.class_index = {}
+        self.node_roles = {}
+        self.coop_table = {}
+        self.left_corners = {}
+        self.prediction_closure = {}
+    
+    def add_schema(self, schema):
+        """
+        Adds schema to the LTM and indexes it by the class of its construction.
+        """
+        super(GRAMMATICAL_LTM, self).add_schema(schema)
+        self.class_index.setdefault(schema.content.clss, []).append(schema)
+    
+    def find_cxn_schemas(self, cxn_classes):
+        """
+        Returns the list of construction schemas whose class is in cxn_classes ([STR]), in LTM order.
+        """
+        res = []
+        for clss in set(cxn_classes):
+            res.extend(self.class_index.get(clss, []))
+        res.sort(key=lambda schema: schema.id)
+        return res
+    
+    def shared_content(self):
+        """
+        """
+        return super(GRAMMATICAL_LTM, self).shared_content() + [self.grammar, self.class_index, self.node_roles, self.coop_table, self.left_corners, self.prediction_closure]
     
     def initialize(self, grammar):
         """
@@ -684,6 +812,99 @@ class GRAMMATICAL_LTM(LTM):
                 preference = cxn.preference
             new_cxn_schema = CXN_SCHEMA(cxn, self.params['init_act']*preference)
             self.add_schema(new_cxn_schema)
+        self.build_match_tables()
+        self.build_prediction_closure()
+    
+    def build_match_tables(self):
+        """
+        Precomputes node_roles and coop_table for the constructions of the grammar.
+        """
+        self.node_roles.clear()
+        self.coop_table.clear()
+        slots = []
+        heads = []
+        for cxn in self.grammar.constructions:
+            for node in cxn.SemFrame.nodes:
+                role = GRAMMATICAL_LTM.node_role(cxn, node)
+                self.node_roles[(cxn.name, node.name)] = role
+                if role['slot'] is not None:
+                    slots.append((cxn, node))
+                if role['head']:
+                    heads.append((cxn, node))
+        
+        sem_match = {} # Concept matches shared by all the (parent, child) pairs.
+        for (cxn_p, node_p) in slots:
+            slot_p = cxn_p.node2form(node_p)
+            for (cxn_c, node_c) in heads:
+                key = (node_c.concept.id, node_p.concept.id)
+                if key not in sem_match:
+                    sem_match[key] = node_c.concept.match(node_p.concept)
+                match_qual = 1 if (cxn_c.class_match(slot_p) and sem_match[key]) else 0
+                self.coop_table[(cxn_p.name, node_p.name, cxn_c.name, node_c.name)] = match_qual
+    
+    def build_prediction_closure(self):
+        """
+        Precomputes left_corners and the prediction_closure of every construction class (and of every class required by a slot).
+        """
+        self.left_corners.clear()
+        self.prediction_closure.clear()
+        classes = set([])
+        for cxn in self.grammar.constructions:
+            preds = self.left_corners.setdefault(cxn.clss, set([]))
+            classes.add(cxn.clss)
+            for form in cxn.SynForm.form:
+                if isinstance(form, construction.TP_SLOT):
+                    classes.update(form.cxn_classes)
+            first = cxn.SynForm.form[0] if cxn.SynForm.form else None
+            if isinstance(first, construction.TP_SLOT):
+                preds.update(first.cxn_classes)
+        for clss in classes:
+            self.predicted_classes(clss)
+    
+    def predicted_classes(self, clss):
+        """
+        Returns the prediction closure of the class clss (STR) as a dict {class:depth}, computing it on a miss.
+        """
+        closure = self.prediction_closure.get(clss, None)
+        if closure is None:
+            closure = {clss:0}
+            level = [clss]
+            depth = 0
+            while level:
+                depth += 1
+                next_level = []
+                for c in level:
+                    for pred in self.left_corners.get(c, []):
+                        if pred not in closure:
+                            closure[pred] = depth
+                            next_level.append(pred)
+                level = next_level
+            self.prediction_closure[clss] = closure
+        return closure
+    
+    @staticmethod
+    def node_role(cxn, node):
+        """
+        Returns the role of the SemFrame node (TP_NODE) in the construction cxn (CXN) as a dict:
+            - 'formalizes' (BOOL): cxn formalizes the node entity (the node is not linked to the SynForm or is linked to a TP_PHON).
+            - 'slot' (INT): order of the TP_SLOT the node is linked to (None if the node is not linked to a slot).
+            - 'head' (BOOL): the node is a head node.
+        """
+        form = cxn.node2form(node) if (node.name in cxn.SymLinks.SL) else None
+        formalizes = (form is None) or isinstance(form, construction.TP_PHON)
+        slot = form.order if isinstance(form, construction.TP_SLOT) else None
+        return {'formalizes':formalizes, 'slot':slot, 'head':bool(node.head)}
+    
+    @staticmethod
+    def coop_qual(cxn_p, node_p, cxn_c, node_c):
+        """
+        Returns the quality of match (1 or 0) of the child construction cxn_c, through its head node node_c, with the slot linked to node_p in the parent construction cxn_p.
+        Requires both a syntactic (class) match and a semantic (concept) match.
+        """
+        slot_p = cxn_p.node2form(node_p)
+        syn2 = cxn_c.class_match(slot_p) # Syntactic match
+        sem2 = node_c.concept.match(node_p.concept) # Semantic match (Light semantics)
+        return 1 if (syn2 and sem2) else 0
 
     def process(self):
         """
@@ -709,6 +930,10 @@ class GRAMMATICAL_WM_P(WM):
     TO DO!!
     
         - I AM NOT USING CXN GROUPS!...
+    
+    Notes:
+        - Each production posts to 'to_output' a list of production records (see production_record()).
+        If params['record']['debug'] is True, the records also keep the assemblage, eq_inst, a2i_map and insts_used objects.
     """
     def __init__(self, name='Grammatical_WM_P'):
         WM.__init__(self, name)
@@ -722,12 +947,20 @@ class GRAMMATICAL_WM_P(WM):
         self.params['dyn'] = {'tau':30.0, 'int_weight':1.0, 'ext_weight':1.0, 'act_rest':0.001, 'k':10.0, 'noise_mean':0.0, 'noise_std':0.3}
         self.params['C2'] = {'coop_weight':1.0, 'comp_weight':-4.0, 'coop_asymmetry':1.0, 'comp_asymmetry':0.0, 'max_capacity':None, 'P_comp':1.0, 'P_coop':1.0, 'deact_weight':0.0, 'prune_threshold':0.3, 'confidence_threshold':0.8, 'sub_threshold_r':0.8, 'refractory_period':10}
         self.params['style'] = {'activation':1.0, 'sem_length':0, 'form_length':0, 'continuity':0} # Default value, updated by control. 
+        self.params['record'] = {'debug':False} # If True, production records also keep the live objects.
         self.refractory_period = 10
         self.time_to_next_prod = 0
     #####################
     ### STATE UPDATE  ###
     #####################   
     
+    def idle(self):
+        """
+        Idle if the WM is empty, no cxn instance is received and control does not ask for production.
+        """
+        ctrl_input = self.find_port('from_control').value
+        return not(self.insts) and not(self.pending_inputs(['from_cxn_retrieval_P'])) and not(ctrl_input and ctrl_input['produce'])
+    
     def process(self):
         """
         """
@@ -922,6 +1155,25 @@ class GRAMMATICAL_WM_P(WM):
         return overlap
     
     
+    @staticmethod
+    def node_role(inst, SR_node):
+        """
+        Returns (node_name, role) where node_name is the name, in the construction stored in LTM, of the SemFrame node of inst that covers the SemRep node SR_node,
+        and role is its role as defined by GRAMMATICAL_LTM.node_role().
+        The role is read from the LTM node_roles table and only computed if it is missing.
+        
+        Args:
+            - inst (CXN_SCHEMA_INST): A cxn instance
+            - SR_node (): SemRep node covered by inst
+        """
+        sf_name = [k for k,v in inst.covers["nodes"].iteritems() if v == SR_node][0] # Find SemFrame node that covers the SemRep node
+        node_name = inst.origin.get(sf_name, sf_name)
+        grammatical_LTM = inst.trace['schemas'][0].LTM
+        role = grammatical_LTM.node_roles.get((inst.content.name, node_name), None) if grammatical_LTM else None
+        if role is None:
+            role = GRAMMATICAL_LTM.node_role(inst.content, inst.content.find_elem(sf_name))
+        return (node_name, role)
+    
     @staticmethod
     def comp_link(inst_1, inst_2, SR_node):
         """
@@ -935,18 +1187,9 @@ class GRAMMATICAL_WM_P(WM):
         Notes:
             The case of an overlap on an edge is handled directly by the match function.
         """
-        competition = False
-        cxn_1 = inst_1.content
-        sf_1 = [cxn_1.find_elem(k) for k,v in inst_1.covers["nodes"].iteritems() if v == SR_node][0] # Find SemFrame node that covers the SemRep node
-        cxn_2 = inst_2.content
-        sf_2 = [cxn_2.find_elem(k) for k,v in inst_2.covers["nodes"].iteritems() if v==SR_node][0] # Find SemFrame node that covers the SemRep node
-        
-        cond1 = (sf_1.name not in cxn_1.SymLinks.SL) or isinstance(cxn_1.node2form(sf_1), construction.TP_PHON) # cxn_1 formalizes the node entity
-        cond2 = (sf_2.name not in cxn_2.SymLinks.SL) or isinstance(cxn_2.node2form(sf_2), construction.TP_PHON) # cxn_2 formalizes the node entity
-        
-        if cond1 and cond2:
-            competition = True
-        return competition
+        (name_1, role_1) = GRAMMATICAL_WM_P.node_role(inst_1, SR_node)
+        (name_2, role_2) = GRAMMATICAL_WM_P.node_role(inst_2, SR_node)
+        return role_1['formalizes'] and role_2['formalizes'] # Both cxns formalize the node entity
         
     @staticmethod    
     def coop_link(inst_p, inst_c, SR_node):
@@ -960,28 +1203,21 @@ class GRAMMATICAL_WM_P(WM):
         
         Notes:
             - For now match_qual is actualy categorical!
-        """
-        cxn_p = inst_p.content
-        sf_p = [cxn_p.find_elem(k) for k,v in inst_p.covers["nodes"].iteritems() if v == SR_node][0] # Find SemFrame node that covers the SemRep node
-        cxn_c = inst_c.content
-        sf_c = [cxn_c.find_elem(k) for k,v in inst_c.covers["nodes"].iteritems() if v==SR_node][0] # Find SemFrame node that covers the SemRep node
-             
-        
-        # Type constraints (Obligatory)
-        syn1 = (sf_p.name in cxn_p.SymLinks.SL) and isinstance(cxn_p.node2form(sf_p), construction.TP_SLOT) # sf_p is linked to a slot in cxn_p
-        sem1 = sf_c.head # sf_c is a head node
-        
-        # Metric constraints (Qualitative)
-        if syn1 and sem1:
-            slot_p = cxn_p.node2form(sf_p)
-            syn2 = cxn_c.class_match(slot_p) # Syntactic match
-            sem2 = sf_c.concept.match(sf_p.concept) # Semantic match (Light semantics)
-            link = {"inst_from": inst_c, "port_from":inst_c.find_port("output"), "inst_to": inst_p, "port_to":inst_p.find_port(slot_p.order)}
-            # For now syn2 and sem2 are treated as categorical, but should be anlalogical.
-            if syn2 and sem2:
-                match_qual = 1
-            else:
-                match_qual = 0
+            - The quality of match only depends on the construction types and is read from the LTM coop_table.
+        """
+        (name_p, role_p) = GRAMMATICAL_WM_P.node_role(inst_p, SR_node)
+        (name_c, role_c) = GRAMMATICAL_WM_P.node_role(inst_c, SR_node)
+        
+        # Type constraints (Obligatory): the parent node is linked to a slot and the child node is a head node.
+        if role_p['slot'] is not None and role_c['head']:
+            grammatical_LTM = inst_p.trace['schemas'][0].LTM
+            key = (inst_p.content.name, name_p, inst_c.content.name, name_c)
+            match_qual = grammatical_LTM.coop_table.get(key, None) if grammatical_LTM else None
+            if match_qual is None:
+                sf_p = [inst_p.content.find_elem(k) for k,v in inst_p.covers["nodes"].iteritems() if v == SR_node][0]
+                sf_c = [inst_c.content.find_elem(k) for k,v in inst_c.covers["nodes"].iteritems() if v == SR_node][0]
+                match_qual = GRAMMATICAL_LTM.coop_qual(inst_p.content, sf_p, inst_c.content, sf_c)
+            link = {"inst_from": inst_c, "port_from":inst_c.find_port("output"), "inst_to": inst_p, "port_to":inst_p.find_port(role_p['slot'])}
             return (match_qual, link)
         return None
     
@@ -1092,7 +1328,10 @@ class GRAMMATICAL_WM_P(WM):
                 
                 # Save winner assemblage to state
                 partial_readout = False if missing_info == None else True
-                data.append({'t':self.t, 'assemblage':winner_assemblage.copy(), 'phon_form':phon_form[:], 'eq_inst':eq_inst.content.copy()[0], 'a2i_map':a2i_map.copy(), 'expressed':expressed.copy(), 'partial_readout':partial_readout, 'insts_used':insts_used})
+                record = GRAMMATICAL_WM_P.production_record(self.t, winner_assemblage, phon_form, expressed, eq_inst, insts_used, partial_readout)
+                if self.params['record']['debug']:
+                    record.update({'assemblage':winner_assemblage.copy(), 'eq_inst':eq_inst.content.copy()[0], 'a2i_map':a2i_map.copy(), 'insts_used':insts_used})
+                data.append(record)
                 
                 # Option1: Replace the assemblage by it's equivalent instance
 #                self.replace_assemblage(winner_assemblage)
@@ -1127,6 +1366,34 @@ class GRAMMATICAL_WM_P(WM):
         
         return None
 
+    @staticmethod
+    def production_record(t, assemblage, phon_form, expressed, eq_inst, insts_used, partial_readout):
+        """
+        Returns a compact, serializable record of a production.
+        
+        Args:
+            - t (FLOAT): Production time.
+            - assemblage (ASSEMBLAGE): The winner assemblage.
+            - phon_form ([STR]): The phonological form produced.
+            - expressed (DICT): The SemRep nodes and edges expressed.
+            - eq_inst (CXN_SCHEMA_INST): The equivalent instance of the assemblage.
+            - insts_used ([CXN_SCHEMA_INST]): The instances that have been used in the read-out.
+            - partial_readout (BOOL): True if the read-out is partial.
+        
+        Returns:
+            - record (DICT): {'t':FLOAT, 'phon_form':[STR], 'partial_readout':BOOL, 'activation':FLOAT,
+            'cxns':[STR], 'tree':{'nodes':[STR], 'edges':[(STR, STR)]}, 'covers':{'nodes':[STR], 'edges':[(STR, STR)]},
+            'expressed':{'nodes':[STR], 'edges':[(STR, STR)]}} where cxns are the names of the constructions used, tree holds the names of the instances
+            used and the coop links of the assemblage, and covers holds the SemRep elements covered by the assemblage.
+        """
+        used = [inst for inst in assemblage.schema_insts if inst in insts_used]
+        record = {'t':t, 'phon_form':phon_form[:], 'partial_readout':partial_readout, 'activation':assemblage.activation}
+        record['cxns'] = [inst.content.name for inst in used]
+        record['tree'] = {'nodes':[inst.name for inst in used], 'edges':[(link.inst_from.name, link.inst_to.name) for link in assemblage.coop_links]}
+        record['covers'] = {'nodes':sorted(set(eq_inst.covers['nodes'].values())), 'edges':sorted(set(eq_inst.covers['edges'].values()))}
+        record['expressed'] = {'nodes':expressed['nodes'][:], 'edges':expressed['edges'][:]}
+        return record
+    
     def get_winner_assemblage(self, assemblages, sem_input, phon_input):
         """
         Returns the winner assemblage and its equivalent instances.
@@ -1726,6 +1993,7 @@ class GRAMMATICAL_WM_P(WM):
             - graph (NetworkX digraph): Generated by build_instance_network()
             - title (STR): Title of the figure.
         """
+        import matplotlib.pyplot as plt
         plt.figure(facecolor='white')
         plt.axis('off')
         plt.title(title)
@@ -1752,19 +2020,38 @@ class GRAMMATICAL_WM_P(WM):
 
 class CXN_RETRIEVAL_P(SYSTEM_SCHEMA):
     """
+    Data:
+        - cxn_instances ([{"cxn_inst":CXN_SCHEMA_INST, "match_qual":FLOAT}]): The construction instances retrieved at the current time step.
+        - match_net (CXN_MATCH_NET): Shared match network, used if params['match_net'] is True (see instantiate_cxns_net()).
     """
     def __init__(self, name="Cxn_retrieval_P"):
         SYSTEM_SCHEMA.__init__(self,name)
         self.add_port('IN', 'from_grammatical_LTM')
         self.add_port('IN', 'from_semantic_WM')
         self.add_port('OUT', 'to_grammatical_WM_P')
+        self.params['match_net'] = False
         self.cxn_instances = []
+        self.match_net = None
     
     def reset(self):
         """
         """
         super(CXN_RETRIEVAL_P, self).reset()
         self.cxn_instances = []
+        if self.match_net:
+            self.match_net.reset()
+    
+    def idle(self):
+        """
+        Idle if no SemRep with new elements is received.
+        """
+        return not(self.pending_inputs(['from_semantic_WM']))
+    
+    def needs_update(self):
+        """
+        Only woken when its input changes (the LTM content is kept by the static port).
+        """
+        return self.pending_inputs(['from_semantic_WM'])
     
     def process(self):
         """
@@ -1772,14 +2059,20 @@ class CXN_RETRIEVAL_P(SYSTEM_SCHEMA):
         SemRep = self.inputs['from_semantic_WM']
         cxn_schemas = self.inputs['from_grammatical_LTM']
         if cxn_schemas and SemRep:
-            self.instantiate_cxns(SemRep, cxn_schemas)
+            if self.params['match_net']:
+                self.instantiate_cxns_net(SemRep, cxn_schemas)
+            else:
+                self.instantiate_cxns(SemRep, cxn_schemas)
             self.outputs['to_grammatical_WM_P'] = self.cxn_instances
             # Set all SemRep elements to new=False
-            for n in SemRep.nodes_iter():
+            new = SemRep.graph['new']
+            for n in new['nodes']:
                 SemRep.node[n]['new'] = False
-            for e in SemRep.edges_iter():
+            for e in new['edges']:
                 d = SemRep.get_edge_data(e[0], e[1])
                 d['new'] = False
+            new['nodes'].clear()
+            new['edges'].clear()
         self.cxn_instances = []
     
     def instantiate_cxns(self, SemRep, cxn_schemas, WK=None):
@@ -1804,15 +2097,64 @@ class CXN_RETRIEVAL_P(SYSTEM_SCHEMA):
         SemRep_subgraphs = TCG_graph.build_subgraphs(SemRep, induced='vertex', subgraph_filter=subgraph_filter)
         
         for cxn_schema in cxn_schemas:
-            sub_iso = self.SemMatch_cat(SemRep_subgraphs, cxn_schema)
-            for a_sub_iso in sub_iso:
-                match_qual = self.SemMatch_qual(SemRep, cxn_schema, a_sub_iso)
-                trace = {"semrep":{"nodes":a_sub_iso["nodes"].values(), "edges":a_sub_iso["edges"].values()}, "schemas":[cxn_schema]}
-                node_mapping  = dict([(k.name, v) for k,v in a_sub_iso['nodes'].iteritems()])
-                edge_mapping  = dict([((k[0].name, k[1].name), v) for k,v in a_sub_iso['edges'].iteritems()])
-                mapping = {'nodes':node_mapping, 'edges':edge_mapping}                
-                new_instance = CXN_SCHEMA_INST(cxn_schema, trace, mapping)
-                self.cxn_instances.append({"cxn_inst":new_instance, "match_qual":match_qual})
+            self.add_cxn_instances(SemRep, cxn_schema, SemRep_subgraphs)
+    
+    def instantiate_cxns_net(self, SemRep, cxn_schemas):
+        """
+        Same as instantiate_cxns() but the SemRep subgraphs that can match each construction are provided by the shared match network (CXN_MATCH_NET)
+        which is fed only the new SemRep elements.
+        The candidate subgraphs are then processed in the same order and with the same isomorphism search as in instantiate_cxns(), so both methods
+        create the same instances.
+        """
+        if not cxn_schemas:
+            return
+        if not(self.match_net) or [s.id for s in self.match_net.cxn_schemas] != [s.id for s in cxn_schemas]:
+            self.match_net = CXN_MATCH_NET(cxn_schemas)
+        
+        new = SemRep.graph['new']
+        matches = self.match_net.update(SemRep, list(new['nodes']), list(new['edges']))
+        if not matches:
+            return
+        
+        # Only keeps the subgraphs with at least one node or edge tagged as new, ranked as in TCG_graph.build_subgraphs()
+        edge_rank = dict([(e, i) for i, e in enumerate(SemRep.edges())])
+        node_rank = dict([(n, i) for i, n in enumerate(SemRep.nodes())])
+        candidates = {}
+        for (cxn_index, var_nodes, token, sem_edges) in matches:
+            if not(any(SemRep.node[n]['new'] for n in token) or any(SemRep.get_edge_data(*e)['new'] for e in sem_edges)):
+                continue
+            if sem_edges:
+                rank = (0, sum([1 << edge_rank[e] for e in sem_edges]))
+            else:
+                rank = (1, node_rank[token[0]])
+            candidates.setdefault(cxn_index, {})[rank] = sem_edges if sem_edges else token[0]
+        
+        for cxn_index in sorted(candidates):
+            SemRep_subgraphs = []
+            for rank in sorted(candidates[cxn_index]):
+                if rank[0] == 0:
+                    v_list = sorted(candidates[cxn_index][rank], key=lambda e: edge_rank[e])
+                    SemRep_subgraphs.append(TCG_graph.vertex_subgraph(SemRep, [(u, v, SemRep.get_edge_data(u, v)) for (u, v) in v_list]))
+                else:
+                    n = candidates[cxn_index][rank]
+                    subG = nx.DiGraph()
+                    subG.add_node(n, SemRep.node[n])
+                    SemRep_subgraphs.append(subG)
+            self.add_cxn_instances(SemRep, cxn_schemas[cxn_index], SemRep_subgraphs)
+    
+    def add_cxn_instances(self, SemRep, cxn_schema, SemRep_subgraphs):
+        """
+        Instantiates cxn_schema for each of its categorical matches with the SemRep_subgraphs.
+        """
+        sub_iso = self.SemMatch_cat(SemRep_subgraphs, cxn_schema)
+        for a_sub_iso in sub_iso:
+            match_qual = self.SemMatch_qual(SemRep, cxn_schema, a_sub_iso)
+            trace = {"semrep":{"nodes":a_sub_iso["nodes"].values(), "edges":a_sub_iso["edges"].values()}, "schemas":[cxn_schema]}
+            node_mapping  = dict([(k.name, v) for k,v in a_sub_iso['nodes'].iteritems()])
+            edge_mapping  = dict([((k[0].name, k[1].name), v) for k,v in a_sub_iso['edges'].iteritems()])
+            mapping = {'nodes':node_mapping, 'edges':edge_mapping}                
+            new_instance = CXN_SCHEMA_INST(cxn_schema, trace, mapping)
+            self.cxn_instances.append({"cxn_inst":new_instance, "match_qual":match_qual})
                     
     def SemMatch_cat(self, SemRep_subgraphs, cxn_schema):
         """
@@ -1884,6 +2226,12 @@ class PHON_WM_P(WM):
         super(PHON_WM_P, self).reset()
         self.phon_sequence = []
         
+    def idle(self):
+        """
+        Idle if the WM is empty, no phonetic input is received and a filler is already due.
+        """
+        return not(self.insts) and self.find_port('from_grammatical_WM_P').value is None and self.needs_filler
+    
     def process(self):
         """
         """
@@ -1950,6 +2298,12 @@ class UTTER(SYSTEM_SCHEMA):
         super(UTTER, self).reset()
         self.utterance_stack = []
         
+    def idle(self):
+        """
+        Idle if there is nothing left to utter and no new utterance is received.
+        """
+        return not(self.utterance_stack) and not(self.pending_inputs())
+    
     def process(self):
         """
         """
@@ -1991,6 +2345,12 @@ class PHON_WM_C(WM):
         self.phon_sequence = []
 
     
+    def idle(self):
+        """
+        Idle if the WM is empty and no word form is received.
+        """
+        return not(self.insts) and not(self.pending_inputs(['from_input']))
+    
     def process(self):
         """
         """
@@ -2011,7 +2371,18 @@ class PHON_WM_C(WM):
 
 class GRAMMATICAL_WM_C(WM):
     """
-    
+    Data:
+        - chart (DICT): Earley chart indexing the instances by what they expect next.
+            {'phon':{STR:[CXN_SCHEMA_INST_C]}, 'slot':{(INT, STR):[CXN_SCHEMA_INST_C]}}
+            - 'phon': instances whose form_state is a TP_PHON, indexed by expected word form.
+            - 'slot': instances whose form_state is a TP_SLOT, indexed by (chart position (covers[1]), expected cxn class).
+        - chart_items ({STR:(STR, [KEY])}): The chart entries (kind, keys) of each instance, by instance name.
+        - chart_order ({STR:INT}): Order in which the instances were added to the WM, by instance name.
+        - chart_count (INT): Number of instances added to the WM since the last reset (the next chart_order value, never reused after a removal).
+    
+    Notes:
+        - The chart is maintained by add_instance(), remove_instance() and chart_update(), which must be called each time an instance form_state or covers changes.
+        - scanner() and completer() only visit the chart entries relevant to the input word or to the completed instances, in WM order.
     """
     def __init__(self, name='Grammatical_WM_C'):
         WM.__init__(self, name)
@@ -2020,12 +2391,106 @@ class GRAMMATICAL_WM_C(WM):
         self.add_port('IN', 'from_cxn_retrieval_C')
         self.add_port('OUT', 'to_cxn_retrieval_C')
         self.add_port('OUT', 'to_semantic_WM')
+        self.add_port('OUT', 'to_output')
         self.params['dyn'] = {'tau':30.0, 'int_weight':1.0, 'ext_weight':1.0, 'act_rest':0.001, 'k':10.0, 'noise_mean':0.0, 'noise_std':0.3}
         self.params['C2'] = {'coop_weight':1.0, 'comp_weight':-4.0, 'coop_asymmetry':0, 'comp_asymmetry':0,'P_comp':1.0, 'P_coop':1.0,  'deact_weight':0.0, 'prune_threshold':0.3, 'confidence_threshold':0.8, 'sub_threshold_r':0.8}  
         self.params['pred'] = {'pred_init':['S']}  # S is used to initialize the set of predictions. This is not not really in line with usage based... but for now I'll keep it this way.
         self.state = -1
         self.pred_init = None
-        
+        self.chart = {'phon':{}, 'slot':{}}
+        self.chart_items = {}
+        self.chart_order = {}
+        self.chart_count = 0
+    
+    def reset(self):
+        """
+        """
+        super(GRAMMATICAL_WM_C, self).reset()
+        self.state = -1
+        self.pred_init = None
+        self.chart = {'phon':{}, 'slot':{}}
+        self.chart_items = {}
+        self.chart_order = {}
+        self.chart_count = 0
+    
+    #############
+    ### CHART ###
+    #############
+    def add_instance(self, schema_inst, act0=None):
+        """
+        Adds schema_inst to the WM and to the chart.
+        """
+        added = super(GRAMMATICAL_WM_C, self).add_instance(schema_inst, act0)
+        if added:
+            self.chart_order[schema_inst.name] = self.chart_count
+            self.chart_count += 1
+            self.chart_index(schema_inst)
+        return added
+    
+    def remove_instance(self, schema_inst):
+        """
+        Removes schema_inst from the WM and from the chart.
+        """
+        super(GRAMMATICAL_WM_C, self).remove_instance(schema_inst)
+        self.chart_unindex(schema_inst)
+        del self.chart_order[schema_inst.name]
+    
+    def chart_index(self, inst):
+        """
+        Adds the chart entries of inst given its current form_state and covers.
+        """
+        form_state = inst.form_state
+        if isinstance(form_state, construction.TP_PHON):
+            kind = 'phon'
+            keys = [form_state.cxn_phonetics]
+        elif isinstance(form_state, construction.TP_SLOT):
+            kind = 'slot'
+            keys = [(inst.covers[1], clss) for clss in set(form_state.cxn_classes)]
+        else:
+            return
+        for key in keys:
+            self.chart[kind].setdefault(key, []).append(inst)
+        self.chart_items[inst.name] = (kind, keys)
+    
+    def chart_unindex(self, inst):
+        """
+        Removes the chart entries of inst.
+        """
+        item = self.chart_items.pop(inst.name, None)
+        if item:
+            (kind, keys) = item
+            for key in keys:
+                entries = self.chart[kind][key]
+                entries.remove(inst)
+                if not(entries):
+                    del self.chart[kind][key]
+    
+    def chart_update(self, inst):
+        """
+        Updates the chart entries of inst after a change of its form_state or covers.
+        """
+        self.chart_unindex(inst)
+        self.chart_index(inst)
+    
+    def chart_sort(self, insts):
+        """
+        Returns the instances insts sorted in WM order.
+        """
+        return sorted(insts, key=lambda inst: self.chart_order[inst.name])
+    
+    ###############
+    ### PROCESS ###
+    ###############
+    def idle(self):
+        """
+        Idle if the WM is empty, no instance or word form is received and there is no prediction or listening state change to process.
+        """
+        listen = self.find_port('from_control').value
+        if self.insts or self.pending_inputs(['from_cxn_retrieval_C', 'from_phonological_WM_C']):
+            return False
+        if listen and self.state == -1:
+            return False
+        return not(self.state == 0 and self.pred_init)
     
     def process(self):
         """
@@ -2089,19 +2554,20 @@ class GRAMMATICAL_WM_C(WM):
             - Covers, to fit with production, should be a mapping between SynForm and PhonRep, while Trace is the part that only keeps track of the element that triggered the instantiation.
             - A key step is to reset the activation of the instance that is confirmed by an input to that of the Phon instance. Right now it is just set to the value of the phone instance. 
             But it should be clamped to it or receive a constant input from it.
+            - Only the instances indexed under a word form in the chart are visited.
         """
-        matching_insts = []
-        for inst in self.schema_insts:
-            phon_prediction = inst.phon_prediction()
-            if phon_prediction:
-                if phon_prediction == phon_inst.content['word_form']:
-                    inst.phon_cover.append(phon_inst)
-                    inst.next_state()
-                    inst.set_activation(phon_inst.activity) #IMPORTANT STEP.
-                    inst.covers[1] = self.state
-                    matching_insts.append(inst)
-                else:
+        word_form = phon_inst.content['word_form']
+        matching_insts = self.chart_sort(self.chart['phon'].get(word_form, []))
+        for (form, insts) in self.chart['phon'].items():
+            if form != word_form:
+                for inst in insts:
                     inst.alive = False # Here a cxn whose form is directly disproved by the input is directly removed. Need to revisit this deisgn choice.
+        for inst in matching_insts:
+            inst.phon_cover.append(phon_inst)
+            inst.next_state()
+            inst.set_activation(phon_inst.activity) #IMPORTANT STEP.
+            inst.covers[1] = self.state
+            self.chart_update(inst)
         self.compete(matching_insts)
     
     def completer(self):
@@ -2112,20 +2578,24 @@ class GRAMMATICAL_WM_C(WM):
             - I HAVE ADDED COMPETITION HERE... BUT I AM NOT SURE THAT THIS IS THE WAY TO GO.
                 This has to be wrong in some way because their could be loops in the tree (think of an example), and in addition
                 one wants to be able to maintain multiple possible predictions alive in terms of incomplete instances.
+            - The completed instances form an agenda. Each one is only matched with the instances that expect its class at its start position in the chart.
+            The instances it completes are added to the next agenda.
         """
-        completed_insts = [inst for inst in self.schema_insts if not(inst.form_state)]
-        while completed_insts:
-            incomplete_insts = [inst for inst in self.schema_insts if inst.form_state]
-            for inst1 in completed_insts:
+        agenda = [inst for inst in self.schema_insts if not(inst.form_state)]
+        while agenda:
+            new_completed = []
+            for inst1 in agenda:
                 competing_insts = []
-                for inst2 in incomplete_insts:
+                for inst2 in self.chart_sort(self.chart['slot'].get((inst1.covers[0], inst1.content.clss), [])):
                     coop = self.cooperate(inst2, inst1)   
                     if coop:
                         competing_insts.append(inst2)
+                        if not(inst2.form_state):
+                            new_completed.append(inst2)
                 # Sets up competition between incompleted cxn that try to map onto the same compeleted cxn.
                 self.compete(competing_insts)
                
-            completed_insts = [inst for inst in incomplete_insts if not(inst.form_state)]
+            agenda = self.chart_sort(set(new_completed))
     
     def produce_meaning(self):
         """
@@ -2136,6 +2606,7 @@ class GRAMMATICAL_WM_C(WM):
             if winner_assemblage.activation > self.params['C2']['confidence_threshold']:
                 sem_frame =  GRAMMATICAL_WM_C.meaning_read_out(winner_assemblage)
                 self.outputs['to_semantic_WM'] =  sem_frame
+                self.outputs['to_output'] = sem_frame
                 
                 #Option5: Sets all the instances in the winner assembalge to subthreshold activation. Sets all the coop_weightsto 0. So f-link remains but inst participating in assemblage decay unless they are reused.
                 self.post_prod_state(winner_assemblage)
@@ -2217,6 +2688,7 @@ class GRAMMATICAL_WM_C(WM):
                    self.add_coop_link(inst_from=link["inst_from"], port_from=link["port_from"], inst_to=link["inst_to"], port_to=link["port_to"], qual=match_qual)
                    inst1.next_state()
                    inst1.covers[1] = self.state
+                   self.chart_update(inst1)
                    return True
        return False
     
@@ -2518,6 +2990,11 @@ class GRAMMATICAL_WM_C(WM):
 class CXN_RETRIEVAL_C(SYSTEM_SCHEMA):
     """
     THIS NEEDS TO ALLOW FOR THE IMPLEMENTATIN OF A FORM OF CHART PARSING.
+    
+    Data:
+        - cxn_instances ([CXN_SCHEMA_INST_C]): Instances posted at the next process().
+        - position (INT): Chart position of the last predictions.
+        - predicted ({INT:CXN_SCHEMA_INST_C}): Instances already predicted at position, indexed by cxn schema id.
     """
     def __init__(self, name="Cxn_retrieval_C"):
         SYSTEM_SCHEMA.__init__(self,name)
@@ -2526,6 +3003,28 @@ class CXN_RETRIEVAL_C(SYSTEM_SCHEMA):
         self.add_port('IN', 'from_grammatical_WM_C')
         self.add_port('OUT', 'to_grammatical_WM_C')
         self.cxn_instances = []
+        self.position = None
+        self.predicted = {}
+    
+    def reset(self):
+        """
+        """
+        super(CXN_RETRIEVAL_C, self).reset()
+        self.cxn_instances = []
+        self.position = None
+        self.predicted = {}
+    
+    def idle(self):
+        """
+        Idle if no prediction is received.
+        """
+        return not(self.pending_inputs(['from_grammatical_WM_C']))
+    
+    def needs_update(self):
+        """
+        Only woken when its input changes (the LTM content is kept by the static port).
+        """
+        return self.pending_inputs(['from_grammatical_WM_C'])
     
     def process(self):
         """
@@ -2539,24 +3038,36 @@ class CXN_RETRIEVAL_C(SYSTEM_SCHEMA):
                     
     def instantiate_cxns(self, predictions, cxn_schemas):
         """
+        Instantiates the constructions reachable from the predicted classes through the LTM prediction closure.
+        The constructions are instantiated by increasing prediction depth (in LTM order for a given depth), as the recursive predictions would.
+        Constructions already predicted at the same chart position and still alive are reused instead of being instantiated again.
         """
         covers = predictions['covers']
-        pred_classes = set(predictions['cxn_classes'])
-        old_pred_classes = pred_classes
-
-        while pred_classes: # Recursively instantiate the constructions.
-            new_pred_classes = set([])
-            for cxn_schema in cxn_schemas:
-                if cxn_schema.content.clss in pred_classes:
-                    trace = {'schemas':[cxn_schema]}
-                    cxn_inst = CXN_SCHEMA_INST_C(cxn_schema, trace=trace, mapping={})
-                    cxn_inst.covers = covers[:] # That's not really a good "cover", cover should be a mapping between SynForm elements and PhonRep.
-                    self.cxn_instances.append(cxn_inst)
-                    # Recursively add the instances predicted by the newly instantiated cxns.
-                    pred = cxn_inst.cxn_predictions()
-                    new_pred_classes = new_pred_classes.union(set([c for c in pred if c not in old_pred_classes]))
-            old_pred_classes = old_pred_classes.union(new_pred_classes)
-            pred_classes = new_pred_classes
+        grammatical_LTM = cxn_schemas[0].LTM # Uses the class index and prediction closure of the LTM the schemas belong to.
+        if covers[0] != self.position:
+            self.position = covers[0]
+            self.predicted = {}
+        
+        depths = {}
+        for clss in set(predictions['cxn_classes']):
+            for (c, depth) in grammatical_LTM.predicted_classes(clss).iteritems():
+                if depth < depths.get(c, depth + 1):
+                    depths[c] = depth
+        levels = {}
+        for (c, depth) in depths.iteritems():
+            levels.setdefault(depth, []).append(c)
+        
+        for depth in sorted(levels):
+            for cxn_schema in grammatical_LTM.find_cxn_schemas(levels[depth]):
+                inst = self.predicted.get(cxn_schema.id, None)
+                if inst and inst.alive:
+                    continue
+                trace = {'schemas':[cxn_schema]}
+                cxn_inst = CXN_SCHEMA_INST_C(cxn_schema, trace=trace, mapping={})
+                cxn_inst.covers = covers[:] # That's not really a good "cover", cover should be a mapping between SynForm elements and PhonRep.
+                cxn_inst.has_predicted = True # Its predictions are part of the closure.
+                self.cxn_instances.append(cxn_inst)
+                self.predicted[cxn_schema.id] = cxn_inst
                         
     ####################
     ### JSON METHODS ###
@@ -2602,6 +3113,26 @@ class CONTROL(SYSTEM_SCHEMA):
             self.state['unexpressed_sem'] = False
             self.params['task']['start_produce'] += self.t
     
+    def idle(self):
+        """
+        In produce mode, idle as long as it keeps posting no pressure: no utterance is received and either there is no unexpressed semantic content
+        or the start_produce time has not been reached (a timer is set for start_produce, see process()).
+        Always idle in other modes.
+        """
+        if self.state['mode'] != 'produce':
+            return True
+        if self.state['produce'] or self.pending_inputs(['from_phonological_WM_P']):
+            return False
+        return not(self.pending_inputs(['from_semantic_WM'])) or self.t < self.params['task']['start_produce']
+    
+    def skip_to(self, t):
+        """
+        In produce mode, the last_prod_time is updated at each tick without pressure.
+        """
+        super(CONTROL, self).skip_to(t)
+        if self.state['mode'] == 'produce':
+            self.state['last_prod_time'] = t - self.dt
+    
     def process(self):
         """
         """
@@ -2615,6 +3146,8 @@ class CONTROL(SYSTEM_SCHEMA):
                 
             self.state['unexpressed_sem'] = self.inputs['from_semantic_WM']
             
+            if self.t < self.params['task']['start_produce']:
+                self.set_timer(self.params['task']['start_produce'])
             if self.t == self.params['task']['start_produce']:
                 self.state['last_prod_time'] = self.t #pressure only starts building up once the start_produce time has been reached.
                 
@@ -2665,6 +3198,7 @@ class TEXT2SPEECH(object):
     Simple TTS system.
     """
     def __init__(self, rate_percent=100):
+        import pyttsx
         self.rate_percent = float(rate_percent)/100
         self.utterance = None
         self.engine = pyttsx.init()
@@ -14,12 +14,18 @@ TCG data loader module
     To load grammar use load_grammar method (returns a grammar)
     To load visual scene use load_scene method (returns a scene)
     
+    Knowledge and grammars are cached in compiled form (see cache_read and cache_write) in the CACHE_FOLDER subfolder of the folder containing the source file.
+    
     All other methods should be considered private and are subject to change.
 """
 from __future__ import division
 import json
 import re
+import os
+import hashlib
+import cPickle as pickle
 
+from knowledge_rep import K_ENT
 
 import scene as SCN
 import concept as CPT
@@ -30,6 +36,8 @@ import language_schemas  as ls
 import saliency_matlab as SMAT
 
 class TCG_LOADER(object):
+    CACHE_FOLDER = 'cache' # Name of the cache subfolder
+    CACHE_VERSION = 1 # Increment to invalidate all the existing cache files (e.g. when the loaded classes change).
 
     ############################
     ### Data reading methods ###
@@ -53,6 +61,124 @@ class TCG_LOADER(object):
         
         return json_data
     
+    ##############################
+    ### Compiled cache methods ###
+    ##############################
+    @staticmethod
+    def cache_key(kind, file_name, path='./', dependencies=[]):
+        """
+        Returns the key (STR) identifying the compiled version of the object of type kind (STR) loaded from path+file_name.
+        The key is a hash of the content of the source file, of kind, and of the dependencies ([STR]).
+        Returns None if the source file cannot be read.
+        """
+        try:
+            with open(path+file_name, 'rb') as f:
+                content = f.read()
+        except IOError:
+            return None
+        
+        key = hashlib.md5()
+        key.update('%s|%i|' %(kind, TCG_LOADER.CACHE_VERSION))
+        for dependency in dependencies:
+            key.update('%s|' %dependency)
+        key.update(content)
+        return key.hexdigest()
+    
+    @staticmethod
+    def cache_file(kind, file_name, path='./'):
+        """
+        Returns the path of the cache file for the object of type kind (STR) loaded from path+file_name.
+        """
+        return '%s%s/%s.%s.pkl' %(path, TCG_LOADER.CACHE_FOLDER, file_name, kind)
+    
+    @staticmethod
+    def cache_read(kind, key, file_name, path='./', persistent_load=None):
+        """
+        Returns the cached object of type kind (STR) loaded from path+file_name if the cache file exists and its key matches key (STR).
+        Returns None otherwise.
+        
+        Args:
+            - persistent_load (FUNCTION): If defined, used to resolve the references to external objects (see cache_write).
+        """
+        if not(key):
+            return None
+        cache_file = TCG_LOADER.cache_file(kind, file_name, path)
+        if not(os.path.isfile(cache_file)):
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                unpickler = pickle.Unpickler(f)
+                if persistent_load:
+                    unpickler.persistent_load = persistent_load
+                if unpickler.load() != key:
+                    return None
+                return unpickler.load()
+        except Exception as e:
+            print "Invalid cache file %s. %s" %(cache_file, e)
+            return None
+    
+    @staticmethod
+    def cache_write(obj, kind, key, file_name, path='./', persistent_id=None):
+        """
+        Saves obj, the object of type kind (STR) loaded from path+file_name, in its cache file along with key (STR).
+        
+        Args:
+            - persistent_id (FUNCTION): If defined, used to store references to external objects instead of the objects themselves.
+        
+        Notes:
+            - The file is first written under a temporary name and then renamed so that concurrent readers never see a partial file.
+        """
+        if not(key):
+            return False
+        cache_file = TCG_LOADER.cache_file(kind, file_name, path)
+        tmp_file = '%s.%i.tmp' %(cache_file, os.getpid())
+        try:
+            if not(os.path.isdir(os.path.dirname(cache_file))):
+                os.makedirs(os.path.dirname(cache_file))
+            with open(tmp_file, 'wb') as f:
+                pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                if persistent_id:
+                    pickler.persistent_id = persistent_id
+                pickler.dump(key)
+                pickler.dump(obj)
+            if os.path.isfile(cache_file):
+                os.remove(cache_file)
+            os.rename(tmp_file, cache_file)
+        except (IOError, OSError, pickle.PicklingError) as e:
+            print "Cannot write cache file %s. %s" %(cache_file, e)
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+            return False
+        return True
+    
+    @staticmethod
+    def _knowledge_signature(k_net):
+        """
+        Returns a string summarizing the entities of the knowledge network k_net (K_NET).
+        Used to key the cache of objects that depend on a knowledge network.
+        """
+        return ','.join(sorted(['%s:%s' %(n.name, n.meaning) for n in k_net.nodes]))
+    
+    @staticmethod
+    def _concept_ref(cpt_knowledge):
+        """
+        Returns the pair of functions (persistent_id, persistent_load) used to store the concepts of cpt_knowledge (CONCEPTUAL_KNOWLEDGE)
+        by reference (meaning) and resolve them back.
+        """
+        def persistent_id(obj):
+            if isinstance(obj, CPT.CONCEPT):
+                return 'CONCEPT:%s' %obj.meaning
+            return None
+        
+        def persistent_load(pid):
+            meaning = pid[len('CONCEPT:'):]
+            concept = cpt_knowledge.find_meaning(meaning)
+            if concept is None:
+                raise pickle.UnpicklingError("%s: concept not found in sem_net" %meaning)
+            return concept
+        
+        return (persistent_id, persistent_load)
+    
     ######################################
     ### Private object reading methods ###
     ######################################
@@ -384,10 +510,18 @@ class TCG_LOADER(object):
     ### Public loading methods ###
     ###############################
     @staticmethod   
-    def load_conceptual_knowledge(file_name='', file_path='./'):
+    def load_conceptual_knowledge(file_name='', file_path='./', use_cache=True):
         """
         Loads and returns the conceptual knowledge defined in file_path\file_name. Return None if error.
+        If use_cache is True, the cached compiled version is used if valid, and is created otherwise.
         """
+        if use_cache:
+            cache_key = TCG_LOADER.cache_key('CONCEPTUAL_KNOWLEDGE', file_name, file_path)
+            my_conceptual_knowledge = TCG_LOADER.cache_read('CONCEPTUAL_KNOWLEDGE', cache_key, file_name, file_path)
+            if my_conceptual_knowledge is not None:
+                K_ENT.ID_NEXT = max([K_ENT.ID_NEXT] + [n.id + 1 for n in my_conceptual_knowledge.nodes])
+                return my_conceptual_knowledge
+        
         # Open and read file
         json_data = TCG_LOADER.json_read(file_name, path=file_path)
         cpt_data = json_data['CONCEPTUAL_KNOWLEDGE']
@@ -404,14 +538,25 @@ class TCG_LOADER(object):
            
         if not(flag):
             return None
+        
+        if use_cache:
+            TCG_LOADER.cache_write(my_conceptual_knowledge, 'CONCEPTUAL_KNOWLEDGE', cache_key, file_name, file_path)
     
         return my_conceptual_knowledge
         
     @staticmethod       
-    def load_perceptual_knowledge(file_name='', file_path='./'):
+    def load_perceptual_knowledge(file_name='', file_path='./', use_cache=True):
         """
         Load and returns the perceptual knowledge defined in file_path\file_name
+        If use_cache is True, the cached compiled version is used if valid, and is created otherwise.
         """
+        if use_cache:
+            cache_key = TCG_LOADER.cache_key('PERCEPTUAL_KNOWLEDGE', file_name, file_path)
+            my_perceptual_knowledge = TCG_LOADER.cache_read('PERCEPTUAL_KNOWLEDGE', cache_key, file_name, file_path)
+            if my_perceptual_knowledge is not None:
+                K_ENT.ID_NEXT = max([K_ENT.ID_NEXT] + [n.id + 1 for n in my_perceptual_knowledge.nodes])
+                return my_perceptual_knowledge
+        
         #OPen and read file
         json_data = TCG_LOADER.json_read(file_name, path=file_path)
         per_data = json_data['PERCEPTUAL_KNOWLEDGE']
@@ -426,15 +571,26 @@ class TCG_LOADER(object):
         flag = TCG_LOADER.read_percept('is_a', top_per, my_perceptual_knowledge, per_data)
         if not(flag):
             return None
+        
+        if use_cache:
+            TCG_LOADER.cache_write(my_perceptual_knowledge, 'PERCEPTUAL_KNOWLEDGE', cache_key, file_name, file_path)
     
         return my_perceptual_knowledge
     
     @staticmethod   
-    def load_conceptualization(file_name='', file_path='./', cpt_knowledge=None, per_knowledge=None):
+    def load_conceptualization(file_name='', file_path='./', cpt_knowledge=None, per_knowledge=None, use_cache=True):
         """
         Load and returns the TCG conceptualization defined in file_path\file_name
         Requires a cpt_knowledge (CONCEPTUAL_KNOWLEDGE) and a perceptual knowledge (PERCEPTUAL_KNOWLEDGE)
+        If use_cache is True, the cached compiled version is used if valid, and is created otherwise.
         """
+        if use_cache:
+            dependencies = [TCG_LOADER._knowledge_signature(cpt_knowledge), TCG_LOADER._knowledge_signature(per_knowledge)]
+            cache_key = TCG_LOADER.cache_key('CONCEPTUALIZATION', file_name, file_path, dependencies)
+            my_conceptualization = TCG_LOADER.cache_read('CONCEPTUALIZATION', cache_key, file_name, file_path)
+            if my_conceptualization is not None:
+                return my_conceptualization
+        
         #Open and read file
         json_data = TCG_LOADER.json_read(file_name, path=file_path)
         czer_data = json_data['CONCEPTUALIZATION']
@@ -449,14 +605,30 @@ class TCG_LOADER(object):
                     else:
                         my_conceptualization.add_mapping(pcpt, cpt)
         
+        if use_cache:
+            TCG_LOADER.cache_write(my_conceptualization, 'CONCEPTUALIZATION', cache_key, file_name, file_path)
+        
         return my_conceptualization
     
     @staticmethod       
-    def load_grammar(file_name='', file_path='./', cpt_knowledge = None):
+    def load_grammar(file_name='', file_path='./', cpt_knowledge = None, use_cache=True):
         """
         Loads and returns the TCG grammar defined in file_path\file_name.
         Requires a cpt_knowledge (CONCEPTUAL_KNOWLEDGE).
+        If use_cache is True, the cached compiled version is used if valid, and is created otherwise.
+        
+        Notes:
+            - The cached grammar stores its concepts by reference. They are resolved against cpt_knowledge when loaded.
         """
+        if use_cache:
+            (persistent_id, persistent_load) = TCG_LOADER._concept_ref(cpt_knowledge)
+            cache_key = TCG_LOADER.cache_key('GRAMMAR', file_name, file_path, [TCG_LOADER._knowledge_signature(cpt_knowledge)])
+            my_grammar = TCG_LOADER.cache_read('GRAMMAR', cache_key, file_name, file_path, persistent_load=persistent_load)
+            if my_grammar is not None:
+                elem_ids = [elem.id for cxn in my_grammar.constructions for elem in cxn.SemFrame.nodes + cxn.SemFrame.edges + cxn.SynForm.form]
+                CXN.TP_ELEM.ID_NEXT = max([CXN.TP_ELEM.ID_NEXT] + [elem_id + 1 for elem_id in elem_ids])
+                return my_grammar
+        
         # Open and read file
         json_data = TCG_LOADER.json_read(file_name, path = file_path)
         gram_data = json_data['grammar']
@@ -466,25 +638,26 @@ class TCG_LOADER(object):
         
         for aCxn in gram_data:
             TCG_LOADER.read_cxn(my_grammar, aCxn, cpt_knowledge)
+        
+        if use_cache:
+            TCG_LOADER.cache_write(my_grammar, 'GRAMMAR', cache_key, file_name, file_path, persistent_id=persistent_id)
     
         return my_grammar
     
     @staticmethod               
-    def load_scene(file_name = '', file_path = './', percept_LTM = None):
+    def load_scene(file_name = '', file_path = './', percept_LTM = None, BU_saliency = None):
         """
         Loads and returns a SCENE containing the visual scene data defined in file_path\file_name.
         Args:
             - file_name (STR)
             - file_path (STR)
             - percept_LTM (PERCEPT_LTM):
+            - BU_saliency (SALIENCY_DATA): Bottom-up saliency of the scene image (see compute_BU_saliency()), used for the areas with 'auto' saliency. If None, the area saliencies are random.
         """
         # Open and read file
         json_data = TCG_LOADER.json_read(file_name, path = file_path)
         scene_input = json_data['scene']
         
-        # Get perceptual schemas
-        per_schemas = percept_LTM.schemas
-        
         # Build scene
         my_scene = SCN.SCENE()
         my_scene.width = scene_input['resolution'][0]
@@ -493,10 +666,10 @@ class TCG_LOADER(object):
         name_table = {}
         for i in  [s for s in scene_input['schemas'].keys() if scene_input['schemas'][s]['type'] != 'RELATION']: # First instantiate all the schemas that are not relations.
             dat = scene_input['schemas'][i]
-            schema = [schema for schema in per_schemas if schema.content['percept'].name == dat['schema']][0]
+            schema = percept_LTM.find_per_schema(dat['schema'])
             inst = PER_SCHEMAS.PERCEPT_SCHEMA_INST(schema, trace=schema)
             area = PER_SCHEMAS.AREA(x=dat['location'][0], y=dat['location'][1], w=dat['size'][0], h=dat['size'][1])
-            area.set_BU_saliency(BU_saliency_map=None) # THIS NEEDS TO BE CHANGED (for now random)    
+            area.set_BU_saliency(BU_saliency_map=BU_saliency)
             inst.set_area(area)
             if dat['saliency'] == 'auto':
                 inst.set_saliency(area.saliency)  # Does this make any sense at all??
@@ -507,12 +680,12 @@ class TCG_LOADER(object):
         
         for i in  [s for s in scene_input['schemas'].keys() if scene_input['schemas'][s]['type'] == 'RELATION']: # Now dealing with relations
             dat = scene_input['schemas'][i]
-            schema = [schema for schema in per_schemas if schema.content['percept'].name == dat['schema']][0]
+            schema = percept_LTM.find_per_schema(dat['schema'])
             inst = PER_SCHEMAS.PERCEPT_SCHEMA_INST(schema, trace=schema)
             inst.content['pFrom'] = name_table[dat['from']]
             inst.content['pTo'] = name_table[dat['to']]
             area = PER_SCHEMAS.AREA(x=dat['location'][0], y=dat['location'][1], w=dat['size'][0], h=dat['size'][1]) # This means that the area is gonna be of size 0
-            area.set_BU_saliency(BU_saliency_map=None) # THIS NEEDS TO BE CHANGED (for now random)            
+            area.set_BU_saliency(BU_saliency_map=BU_saliency)
             inst.set_area(area)
             if dat['saliency'] == 'auto':
                 inst.set_saliency(area.saliency) # Does this make any sense at all?? 
@@ -570,19 +743,68 @@ class TCG_LOADER(object):
             my_scene.add_subscene(ss_name, cpt_instances, saliency, anchor)
         
         my_scene.scene_structure = scene_structure
+        my_scene.build_index()
         
         return my_scene
         
     
     @staticmethod    
-    def load_BU_saliency(file_name = '', file_path = './'):
+    def load_BU_saliency(file_name = '', file_path = './', use_cache=True):
         """
         Loads and returns the saliency data defined in in file_path\file_name.mat Return None if error.
+        If use_cache is True, the .mat file is converted once into .npy files (see saliency_cache_folder()) that are then memory-mapped lazily.
         """
         saliency_data = SMAT.SALIENCY_DATA()
+        if use_cache:
+            mat_name = file_name if file_name.endswith('.mat') else file_name + '.mat' # The key depends on the .mat file actually loaded.
+            cache_key = TCG_LOADER.cache_key('SALIENCY', mat_name, file_path)
+            cache_folder = TCG_LOADER.saliency_cache_folder(mat_name, file_path)
+            if saliency_data.load_npy(cache_folder, cache_key):
+                return saliency_data
+        
         saliency_data.load(file_path + file_name) # This needs to eb better integrated with the scene data.
+        
+        if use_cache and cache_key:
+            saliency_data.save_npy(cache_folder, cache_key)
         return saliency_data
     
+    @staticmethod
+    def compute_BU_saliency(file_name = 'scene.png', file_path = './', params = None, use_cache=True):
+        """
+        Computes and returns the Itti-Koch saliency data (SALIENCY_DATA) of the scene image file_path\file_name (see saliency_itti).
+        If use_cache is True, the saliency data is saved once as .npy files (see saliency_cache_folder()) that are then memory-mapped lazily.
+        
+        Args:
+            - file_name (STR)
+            - file_path (STR)
+            - params (SALIENCY_PARAMS): If None, uses the default parameters.
+        """
+        import saliency_itti
+        saliency = saliency_itti.ITTI_KOCH_SALIENCY(params)
+        if use_cache:
+            params_json = json.dumps(SMAT.to_json(vars(saliency.params)), sort_keys=True)
+            cache_key = TCG_LOADER.cache_key('SALIENCY_ITTI', file_name, file_path, dependencies=[params_json])
+            cache_folder = TCG_LOADER.saliency_cache_folder(file_name, file_path, variant=hashlib.md5(params_json).hexdigest()[:12]) # One folder per parameter set.
+            saliency_data = SMAT.SALIENCY_DATA()
+            if saliency_data.load_npy(cache_folder, cache_key):
+                return saliency_data
+        
+        saliency_data = saliency.compute_file(file_name, file_path)
+        
+        if use_cache and cache_key:
+            saliency_data.save_npy(cache_folder, cache_key)
+        return saliency_data
+    
+    @staticmethod
+    def saliency_cache_folder(file_name, path='./', variant=None):
+        """
+        Returns the folder storing the .npy version of the saliency data computed or loaded from path+file_name.
+        variant (STR) distinguishes the saliency data computed from the same file with different parameters.
+        """
+        if variant:
+            return '%s%s/%s.%s.saliency/' %(path, TCG_LOADER.CACHE_FOLDER, file_name, variant)
+        return '%s%s/%s.saliency/' %(path, TCG_LOADER.CACHE_FOLDER, file_name)
+    
     @staticmethod
     def load_sem_input(file_name = '', file_path = './'):
         """
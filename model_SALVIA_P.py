@@ -5,9 +5,10 @@
 Test TCG description
 """
 import random
+import time
+import os
 
 from TCG_models import SALVIA_P, SALVIA_P_verbal_guidance
-from viewer import TCG_VIEWER
 from loader import TCG_LOADER
 
 TMP_FOLDER = './tmp'
@@ -36,17 +37,17 @@ def set_model(semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_
     return model
     
 
-def set_inputs(model, input_name, input_file='TCG_scene.json', show_scene=True):
+def set_inputs(model, input_name, input_file='TCG_scene.json', show_scene=True, compute_saliency=True):
     """
     Sets up a SCENE input for SALVIA_P model
     
     Args:
-        - sem_name (STR): Semantic input name.
-        - sem_input_file (STR): Semantic input file name. For non-macro input, set to 'ALL' to load all inputs from file.
-        - sem_input_macro (BOOL): True is the input is an ISRF macro.
-        - speed_param (INT): multiplier of the rate defined in the ISRF input (by default the ISFR rate is 1.)
+        - input_name (STR): Scene folder name (in data/scenes/).
+        - input_file (STR): Scene file name.
+        - compute_saliency (BOOL): If True, the 'auto' area saliencies are computed from the bottom-up saliency of the scene image (see TCG_LOADER.compute_BU_saliency()).
+        If False, or if the folder has no scene.png, they are random.
     
-    Returns input SEM_GENERATOR object.
+    Returns (input_name, IMG_FILE).
     """
     
     # Defining scene input
@@ -54,8 +55,12 @@ def set_inputs(model, input_name, input_file='TCG_scene.json', show_scene=True):
     SCENE_FOLDER = "%s%s/" %(SCENE_INPUT_PATH, input_name)
     IMG_FILE = SCENE_FOLDER + 'scene.png'
     
+    BU_saliency = None
+    if compute_saliency and os.path.isfile(IMG_FILE):
+        BU_saliency = TCG_LOADER.compute_BU_saliency('scene.png', SCENE_FOLDER)
+    
     perceptLTM = model.schemas['Percept_LTM']
-    my_scene = TCG_LOADER.load_scene(input_file, SCENE_FOLDER, perceptLTM)
+    my_scene = TCG_LOADER.load_scene(input_file, SCENE_FOLDER, perceptLTM, BU_saliency=BU_saliency)
     model.set_input(my_scene)
     
     return (input_name, IMG_FILE)
@@ -107,6 +112,7 @@ def run(model, sim_name, max_time=900, seed=None, verbose=0, prob_times=[], IMG_
                         vals = [(u,v) for u,v in output['Subscene_recognition'].iteritems() if v]
                         print "t:%i, '%s'" %(t, vals)
         if t in prob_times:
+                from viewer import TCG_VIEWER
                 TCG_VIEWER.display_WMs_state(model.schemas['Visual_WM'], model.schemas['Semantic_WM'], model.schemas['Grammatical_WM_P'], concise=True, folder = FOLDER)
                 TCG_VIEWER.display_gramWM_state(model.schemas['Grammatical_WM_P'], concise=True)
                 TCG_VIEWER.display_lingWM_state(model.schemas['Semantic_WM'], model.schemas['Grammatical_WM_P'], concise=True)
@@ -120,6 +126,7 @@ def run(model, sim_name, max_time=900, seed=None, verbose=0, prob_times=[], IMG_
         model.schemas['Grammatical_WM_P'].show_dynamics()
 #        model.schemas['Grammatical_WM_P'].show_state()
         if IMG_FILE:
+            from viewer import TCG_VIEWER
             TCG_VIEWER.display_saccades(out_fixation, IMG_FILE, ss_radius=True)
     
     model.save_sim(file_path = FOLDER, file_name = 'output.json')
@@ -134,6 +141,196 @@ def run(model, sim_name, max_time=900, seed=None, verbose=0, prob_times=[], IMG_
 
     ## NO DATA ANALYSIS HERE
 
+def run_sim(model, input_name, max_time=900, seed=None, verbose=0):
+    """
+    Runs the model on the scene input it has been set up with (see set_inputs()) and returns the description data.
+    Unlike run(), nothing is displayed or saved.
+    
+    Args:
+        - model (MODEL): SALVIA_P or SALVIA_P_light model (see set_model()), with its input set. The model should be in its initial state.
+        - input_name (STR)
+        - max_time (INT)
+        - seed (INT)
+        - verbose (INT): 0 -> no output printed, 1 -> summary of the run, 2 -> also prints the fixations and TD requests.
+    
+    Returns:
+        - out (DICT): {'input_name':STR, 'seed':INT, 'utterances':[(INT, STR)], 'fixations':[DICT], 'TD_requests':[DICT], 'num_ticks':INT, 'run_time':FLOAT}
+        Each fixation is recorded as {'time':INT, 'subscene':STR, 'pos':(x,y)} (pos is None for SALVIA_P_light), 
+        each TD request as {'time':INT, 'name':STR, 'target':((x,y), r) focus area for SALVIA_P, subscene name for SALVIA_P_light}.
+    """
+    if seed is not None:
+        random.seed(seed)
+    
+    # SALVIA_P or SALVIA_P_light perception schema
+    percept_name = 'Subscene_recognition' if 'Subscene_recognition' in model.schemas else 'Scene_perception'
+    
+    model.verbose = False
+    model.schemas[percept_name].verbose = max(verbose - 1, 0) # Fixations and TD requests are only printed at verbose > 1.
+    model.initialize_states()
+    
+    start_time = time.time()
+    utterances = []
+    fixations = []
+    TD_requests = []
+    for t in range(max_time):
+        model.update()
+        output = model.get_output()
+        if not(output):
+            continue
+        if output['Utter']:
+            utterances.append((t, output['Utter']))
+        percept_output = output[percept_name]
+        if percept_output:
+            if percept_output['subscene']:
+                fixations.append({'time':t, 'subscene':percept_output['subscene']['name'], 'pos':percept_output.get('eye_pos', None)})
+            request = percept_output['TD_request']
+            if request:
+                TD_requests.append({'time':t, 'name':request['name'], 'target':request.get('area', request.get('subscene', None))})
+    run_time = time.time() - start_time
+    
+    out = {'input_name':input_name, 'seed':seed, 'utterances':utterances, 'fixations':fixations, 'TD_requests':TD_requests, 'num_ticks':max_time, 'run_time':run_time}
+    if verbose > 0:
+        print "%s (seed %s): '%s' (%i fixations, %i TD requests, %.2fs)" %(input_name, str(seed), ' '.join(u for (t, u) in utterances), len(fixations), len(TD_requests), run_time)
+    return out
+
+##############
+#### BATCH RUN
+def run_batch_chunk(jobs, input_file='TCG_scene.json', light=False, semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', verbal_guidance=False, params_set=[{}], max_time=900, verbose=0):
+    """
+    Runs the jobs (input_name, seed, param_index) of a chunk.
+    One model is built for each parameter point used by the chunk, and each job is run on a clone of it (see MODEL.clone()).
+    The scene is loaded for each job since the simulations modify it.
+    
+    Notes:
+        - For use of Parallel, the function needs to be defined outside of __main__
+        - A job that fails (e.g. on an invalid scene input) does not stop the chunk: its error is recorded in its output.
+    
+    Returns:
+        - outputs ([DICT]): The run_sim() output for each job, with the added 'params' (DICT) and 'error' (STR, None if the job succeeded) entries.
+        The output of a failed job has no utterance, fixation or TD request and 0 ticks.
+    """
+    import model_SALVIA_P_light
+    
+    prototypes = {}
+    outputs = []
+    for (input_name, seed, param_index) in jobs:
+        if param_index not in prototypes:
+            if light:
+                prototypes[param_index] = model_SALVIA_P_light.set_model(semantics_name, grammar_name, params_set[param_index])
+            else:
+                prototypes[param_index] = set_model(semantics_name, grammar_name, verbal_guidance, params_set[param_index])
+        try:
+            model = prototypes[param_index].clone()
+            if light:
+                model_SALVIA_P_light.set_inputs(model, input_name, input_file)
+            else:
+                set_inputs(model, input_name, input_file, show_scene=False)
+            out = run_sim(model, input_name, max_time=max_time, seed=seed, verbose=verbose)
+            out['error'] = None
+        except Exception as e:
+            out = {'input_name':input_name, 'seed':seed, 'utterances':[], 'fixations':[], 'TD_requests':[], 'num_ticks':0, 'run_time':0.0, 'error':'%s: %s' %(type(e).__name__, e)}
+            if verbose > 0:
+                print "%s (seed %s): %s" %(input_name, str(seed), out['error'])
+        out['params'] = params_set[param_index]
+        outputs.append(out)
+    return outputs
+
+def list_inputs(input_file='TCG_scene.json', light=False):
+    """
+    Returns the names of all the scene inputs.
+        - SALVIA_P: the folders of data/scenes containing input_file.
+        - SALVIA_P_light: the inputs defined in data/scene_inputs/input_file.
+    """
+    if light:
+        json_data = TCG_LOADER.json_read(input_file, path='./data/scene_inputs/')
+        return sorted(json_data['inputs'].keys()) if json_data else []
+    SCENE_INPUT_PATH = './data/scenes/'
+    return sorted(name for name in os.listdir(SCENE_INPUT_PATH) if os.path.isfile(os.path.join(SCENE_INPUT_PATH, name, input_file)))
+
+def run_batch(input_names=None, input_file='TCG_scene.json', light=False, semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', verbal_guidance=False,
+              params_set=[{}], num_restarts=1, max_time=900, seed=None, n_jobs=-1, verbose=0):
+    """
+    Runs the scene description model on all the combinations scene inputs x parameter points x restarts, over a pool of processes.
+    
+    Args:
+        - input_names ([STR]): Scene inputs to describe (if None, all the inputs, see list_inputs()).
+        - input_file (STR): TCG_scene.json file of the scene folders (SALVIA_P), scene input file of data/scene_inputs (SALVIA_P_light).
+        - light (BOOL): If True, runs SALVIA_P_light (see model_SALVIA_P_light).
+        - semantics_name (STR), grammar_name (STR), verbal_guidance (BOOL): see set_model()
+        - params_set ([DICT]): Model parameter points (see MODEL.update_params()).
+        - num_restarts (INT): Number of runs for each input and parameter point.
+        - max_time (INT): see run_sim()
+        - seed (INT): The job i is run with seed + i so that results do not depend on n_jobs. If None, a seed is drawn.
+        - n_jobs (INT) : Number of processes. -1 to set to the number of cores.
+        - verbose (INT): higher ints increase verbosity
+    
+    Returns:
+        - batch (DICT): {'outputs':[DICT], 'seed':INT, 'num_runs':INT, 'num_errors':INT, 'num_ticks':INT, 'run_time':FLOAT, 'runs_per_s':FLOAT}
+        outputs lists the run_sim() outputs (plus 'params' and 'error', see run_batch_chunk()) in job order: input, then parameter point, then restart.
+    
+    Notes:
+        - The jobs are split into one chunk per process so that each process only builds one model per parameter point.
+    """
+    from joblib import Parallel, delayed, cpu_count
+    
+    if input_names is None:
+        input_names = list_inputs(input_file, light)
+    if seed is None: # So that the batch can be run again.
+        seed = random.randint(0,10**9)
+    jobs = [(input_name, param_index) for input_name in input_names for param_index in range(len(params_set)) for i in range(num_restarts)]
+    jobs = [(input_name, seed + i, param_index) for i, (input_name, param_index) in enumerate(jobs)]
+    
+    if n_jobs < 0:
+        n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+    num_chunks = max(min(n_jobs, len(jobs)), 1)
+    chunks = [range(i, len(jobs), num_chunks) for i in range(num_chunks)]
+    
+    start_time = time.time()
+    res = Parallel(n_jobs=n_jobs, verbose=verbose)(delayed(run_batch_chunk)([jobs[i] for i in chunk], input_file=input_file, light=light, 
+                                                                            semantics_name=semantics_name, grammar_name=grammar_name, verbal_guidance=verbal_guidance, 
+                                                                            params_set=params_set, max_time=max_time, verbose=verbose)
+                                                   for chunk in chunks)
+    run_time = time.time() - start_time
+    
+    outputs = [None]*len(jobs)
+    for chunk, chunk_outputs in zip(chunks, res):
+        for i, out in zip(chunk, chunk_outputs):
+            outputs[i] = out
+    num_ticks = sum(out['num_ticks'] for out in outputs)
+    num_errors = len([out for out in outputs if out['error']])
+    batch = {'outputs':outputs, 'seed':seed, 'num_runs':len(outputs), 'num_errors':num_errors, 'num_ticks':num_ticks, 'run_time':run_time, 'runs_per_s':len(outputs)/run_time}
+    if verbose > 0:
+        print "%i runs (%i errors), %i ticks in %.2fs (%.2f runs/s)" %(batch['num_runs'], num_errors, num_ticks, run_time, batch['runs_per_s'])
+    return batch
+
+def batch_to_csv(batch, folder):
+    """
+    Saves the batch outputs (see run_batch()) to one csv file per scene input (folder/input_name.csv), one row per run (as in the simulation_analyses data).
+    The utterances are written as '<START><t>utterance...<END>', the fixations and the TD requests as ' '-separated sequences of subscene names and requested schema names.
+    The last column holds the error of the failed runs (see run_batch_chunk()).
+    """
+    import csv
+    if not(os.path.exists(folder)):
+        os.makedirs(folder)
+    
+    param_names = sorted(set(name for out in batch['outputs'] for name in out['params']))
+    header = ['seed', 'input_name'] + param_names + ['num_utterances', 'num_fixations', 'num_requests', 'utterance', 'fixations', 'TD_requests', 'error']
+    rows = {}
+    for out in batch['outputs']:
+        row = [out['seed'], out['input_name']] + [out['params'].get(name, None) for name in param_names]
+        row += [len(out['utterances']), len(out['fixations']), len(out['TD_requests'])]
+        row.append('<START>' + ''.join('<%i>%s' %(t, utterance) for (t, utterance) in out['utterances']) + '<END>')
+        row.append(' '.join(fixation['subscene'] for fixation in out['fixations']))
+        row.append(' '.join(request['name'] for request in out['TD_requests']))
+        row.append(out.get('error', None) or '')
+        rows.setdefault(out['input_name'], []).append(row)
+    
+    for input_name, input_rows in rows.iteritems():
+        with open(os.path.join(folder, '%s.csv' %input_name), 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(input_rows)
+
 def run_diagnostics(verbal_guidance=False, verbose=2, prob_times=[]):
     """
     Allows to run a set of diagnostics.
@@ -7,7 +7,6 @@ SALVIA_P model light version (No VisualWM and Conceptualization)
 import random
 
 from TCG_models import SALVIA_P_light
-from viewer import TCG_VIEWER
 from loader import TCG_LOADER
 
 TMP_FOLDER = './tmp'
@@ -95,6 +94,7 @@ def run(model, sim_name, max_time=900, seed=None, verbose=0, prob_times=[]):
                 if vals:
                     print "t:%i, '%s'" %(t, vals)
         if t in prob_times:
+                from viewer import TCG_VIEWER
                 TCG_VIEWER.display_gramWM_state(model.schemas['Grammatical_WM_P'], concise=True)
                 TCG_VIEWER.display_lingWM_state(model.schemas['Semantic_WM'], model.schemas['Grammatical_WM_P'], concise=True)
     
@@ -115,6 +115,28 @@ def run(model, sim_name, max_time=900, seed=None, verbose=0, prob_times=[]):
 
     ## NO DATA ANALYSIS HERE
 
+def run_batch(input_names=None, input_file='kuchinsky_jin.json', semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', params_set=[{}], num_restarts=1, max_time=900, seed=None, n_jobs=-1, verbose=0):
+    """
+    Runs SALVIA_P_light on the scene inputs of data/scene_inputs/input_file (all of them if input_names is None) over a pool of processes.
+    See model_SALVIA_P.run_batch()
+    """
+    import model_SALVIA_P
+    return model_SALVIA_P.run_batch(input_names, input_file, light=True, semantics_name=semantics_name, grammar_name=grammar_name, 
+                                    params_set=params_set, num_restarts=num_restarts, max_time=max_time, seed=seed, n_jobs=n_jobs, verbose=verbose)
+
+def test_clone(input_name='scene_incremental', input_file='kuchinsky_jin.json', max_time=300, seed=0):
+    """
+    Checks that a clone of a SALVIA_P_light model behaves as the freshly built model (see TCG_models.check_clone()).
+    """
+    from TCG_models import check_clone
+    model = set_model(model_params={'Scene_perception.recognition_time':30})
+    diff = check_clone(model, lambda a_model: set_inputs(a_model, input_name, input_file), max_time=max_time, seed=seed)
+    if diff:
+        print "Clone differs from model at t=%i:\n%s\n%s" %diff
+    else:
+        print "Clone OK"
+    return diff is None
+
 def run_diagnostics(verbose=2, prob_times=[]):
     """
     Allows to run a set of diagnostics.
@@ -2,14 +2,206 @@
 """
 @author: Victor Barres
 Test cases for the comprehension language schemas defined in language_schemas.py
+ - Set the model and the input generator using set_model() and set_inputs()
+ - If the model is to be run only on one input use run()
+ - To parse a whole linguistic input file (or a text corpus) over a pool of processes use run_batch()
 """
+from __future__ import division
 import random
+import time
+import os
 
 import language_schemas as ls
 from loader import TCG_LOADER
 from TCG_models import TCG_comprehension_system
-from viewer import TCG_VIEWER
+
+LING_INPUT_PATH = './data/ling_inputs/'
+
+##################
+#### RUNNING MODEL
+
+def set_model(semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', model_params = {}):
+    """
+    Sets up a TCG comprehension model.
+    
+    Args:
+        - semantics_name (STR): Name of the semantic file containing the perceptual, world, and conceptualization knowledge.
+        - grammar_name (STR): Name of the grammar file to use.
+        - model_prams (DICT): Dictionary defining the model parameters (if different than default)
+    
+    Returns: 
+        - comprehension model
+    """
+    model = TCG_comprehension_system(grammar_name=grammar_name, semantics_name=semantics_name)
+    if model_params:
+        model.update_params(model_params)
+    
+    return model
+
+def load_corpus(file_name='ling_inputs.json', file_path=LING_INPUT_PATH, utter_rate=100):
+    """
+    Loads the linguistic inputs defined in file_path/file_name.
+    
+    Args:
+        - file_name (STR): Either a linguistic input file (.json, see TCG_LOADER.load_ling_input()) or a text corpus (one utterance per line, words separated by spaces).
+        - file_path (STR)
+        - utter_rate (INT): Utterance rate given to the utterances of a text corpus.
+    
+    Returns:
+        - ling_inputs (DICT): {input_name:ling_input}. The utterances of a text corpus are named 'utter_<line number>'.
+    """
+    if os.path.splitext(file_name)[1] == '.json':
+        return TCG_LOADER.load_ling_input(file_name, file_path)
+    
+    ling_inputs = {}
+    with open(os.path.join(file_path, file_name), 'r') as f:
+        for idx, line in enumerate(f):
+            utterance = line.split()
+            if utterance:
+                ling_inputs['utter_%i' %idx] = {'utter_rate':utter_rate, 'utterance':utterance, 'timing':[], 'comments':''}
+    return ling_inputs
+
+def set_inputs(ling_inputs, speed_param=1):
+    """
+    Sets up the utterance generator for TCG comprehension model.
+    
+    Args:
+        - ling_inputs (DICT): Linguistic inputs (see load_corpus()).
+        - speed_param (INT): multiplier of the timing defined in the linguistic inputs.
+    
+    Returns:
+        - input UTTER_GENERATOR object.
+    """
+    return ls.UTTER_GENERATOR(ling_inputs, speed_param=speed_param)
+
+def run(model, utter_gen, input_name, set_up_time=-10, max_time=None, extra_time=300, seed=None, verbose=0):
+    """
+    Runs the comprehension model on the linguistic input input_name.
+    
+    Args:
+        - model (MODEL): comprehension model (see set_model()). The model should be in its initial state.
+        - utter_gen (UTTER_GENERATOR)
+        - input_name (STR)
+        - set_up_time (INT): Starts negative to let the system settle before it receives its first input.
+        - max_time (INT): Simulation end time. If None, the simulation ends extra_time steps after the last word is received.
+        - extra_time (INT)
+        - seed (INT)
+        - verbose (INT)
     
+    Returns:
+        - out (DICT): {'input_name':STR, 'utterance':[STR], 'sem_frames':[DICT], 'num_ticks':INT, 'run_time':FLOAT}
+        Each SemFrame produced is recorded as {'t':FLOAT, 'nodes':{node name:concept name}, 'edges':[(node name, concept name, node name)]}
+    """
+    if seed is not None:
+        random.seed(seed)
+    ling_input = utter_gen.ling_inputs[input_name]
+    if max_time is None:
+        max_time = int(ling_input['timing'][-1]) + extra_time
+    
+    # Word forms are received at the first tick t > timing. Model time starts at 0 for t = set_up_time.
+    t0 = model.t - set_up_time
+    model.schedule_generator(utter_gen.utter_generator(input_name), offset=t0 + 1)
+    
+    start_time = time.time()
+    sem_frames = []
+    num_ticks = 0
+    for t in range(set_up_time, max_time):
+        if t + t0 < model.t: # Tick skipped by the scheduler.
+            continue
+        if model.process_events() and verbose > 1:
+            print "t:%i, receive: %s" %(t, model.input)
+        model.update()
+        num_ticks += 1
+        output = model.get_output()
+        sem_frame = output.get('Grammatical_WM_C', None) if output else None
+        if sem_frame:
+            sem_frames.append({'t':model.t,
+                               'nodes':dict((node.name, node.concept.name) for node in sem_frame.nodes),
+                               'edges':[(edge.pFrom.name, edge.concept.name, edge.pTo.name) for edge in sem_frame.edges]})
+        model.skip_idle_ticks(max_time + t0)
+    run_time = time.time() - start_time
+    
+    out = {'input_name':input_name, 'utterance':ling_input['utterance'], 'sem_frames':sem_frames, 'num_ticks':num_ticks, 'run_time':run_time}
+    if verbose > 0:
+        print "%s: %s -> %i SemFrame(s) (%i ticks, %.2fs)" %(input_name, ' '.join(ling_input['utterance']), len(sem_frames), num_ticks, run_time)
+    return out
+
+##############
+#### BATCH RUN
+def run_batch_chunk(ling_inputs, input_names, semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', model_params = {}, speed_param=1, max_time=None, extra_time=300, seeds=None, verbose=0):
+    """
+    Runs the comprehension model on each input of input_names.
+    The model is built once and each input is run on a clone of it (see MODEL.clone()).
+    
+    Notes:
+        - For use of Parallel, the function needs to be defined outside of __main__
+    
+    Returns:
+        - outputs ([DICT]): The run() output for each input.
+    """
+    prototype = set_model(semantics_name, grammar_name, model_params)
+    utter_gen = set_inputs(ling_inputs, speed_param)
+    outputs = []
+    for idx, input_name in enumerate(input_names):
+        seed = seeds[idx] if seeds else None
+        outputs.append(run(prototype.clone(), utter_gen, input_name, max_time=max_time, extra_time=extra_time, seed=seed, verbose=verbose))
+    return outputs
+
+def run_batch(ling_input_file='ling_inputs.json', ling_input_path=LING_INPUT_PATH, input_names=None, semantics_name='TCG_semantics_main', grammar_name='TCG_grammar_VB_main', model_params = {}, speed_param=1, utter_rate=100, max_time=None, extra_time=300, seed=None, n_jobs=-1, verbose=0):
+    """
+    Parses all the utterances of a linguistic input file (or text corpus, see load_corpus()) with the comprehension model, over a pool of processes.
+    
+    Args:
+        - ling_input_file (STR), ling_input_path (STR), utter_rate (INT): see load_corpus()
+        - input_names ([STR]): Inputs to parse (if None, all the inputs of the file).
+        - semantics_name (STR), grammar_name (STR), model_params (DICT): see set_model()
+        - speed_param (INT): see set_inputs()
+        - max_time (INT), extra_time (INT): see run()
+        - seed (INT): If not None, the input i (in input_names order) is run with seed + i so that results do not depend on n_jobs.
+        - n_jobs (INT) : Number of processes. -1 to set to the number of cores.
+        - verbose (INT): higher ints increase verbosity
+    
+    Returns:
+        - batch (DICT): {'outputs':{input_name:run() output}, 'num_utterances':INT, 'num_ticks':INT, 'run_time':FLOAT, 'utter_per_s':FLOAT, 'ticks_per_s':FLOAT}
+    
+    Notes:
+        - The inputs are split into one chunk per process so that each process only builds the model once.
+    """
+    from joblib import Parallel, delayed, cpu_count
+    
+    ling_inputs = load_corpus(ling_input_file, ling_input_path, utter_rate)
+    if input_names is None:
+        input_names = sorted(ling_inputs.keys())
+    seeds = [seed + i for i in range(len(input_names))] if seed is not None else None
+    
+    if n_jobs < 0:
+        n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+    num_chunks = max(min(n_jobs, len(input_names)), 1)
+    chunks = [range(i, len(input_names), num_chunks) for i in range(num_chunks)]
+    
+    start_time = time.time()
+    res = Parallel(n_jobs=n_jobs, verbose=verbose)(delayed(run_batch_chunk)(dict((input_names[i], ling_inputs[input_names[i]]) for i in chunk), 
+                                                                            [input_names[i] for i in chunk],
+                                                                            semantics_name=semantics_name, grammar_name=grammar_name, model_params=model_params, 
+                                                                            speed_param=speed_param, max_time=max_time, extra_time=extra_time,
+                                                                            seeds=[seeds[i] for i in chunk] if seeds else None, verbose=verbose)
+                                                   for chunk in chunks)
+    run_time = time.time() - start_time
+    
+    outputs = {}
+    for chunk_outputs in res:
+        for out in chunk_outputs:
+            outputs[out['input_name']] = out
+    num_ticks = sum(out['num_ticks'] for out in outputs.itervalues())
+    batch = {'outputs':outputs, 'num_utterances':len(outputs), 'num_ticks':num_ticks, 'run_time':run_time,
+             'utter_per_s':len(outputs)/run_time, 'ticks_per_s':num_ticks/run_time}
+    if verbose > 0:
+        print "%i utterances, %i ticks in %.2fs (%.2f utterances/s, %.1f ticks/s)" %(batch['num_utterances'], num_ticks, run_time, batch['utter_per_s'], batch['ticks_per_s'])
+    return batch
+
+###########
+#### TESTS
+
 def test(seed=None):
     """
     Speech rate based inputs (for simplicity)
@@ -80,6 +272,7 @@ def test2(seed=None):
         language_system_C.update()
         
         if t - set_up_time in save_states:
+            from viewer import TCG_VIEWER
             TCG_VIEWER.display_gramWM_state(language_system_C.schemas['Grammatical_WM_C'], concise=True)
     
     language_system_C.schemas['Phonological_WM_C'].show_dynamics(inst_act=True, WM_act=False, c2_levels=False, c2_network=False)
@@ -111,39 +111,42 @@ def test_BUsaliency():
                         
     perceptual_schemas = [saliency_map, saccade_system, fixation]
     
-    # Creating schema system and adding procedural schemas
-    BUsaliency_system = st.SCHEMA_SYSTEM('BU_saliency_system')
-    BUsaliency_system.add_schemas(perceptual_schemas)
+    # Creating model and adding system schemas
+    BUsaliency_model = st.MODEL('BU_saliency_model')
+    BUsaliency_model.add_schemas(perceptual_schemas)
     
     # Defining connections
-    BUsaliency_system.add_connection(saliency_map, 'to_saccade_system', saccade_system , 'from_saliency_map')
-    BUsaliency_system.add_connection(saccade_system, 'to_saliency_map', saliency_map, 'from_saccade_system')
-    BUsaliency_system.add_connection(saccade_system, 'to_fixation', fixation, 'from_saccade_system')
+    BUsaliency_model.add_connection(saliency_map, 'to_saccade_system', saccade_system , 'from_saliency_map')
+    BUsaliency_model.add_connection(saccade_system, 'to_saliency_map', saliency_map, 'from_saccade_system')
+    BUsaliency_model.add_connection(saccade_system, 'to_fixation', fixation, 'from_saccade_system')
     
     # Defining input and output ports 
-    BUsaliency_system.set_input_ports([saliency_map._find_port('from_input')])
-    BUsaliency_system.set_output_ports([fixation._find_port('to_output')])
+    BUsaliency_model.set_input_ports([saliency_map.find_port('from_input')])
+    BUsaliency_model.set_output_ports([fixation.find_port('to_output')])
     
     # Setting up schema to brain mappings
     perception_brain_mapping = st.BRAIN_MAPPING()
     perception_brain_mapping.schema_mapping = perception_mapping
-    BUsaliency_system.brain_mapping = perception_brain_mapping
+    BUsaliency_model.brain_mapping = perception_brain_mapping
     
     # Generating schema system graph visualization
-    BUsaliency_system.system2dot(image_type='png', disp=True)
+    BUsaliency_model.system2dot(image_type='png', disp=True)
     
     # Parameters   
-    saliency_map.params['IOR'] = {'IOR_radius': 5, 'IOR_decay': 0.99, 'IOR_max': 100}
+    saliency_map.params['IOR'] = {'radius': 5, 'decay': 0.99, 'max': 100, 'threshold': 1e-3}
     
     # Loading data
     scene_name = 'TCG_cholitas'
     
     scene_folder = "./data/scenes/%s/" %scene_name
     
-    # Setting up BU saliency data
-    saliency_data = ld.load_BU_saliency(scene_name, scene_folder)
-    saliency_map.BU_saliency_map = saliency_data.saliency_map.data # This needs to eb better integrated with the scene data.
+    # Setting up BU saliency data (the saliency map schema receives it as model input)
+    saliency_data = ld.TCG_LOADER.compute_BU_saliency('scene.png', scene_folder)
+    BUsaliency_model.initialize_states()
+    BUsaliency_model.set_input(saliency_data)
     
+    # Scale between saliency map cells and image pixels
+    r = saliency_data.orig_image.size[0]/float(saliency_data.saliency_map.data.shape[0])
     
     # Display and run    
     plt.figure()
@@ -155,37 +158,37 @@ def test_BUsaliency():
     plt.subplot(2,2,2)
     plt.axis('off')
     plt.title('Bottom-up saliency map')
-    plt.imshow(saliency_map.BU_saliency_map, cmap = cm.Greys_r)
+    plt.imshow(saliency_data.saliency_map.data, cmap = cm.Greys_r)
     
-    # Running the schema system
-    fixation = plt.subplot(2,2,3)
+    # Running the model
+    fixation_fig = plt.subplot(2,2,3)
     plt.axis('off')
     plt.title('Fixation')
     plt.imshow(saliency_data.orig_image.data)
     fix = plt.Circle((0,0), saliency_data.params.foaSize, color='r', alpha=0.3)
-    fixation.add_patch(fix)
+    fixation_fig.add_patch(fix)
     
     ior_fig = plt.subplot(2,2,4)
     plt.axis('off')
     plt.title('IOR')
     time = 1000
     for t in range(time):    
-        BUsaliency_system.update()
-        map = saliency_map.IOR_mask
-        if map != None:
+        BUsaliency_model.update()
+        IOR_mask = saliency_map.IOR_mask()
+        if IOR_mask is not None:
             plt.sca(ior_fig)
             ior_fig.cla()
-            plt.imshow(map, cmap = cm.Greys_r)
+            plt.imshow(IOR_mask, cmap = cm.Greys_r)
             plt.axis('off')
             plt.title('IOR')
         if saccade_system.eye_pos:
             fix.remove()
             fix.center = (saccade_system.eye_pos[1]*r,saccade_system.eye_pos[0]*r)
-            plt.sca(fixation)
-            fixation.add_patch(fix)
+            plt.sca(fixation_fig)
+            fixation_fig.add_patch(fix)
         plt.pause(0.01)
 
-    BUsaliency_system.save_sim('./tmp/test_BUsaliency_output.json')
+    BUsaliency_model.save_sim('./tmp/', 'test_BUsaliency_output')
 
 def test():
     instructions =  '1: Test subscene_rec, 2: test BU saliency, q: quit.'
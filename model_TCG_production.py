@@ -13,9 +13,8 @@ import time
 import json
 
 from TCG_models import TCG_production_system
-from viewer import TCG_VIEWER
 from loader import TCG_LOADER
-from schema_theory import st_save
+from schema_theory import st_save, st_load
 from prod_analysis import prod_summary, BLEU
 import language_schemas as ls
 
@@ -102,13 +101,12 @@ def run(model, sem_gen, input_name, sim_name='', sim_folder=TMP_FOLDER, max_time
     
     FOLDER = '%s/%s/' %(sim_folder, sim_name)
     
-    if save: # Saving model and sem_gen
-        st_save(model, model.name, FOLDER)
-        st_save(sem_gen, 'sem_gen', FOLDER)
+    if save: # Saving model and sem_gen as they were before their first run (stored once in sim_folder and shared by all the runs that use them)
+        st_save(model, model.name, FOLDER, store=sim_folder, canonical=True)
+        st_save(sem_gen, 'sem_gen', FOLDER, store=sim_folder, canonical=True)
     
-    # initializing generator for the model.
-    generator = sem_gen.sem_generator(input_name, verbose = (verbose>2))
-    (sem_insts, next_time, prop) = generator.next()
+    # Scheduling the inputs of the generator.
+    model.schedule_generator(sem_gen.sem_generator(input_name, verbose = (verbose>2)))
     model.initialize_states() # initializing model
     
     if verbose>3:
@@ -118,11 +116,10 @@ def run(model, sem_gen, input_name, sim_name='', sim_folder=TMP_FOLDER, max_time
     test_not_empty = lambda l: [x for x in l.values() if x!= None] != []
     
     for t in range(max_time):
-        if  next_time != None and t>=next_time:
-            (sem_insts, next_time, prop) = generator.next()
-            model.set_input(sem_insts)
-            if verbose > 3:
-                prob_times.append(t + 10) #Will save the state 10 step after introduction of new inputs.
+        if t < model.t: # Tick skipped by the scheduler.
+            continue
+        if model.process_events() and verbose > 3:
+            prob_times.append(t + 10) #Will save the state 10 step after introduction of new inputs.
         model.update()
         # Store output
         output = model.get_output()
@@ -135,7 +132,9 @@ def run(model, sem_gen, input_name, sim_name='', sim_folder=TMP_FOLDER, max_time
             if verbose >3:
                 prob_times.append(t + 10) #Will save the state 10 steps after utterance
         if t in prob_times: # Saving figures for prob times.
+            from viewer import TCG_VIEWER
             TCG_VIEWER.display_lingWM_state(model.schemas['Semantic_WM'], model.schemas['Grammatical_WM_P'], concise=True, folder = FOLDER)
+        model.skip_idle_ticks(max_time)
     
     if save:
         model.save_sim(file_path = FOLDER, file_name = 'output')
@@ -686,6 +685,37 @@ def grid_search_to_csv(grid_output, folder, input_name, meta_params, model_param
             new_line = line(param_row + output_row)
             f.write(new_line)
 
+def test_save(folder='%s/TEST_SAVE/' %TMP_FOLDER, param_name='Grammatical_WM_P.C2.coop_weight', param_value=123.0):
+    """
+    Checks that the canonical save of a model (see run()) records its parameters: the model is saved, its parameter param_name is set to param_value, 
+    the model is saved again, and both saved models are reloaded.
+    """
+    import os
+    import shutil
+    
+    model = set_model()
+    (schema_name, param_path) = param_name.split('.', 1)
+    def get_param(a_model):
+        value = a_model.schemas[schema_name].params
+        for key in param_path.split('.'):
+            value = value[key]
+        return value
+    
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    old_value = get_param(model)
+    st_save(model, model.name, folder + 'run_1/', store=folder, canonical=True)
+    model.update_params({param_name:param_value})
+    st_save(model, model.name, folder + 'run_2/', store=folder, canonical=True)
+    
+    values = [get_param(st_load('%s.st' %model.name, folder + run_name + '/')) for run_name in ('run_1', 'run_2')]
+    shutil.rmtree(folder)
+    if values != [old_value, param_value]:
+        print "Saved %s: %s (expected %s)" %(param_name, values, [old_value, param_value])
+        return False
+    print "Save OK"
+    return True
+
 def tell_me(utterance):
     """
     Simple function to produce an utterance sound output
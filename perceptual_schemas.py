@@ -7,21 +7,19 @@ Dependencies:
     - Uses numpy for the saliency map.
     - Uses NetworkX for the implementation of the content of the Visual Working Memory (SceneRep graph)
     - Uses random
-    - Uses matplotlib.pyplot
+    - Uses matplotlib.pyplot (imported on first use)
     
     - Uses schema_theory
-    - Uses viewer
+    - Uses viewer (imported on first use)
     - Uses scene
 """
 from __future__ import division
 import numpy as np
-import matplotlib.pyplot as plt
 import random
 
 import networkx as nx
 
 from schema_theory import KNOWLEDGE_SCHEMA, SCHEMA_INST, SYSTEM_SCHEMA, LTM, WM
-import viewer
 
 seed = None
 random.seed(seed)
@@ -90,12 +88,15 @@ class AREA(object):
     def set_BU_saliency(self, BU_saliency_map=None):
         """
         Sets the area saliency based on a BU saliency map
-        TO BE WRITTEN
+        
+        Args:
+            - BU_saliency_map (SALIENCY_DATA): Bottom-up saliency data (see saliency_itti and saliency_matlab). The saliency is the normalized mean saliency of the area.
+            If None, the saliency is set randomly.
         """
-        if not(BU_saliency_map):
+        if BU_saliency_map is None:
             self.saliency = random.random()
         else:
-            self.saliency = 0 # to be defined.
+            self.saliency = BU_saliency_map.area_saliency(self)
     
     @staticmethod
     def hull(area1, area2):
@@ -301,143 +302,308 @@ class PERCEPT_SCHEMA_INST(SCHEMA_INST):
 #################################
 ### PERCEPTUAL SYSTEM SCHEMAS ###
 #################################
-#class SALIENCY_MAP(SYSTEM_SCHEMA):
-#    """
-#    Data:
-#        - BU_saliency_map (array): BOTTOM-up saliency data generated by Itti-Koch matlab saliency toolbox.
-#        - params ({'IOR':{'radius':INT, ' decay': FLOAT, 'max': INT})
-#            - radius (INT): radius of the inhibition of return mask
-#            - decay (FLOAT): decay value for inhibition of return
-#            - max (INT): Max number of IORmaks that can be maintained.
-#        - IOR_masks ([{'mask':ARRAY, 't':INT, 'fix':(INT, INT)}]): set of inhibition of return masks.
-#        - IOR_mask (ARRAY): Stores the combined IOR_masks
-#        - saliency_map (array): BU_saliency_map + inhibition of return
-#    """
-#    def __init__(self, name='Saliency_map'):
-#        SYSTEM_SCHEMA.__init__(self, name)
-#        self.add_port('IN', 'from_saccade_system') # For inhibition of return?
-#        self.add_port('IN', 'from_input')
-#        self.add_port('IN', 'from_visual_WM')
-#        self.add_port('OUT', 'to_saccade_system') 
-#        self.BU_saliency_map = None
-#        self.params['IOR'] = {'radius': 5, 'decay': 0.99, 'max': 5}
-#        self.IOR_masks = []
-#        self.IOR_mask = None
-#        self.saliency_map = None
-#    
-#    def process(self):
-#        """
-#        """
-#        cur_fixation = self.inputs['from_saccade_system']
-#        if cur_fixation != None:
-#            # Add inhibition of return mask
-#            self._IOR(cur_fixation)
-#            
-#        # Update all masks (decay + remove masks that are go beying memory capacity.)
-#        if len(self.IOR_masks) > self.params['IOR']['max']:
-#            self.IOR_masks.remove(self.IOR_masks[0])
-#        for mask in self.IOR_masks[:]:
-#                mask['t'] += 1
-#                mask['mask'] *= self.params['IOR']['decay']
-#        
-#        # Compute total inhibition of return mask
-#        self.IOR_mask = np.zeros(self.BU_saliency_map.shape)
-#        for mask in self.IOR_masks:
-#            self.IOR_mask += mask['mask']
-#        
-#        #Compute final saliency_map: BU_saliency - mask
-#        self.saliency_map = self.BU_saliency_map.copy() - self.IOR_mask        
-#        self.outputs['to_saccade_system'] =  self.saliency_map
-#    
-#    def _IOR(self, fixation):
-#        """
-#        Inhibition of return
-#        """
-#        ior_mask = {'mask': np.zeros(self.BU_saliency_map.shape), 't':0, 'fix':fixation}
-#        IOR_radius = self.params['IOR']['radius']
-#        boundaries=np.zeros((2,2))
-#        boundaries[0,0] = max(0,fixation[0]-IOR_radius)
-#        boundaries[0,1] = min(ior_mask['mask'].shape[0]-1, fixation[0]+IOR_radius)
-#        boundaries[1,0] = max(0,fixation[1]-IOR_radius)
-#        boundaries[1,1] = min(ior_mask['mask'].shape[1]-1, fixation[1]+IOR_radius)
-#        ior_mask['mask'][boundaries[0,0]:boundaries[0,1], boundaries[1,0]:boundaries[1,1]] = self.BU_saliency_map[boundaries[0,0]:boundaries[0,1], boundaries[1,0]:boundaries[1,1]]
-#        self.IOR_masks.append(ior_mask)
-#
-#class SACCADE_SYSTEM(SYSTEM_SCHEMA):
-#    """
-#    """
-#    def __init__(self, name='Saccade_system'):
-#        SYSTEM_SCHEMA.__init__(self, name)
-#        self.add_port('IN', 'from_saliency_map')
-#        self.add_port('OUT', 'to_fixation')
-#        self.add_port('OUT', 'to_saliency_map') # For inhibition of return
-#        self.eye_pos = None # Current  eye position (x,y)
-#        self.next_fixation = None # Next saccade coordinates (x,y)
-#    
-#    def process(self):
-#        """
-#        """
-#        saliency_map  = self.inputs['from_saliency_map']
-#        self.next_fixation = self._WTA(saliency_map)
-#        if self.next_fixation != self.eye_pos: #Updates next-saccedes if the result of the WTA differs from previously computed value.
-#            self.eye_pos = self.next_fixation
-#            self.outputs['to_fixation'] =  self.eye_pos
-#            self.outputs['to_saliency_map'] =  self.eye_pos
-#    
-#    def _WTA(self, saliency_map):
-#        """
-#        """
-#        if saliency_map != None:
-#            max_sal = saliency_map.max()
-#            max_idx = np.where(saliency_map==max_sal)
-#            num_res = len(max_idx[0])
-#            
-#            # Random tie breaker
-#            winner_idx = random.randint(0,num_res-1)
-#            coord = (float(max_idx[0][winner_idx]), float(max_idx[1][winner_idx]))
-#        else:
-#            coord = None
-#        return coord
-#    
-#    ####################
-#    ### JSON METHODS ###
-#    ####################
-#    def get_state(self):
-#        """
-#        """
-#        data = super(SACCADE_SYSTEM, self).get_state()
-#        data['eye_pos'] = self.eye_pos
-#        data['next_fixation'] = self.next_fixation
-#        return data
-#
-#class FIXATION(SYSTEM_SCHEMA):
-#    """
-#    CHANGE NAME TO FOCUS?
-#    """
-#    def __init__(self, name='Fixation'):
-#        SYSTEM_SCHEMA.__init__(self, name)
-#        self.add_port('IN', 'from_saccade_system')
-#        self.add_port('OUT', 'to_output')
-#        self.eye_pos = (0,0)
-#    
-#    def process(self):
-#        """
-#        """
-#        eye_pos = self.inputs['from_saccade_system']
-#        if eye_pos:
-#            self.eye_pos = eye_pos
-#    
-#    ####################
-#    ### JSON METHODS ###
-#    ####################
-#    def get_state(self):
-#        """
-#        """
-#        data = super(FIXATION, self).get_state() 
-#        data['eye_pos'] = self.eye_pos
+class SALIENCY_MAP(SYSTEM_SCHEMA):
+    """
+    Bottom-up saliency map with inhibition of return (IOR) and winner-take-all selection of the next fixation.
+    
+    Data:
+        - BU_saliency_map (ARRAY): BOTTOM-up saliency map (see saliency_itti and saliency_matlab).
+        - params ({'IOR':{'radius':INT, 'decay':FLOAT, 'max':INT, 'threshold':FLOAT}, 'WTA':{'tile_size':INT}})
+            - radius (INT): radius of the inhibition of return window (in saliency map cells).
+            - decay (FLOAT): decay value for inhibition of return (per time step).
+            - max (INT): Max number of IOR masks that can be maintained.
+            - threshold (FLOAT): IOR masks whose decay factor falls below threshold are removed.
+            - tile_size (INT): Size of the tiles used by the winner-take-all max structure.
+        - IOR_acc (ARRAY): Running IOR accumulator. The IOR mask is IOR_acc*IOR_scale.
+        - IOR_scale (FLOAT): Global decay factor of the accumulator (decay^t, renormalized when too small).
+        - IOR_masks ([{'window':(INT, INT, INT, INT), 'factor':FLOAT, 't':FLOAT, 'fix':(INT, INT)}]): Active masks. Each mask added BU_saliency_map[window]*factor to IOR_acc,
+        its current decay factor is factor*IOR_scale.
+        - tile_max (ARRAY): Max of the bottom-up saliency in each tile.
+        - tile_order ([(INT, INT)]): Tiles sorted by decreasing tile_max.
+        - tile_masks (ARRAY): Number of active IOR masks overlapping each tile.
+        - winner ((INT, INT)): Coordinates of the most salient location (after IOR).
+    
+    Notes:
+        - Adding or removing a mask only touches its window. The decay is applied to all the masks at once through IOR_scale.
+        - The saliency of the tiles that no mask overlaps is constant: the winner-take-all only recomputes the max of the inhibited tiles
+        and reads the best non inhibited tile from tile_order.
+    """
+    RENORM_SCALE = 1e-100
+    
+    def __init__(self, name='Saliency_map'):
+        SYSTEM_SCHEMA.__init__(self, name)
+        self.add_port('IN', 'from_saccade_system') # For inhibition of return
+        self.add_port('IN', 'from_input')
+        self.add_port('OUT', 'to_saccade_system')
+        self.params['IOR'] = {'radius': 5, 'decay': 0.99, 'max': 5, 'threshold': 1e-3}
+        self.params['WTA'] = {'tile_size': 8}
+        self.BU_saliency_map = None
+        self.IOR_acc = None
+        self.IOR_scale = 1.0
+        self.IOR_masks = []
+        self.tile_max = None
+        self.tile_order = []
+        self.tile_masks = None
+        self.winner = None
+    
+    def reset(self):
+        """
+        """
+        super(SALIENCY_MAP, self).reset()
+        self.BU_saliency_map = None
+        self.IOR_acc = None
+        self.IOR_scale = 1.0
+        self.IOR_masks = []
+        self.tile_max = None
+        self.tile_order = []
+        self.tile_masks = None
+        self.winner = None
+    
+    def process(self):
+        """
+        """
+        BU_saliency = self.inputs['from_input']
+        if BU_saliency is not None:
+            self.set_BU_saliency_map(BU_saliency)
+        if self.BU_saliency_map is None:
+            return
+        
+        self.decay_IOR()
+        cur_fixation = self.inputs['from_saccade_system']
+        if cur_fixation is not None:
+            self.add_IOR(cur_fixation)
+        
+        self.winner = self.WTA()
+        self.outputs['to_saccade_system'] = self.winner
+    
+    def set_BU_saliency_map(self, BU_saliency):
+        """
+        Sets the bottom-up saliency map (ARRAY or SALIENCY_DATA), clears the IOR and builds the tiles max structure.
+        """
+        if hasattr(BU_saliency, 'saliency_map'):
+            BU_saliency = BU_saliency.saliency_map.data
+        self.BU_saliency_map = np.array(BU_saliency, dtype=float)
+        self.IOR_acc = np.zeros(self.BU_saliency_map.shape)
+        self.IOR_scale = 1.0
+        self.IOR_masks = []
+        
+        size = self.params['WTA']['tile_size']
+        (rows, cols) = self.BU_saliency_map.shape
+        (tile_rows, tile_cols) = (-(-rows//size), -(-cols//size))
+        padded = np.full((tile_rows*size, tile_cols*size), -np.inf)
+        padded[:rows, :cols] = self.BU_saliency_map
+        self.tile_max = padded.reshape(tile_rows, size, tile_cols, size).max(axis=(1, 3))
+        order = np.argsort(-self.tile_max, axis=None, kind='mergesort')
+        self.tile_order = [divmod(int(i), tile_cols) for i in order]
+        self.tile_masks = np.zeros((tile_rows, tile_cols), dtype=int)
+    
+    ############################
+    ### INHIBITION OF RETURN ###
+    ############################
+    def decay_IOR(self):
+        """
+        Applies one time step of decay to all the IOR masks, and removes the masks that decayed below threshold.
+        """
+        self.IOR_scale *= self.params['IOR']['decay']
+        threshold = self.params['IOR']['threshold']
+        for mask in [m for m in self.IOR_masks if m['factor']*self.IOR_scale < threshold]:
+            self.remove_IOR(mask)
+        if self.IOR_scale < SALIENCY_MAP.RENORM_SCALE:
+            self.IOR_acc *= self.IOR_scale
+            for mask in self.IOR_masks:
+                mask['factor'] *= self.IOR_scale
+            self.IOR_scale = 1.0
+    
+    def add_IOR(self, fixation):
+        """
+        Inhibition of return: adds the bottom-up saliency of the window around fixation ((INT, INT) map coordinates) to the IOR.
+        The oldest mask is removed if more than params['IOR']['max'] masks are active.
+        """
+        radius = self.params['IOR']['radius']
+        (rows, cols) = self.BU_saliency_map.shape
+        (x, y) = (int(fixation[0]), int(fixation[1]))
+        window = (max(0, x - radius), min(rows, x + radius + 1), max(0, y - radius), min(cols, y + radius + 1))
+        if window[0] >= window[1] or window[2] >= window[3]:
+            return
+        mask = {'window':window, 'factor':1.0/self.IOR_scale, 't':self.t, 'fix':(x, y)}
+        self.IOR_acc[window[0]:window[1], window[2]:window[3]] += self.BU_saliency_map[window[0]:window[1], window[2]:window[3]]*mask['factor']
+        self.IOR_masks.append(mask)
+        self._update_tile_masks(window, 1)
+        if len(self.IOR_masks) > self.params['IOR']['max']:
+            self.remove_IOR(self.IOR_masks[0])
+    
+    def remove_IOR(self, mask):
+        """
+        Removes the contribution of the IOR mask from the accumulator.
+        """
+        (r0, r1, c0, c1) = mask['window']
+        acc = self.IOR_acc[r0:r1, c0:c1]
+        acc -= self.BU_saliency_map[r0:r1, c0:c1]*mask['factor']
+        self.IOR_masks.remove(mask)
+        np.maximum(acc, 0, out=acc) # Rounding errors.
+        self._update_tile_masks(mask['window'], -1)
+    
+    def _update_tile_masks(self, window, inc):
+        """
+        Adds inc (INT) to the mask counts of the tiles overlapping window.
+        """
+        size = self.params['WTA']['tile_size']
+        (r0, r1, c0, c1) = window
+        self.tile_masks[r0//size:(r1 - 1)//size + 1, c0//size:(c1 - 1)//size + 1] += inc
+        if inc < 0:
+            # Tiles no longer inhibited are cleared exactly.
+            for (i, j) in zip(*np.nonzero(self.tile_masks[r0//size:(r1 - 1)//size + 1, c0//size:(c1 - 1)//size + 1] == 0)):
+                (ti, tj) = (i + r0//size, j + c0//size)
+                self.IOR_acc[ti*size:(ti + 1)*size, tj*size:(tj + 1)*size] = 0
+    
+    def IOR_mask(self):
+        """
+        Returns the current IOR mask (ARRAY).
+        """
+        if self.IOR_acc is None:
+            return None
+        return self.IOR_acc*self.IOR_scale
+    
+    def saliency_map(self):
+        """
+        Returns the current saliency map (ARRAY): BU_saliency_map - IOR mask.
+        """
+        if self.BU_saliency_map is None:
+            return None
+        return self.BU_saliency_map - self.IOR_acc*self.IOR_scale
+    
+    #######################
+    ### WINNER TAKE ALL ###
+    #######################
+    def WTA(self):
+        """
+        Returns the coordinates (INT, INT) of the most salient location of the saliency map (ties are broken by tile index, then by position in the tile).
+        Only the tiles overlapped by IOR masks are scanned, the best other tile is read from tile_order.
+        """
+        size = self.params['WTA']['tile_size']
+        best = None
+        for tile in self.tile_order:
+            if not(self.tile_masks[tile]):
+                best = (self.tile_max[tile], tile, None)
+                break
+        for tile in zip(*np.nonzero(self.tile_masks)):
+            if best and self.tile_max[tile] < best[0]:
+                continue # IOR only lowers saliency.
+            (r0, c0) = (tile[0]*size, tile[1]*size)
+            values = self.BU_saliency_map[r0:r0 + size, c0:c0 + size] - self.IOR_acc[r0:r0 + size, c0:c0 + size]*self.IOR_scale
+            idx = np.unravel_index(np.argmax(values), values.shape)
+            value = values[idx]
+            if not(best) or value > best[0] or (value == best[0] and tile < best[1]):
+                best = (value, tile, (r0 + idx[0], c0 + idx[1]))
+        if not(best):
+            return None
+        (value, tile, coord) = best
+        if coord is None:
+            (r0, c0) = (tile[0]*size, tile[1]*size)
+            values = self.BU_saliency_map[r0:r0 + size, c0:c0 + size]
+            idx = np.unravel_index(np.argmax(values), values.shape)
+            coord = (r0 + idx[0], c0 + idx[1])
+        return (int(coord[0]), int(coord[1]))
+    
+    ####################
+    ### JSON METHODS ###
+    ####################
+    def get_state(self):
+        """
+        """
+        data = super(SALIENCY_MAP, self).get_state()
+        data['winner'] = self.winner
+        data['IOR_masks'] = [m['fix'] for m in self.IOR_masks]
+        return data
+
+class SACCADE_SYSTEM(SYSTEM_SCHEMA):
+    """
+    Moves the eyes to the winner of the saliency map.
+    
+    Data:
+        - eye_pos ((INT, INT)): Current eye position.
+        - next_fixation ((INT, INT)): Next saccade coordinates.
+    """
+    def __init__(self, name='Saccade_system'):
+        SYSTEM_SCHEMA.__init__(self, name)
+        self.add_port('IN', 'from_saliency_map')
+        self.add_port('OUT', 'to_fixation')
+        self.add_port('OUT', 'to_saliency_map') # For inhibition of return
+        self.eye_pos = None
+        self.next_fixation = None
+    
+    def reset(self):
+        """
+        """
+        super(SACCADE_SYSTEM, self).reset()
+        self.eye_pos = None
+        self.next_fixation = None
+    
+    def process(self):
+        """
+        """
+        self.next_fixation = self.inputs['from_saliency_map']
+        if self.next_fixation is not None and self.next_fixation != self.eye_pos: # Saccade only if the winner differs from the current eye position.
+            self.eye_pos = self.next_fixation
+            self.outputs['to_fixation'] =  self.eye_pos
+            self.outputs['to_saliency_map'] =  self.eye_pos
+    
+    ####################
+    ### JSON METHODS ###
+    ####################
+    def get_state(self):
+        """
+        """
+        data = super(SACCADE_SYSTEM, self).get_state()
+        data['eye_pos'] = self.eye_pos
+        data['next_fixation'] = self.next_fixation
+        return data
+
+class FIXATION(SYSTEM_SCHEMA):
+    """
+    CHANGE NAME TO FOCUS?
+    """
+    def __init__(self, name='Fixation'):
+        SYSTEM_SCHEMA.__init__(self, name)
+        self.add_port('IN', 'from_saccade_system')
+        self.add_port('OUT', 'to_output')
+        self.eye_pos = (0,0)
+    
+    def reset(self):
+        """
+        """
+        super(FIXATION, self).reset()
+        self.eye_pos = (0,0)
+    
+    def process(self):
+        """
+        """
+        eye_pos = self.inputs['from_saccade_system']
+        if eye_pos:
+            self.eye_pos = eye_pos
+            self.outputs['to_output'] = eye_pos
+    
+    ####################
+    ### JSON METHODS ###
+    ####################
+    def get_state(self):
+        """
+        """
+        data = super(FIXATION, self).get_state() 
+        data['eye_pos'] = self.eye_pos
+        return data
         
 class VISUAL_WM(WM):
     """
+    Data:
+        - SceneRep (DiGraph): The scene representation. Nodes and edges carry the percept instance, the percept, and a 'new' flag (reset by the CONCEPTUALIZER).
+        - version (INT): Number of SceneRep deltas published.
+        - delta (DICT): Changes since the last published delta (see update_SceneRep()).
+    
+    Notes:
+        - Only the SceneRep changes are sent to the conceptualizer, as a delta {'version':INT, 'SceneRep':DiGraph, 'nodes':[STR], 'edges':[(STR,STR)], 'removed':[STR]}
+        listing the nodes and edges added and the names of the percept instances pruned from the WM (they are kept in the SceneRep).
+        No delta is sent if nothing changed. The version lets the receiver detect that it missed a delta.
     """
     def __init__(self, name='Visual_WM'):
         WM.__init__(self, name)
@@ -450,12 +616,20 @@ class VISUAL_WM(WM):
         self.params['dyn'] = {'tau':1000.0, 'int_weight':1.0, 'ext_weight':1.0, 'act_rest':0.001, 'k':10.0, 'noise_mean':0.0, 'noise_std':0.0}
         self.params['C2'] = {'coop_weight':0.0, 'comp_weight':0.0, 'prune_threshold':0.01, 'confidence_threshold':0.0, 'coop_asymmetry':1, 'comp_asymmetry':0, 'max_capacity':None, 'P_comp':1.0, 'P_coop':1.0} # C2 is not implemented in this WM.
         self.SceneRep = nx.DiGraph()
+        self.version = 0
+        self.delta = VISUAL_WM._create_delta()
     
     def reset(self):
         """
         """
         super(VISUAL_WM, self).reset()
         self.SceneRep = nx.DiGraph()
+        self.version = 0
+        self.delta = VISUAL_WM._create_delta()
+    
+    @staticmethod
+    def _create_delta():
+        return {'nodes':[], 'edges':[], 'removed':[]}
         
     def process(self):
         """
@@ -472,7 +646,7 @@ class VISUAL_WM(WM):
             self.update_SceneRep(new_insts)
         self.update_activations()
         self.prune()
-        self.outputs['to_conceptualizer'] =  self.SceneRep
+        self.outputs['to_conceptualizer'] =  self.publish_delta()
         
         missing_info = self.inputs['from_semantic_WM']
         self.outputs['to_subscene_rec'] = missing_info # For now just passing the message.
@@ -480,6 +654,7 @@ class VISUAL_WM(WM):
     def update_SceneRep(self, per_insts):
         """
         Updates the SceneRep: Adds the nodes and edges needed based on the receivd percept instances.
+        The added nodes and edges are recorded in the delta.
         
         NOTE:
             - Does not handle the case of percept instance updating.
@@ -487,20 +662,49 @@ class VISUAL_WM(WM):
         """
         # Add new instances
         if per_insts:
+            rel_insts = []
             # First process all the instances that are not relations.
-            for inst in [i for i in per_insts if not(isinstance(i.trace, PERCEPT_SCHEMA_REL))]:
+            for inst in per_insts:
+                if isinstance(inst.trace, PERCEPT_SCHEMA_REL):
+                    rel_insts.append(inst)
+                    continue
                 area_center = inst.content['area'].center()
                 node_pos = (area_center[1], -1*area_center[0])
                 self.SceneRep.add_node(inst.name, pos=node_pos, per_inst=inst, percept=inst.content['percept'], new=True)
+                self.delta['nodes'].append(inst.name)
             
             # Then add the relations
-            for rel_inst in [i for i in per_insts if isinstance(i.trace, PERCEPT_SCHEMA_REL)]:
+            for rel_inst in rel_insts:
                 node_from = rel_inst.content['pFrom'].name
                 node_to = rel_inst.content['pTo'].name
                 self.SceneRep.add_edge(node_from, node_to, per_inst=rel_inst, percept=rel_inst.content['percept'],  new=True)
+                self.delta['edges'].append((node_from, node_to))
+    
+    def prune(self):
+        """
+        Removes from WM all the dead instances, and records them in the delta.
+        """
+        for inst in self.schema_insts:
+            if not inst.alive:
+                self.remove_instance(inst)
+                self.delta['removed'].append(inst.name)
+    
+    def publish_delta(self):
+        """
+        Returns the delta of the SceneRep changes since the last call (None if nothing changed), and starts a new one.
+        """
+        delta = self.delta
+        if not(delta['nodes'] or delta['edges'] or delta['removed']):
+            return None
+        self.version += 1
+        delta['version'] = self.version
+        delta['SceneRep'] = self.SceneRep
+        self.delta = VISUAL_WM._create_delta()
+        return delta
         
     
     def show_SceneRep(self):
+        import matplotlib.pyplot as plt
         node_labels = dict((n, '%s(%.1f)' %(n, d['per_inst'].activity)) for n,d in self.SceneRep.nodes(data=True))
         edge_labels = dict(((u,v), '%s(%.1f)' %(d['percept'].name, d['per_inst'].activity)) for u,v,d in self.SceneRep.edges(data=True))
 #        pos = nx.spring_layout(self.SceneRep) # uses a spring layout.
@@ -521,6 +725,25 @@ class PERCEPT_LTM(LTM):
         self.add_port('OUT', 'to_subscene_rec')
         self.perceptual_knowledge = None
         self.params['init_act'] = 0.5
+        self.percept_index = {}
+    
+    def add_schema(self, schema):
+        """
+        Adds schema to the LTM and indexes it by the name of its percept.
+        """
+        super(PERCEPT_LTM, self).add_schema(schema)
+        self.percept_index[schema.content['percept'].name] = schema
+    
+    def find_per_schema(self, percept_name):
+        """
+        Returns the perceptual schema associated with the percept named percept_name (STR), None if no such schema exists.
+        """
+        return self.percept_index.get(percept_name, None)
+    
+    def shared_content(self):
+        """
+        """
+        return super(PERCEPT_LTM, self).shared_content() + [self.perceptual_knowledge, self.percept_index]
     
     def initialize(self, per_knowledge):
         """
@@ -600,9 +823,10 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
         - next_saccade (BOOL): True ->  Triggers next saccade when the perception of the subscene is done. Else False.
         - eye_pos ((FLOAT, FLOAT)): Current eye position
         - focus_area (AREA): Current focus area. None -> no specific focus area.
+        - verbose (INT): 0 -> no output printed.
         
     """
-    def __init__(self, name='Subscene_recognition'):
+    def __init__(self, name='Subscene_recognition', verbose=1):
         SYSTEM_SCHEMA.__init__(self, name)
         self.add_port('IN', 'from_input')
         self.add_port('IN', 'from_visual_WM')
@@ -615,6 +839,7 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
         self.next_saccade = False 
         self.eye_pos = (0,0)
         self.focus_area = None
+        self.verbose = verbose
     
     def reset(self):
         """
@@ -624,9 +849,25 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
         self.uncertainty = 0
         self.next_saccade = False 
         # Initialize eye_pos to center of scene.
-        self.eye_pos = (self.scene.width/2, self.scene.height/2)
+        self.eye_pos = (self.scene.width/2, self.scene.height/2) if self.scene else (0,0)
         self.focus_area = None
-          
+    
+    def idle(self):
+        """
+        Idle while the recognition of the current subscene is counting down, as long as no input is received.
+        A timer is set for the end of the countdown (see process()).
+        """
+        if not(self.subscene) or self.next_saccade or self.pending_inputs():
+            return False
+        return self.uncertainty >= 1
+    
+    def skip_to(self, t):
+        """
+        The uncertainty countdown goes on during the skipped ticks.
+        """
+        if self.subscene:
+            self.uncertainty -= int(round((t - self.t)/self.dt))
+        super(SUBSCENE_RECOGNITION, self).skip_to(t)
     
     def process(self):
         """
@@ -638,7 +879,7 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
             self.next_saccade = True
 
         # Start saccade and subscene recognition process        
-        output = {'eye_pos':None, 'focus_area':None, 'subscene':None, 'saliency':None, 'next_saccade':None, 'uncertainty':None}
+        output = {'eye_pos':None, 'focus_area':None, 'subscene':None, 'saliency':None, 'next_saccade':None, 'uncertainty':None, 'TD_request':None}
         if self.next_saccade:
             self.get_subscene()
             self.next_saccade = False
@@ -648,10 +889,12 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
                 output['subscene'] = {'name':self.subscene.name, 'radius': self.subscene.area.radius()}
                 output['saliency'] = self.subscene.saliency
                 output['focus_area'] = (self.focus_area.center(), self.focus_area.radius()) if self.focus_area else None
-                print "Perceiving subscene: %s (saliency: %.2f)" %(self.subscene.name, self.subscene.saliency)
-                print "Eye pos: (%.1f,%.1f)" %(self.eye_pos[0], self.eye_pos[1])
+                if self.verbose > 0:
+                    print "Perceiving subscene: %s (saliency: %.2f)" %(self.subscene.name, self.subscene.saliency)
+                    print "Eye pos: (%.1f,%.1f)" %(self.eye_pos[0], self.eye_pos[1])
                 self.uncertainty = self.subscene.uncertainty*self.params['recognition_time']
                 output['uncertainty'] = self.uncertainty
+                self.set_timer(self.t + self.uncertainty) # Time at which the countdown ends.
         
         if self.subscene:
             self.uncertainty -= 1
@@ -659,13 +902,14 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
             if self.uncertainty <0:
                 self.next_saccade = True
                 output['next_saccade'] = self.t
-                print 't: %i, trigger next saccade' % self.t
+                if self.verbose > 0:
+                    print 't: %i, trigger next saccade' % self.t
                 self.outputs['to_visual_WM'] =  {'subscene':self.subscene, 'init_act':self.subscene.saliency}
                 self.subscene.saliency = - 1 # THIS NEEDS TO BE CHANGED!! 
                 self.subscene = None
         
         # TD guidance
-        self.TD_guidance()
+        output['TD_request'] = self.TD_guidance(verbose=self.verbose)
         
         self.outputs['to_output'] =  output
 
@@ -673,15 +917,19 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
         """
         Get the subscene in focus with highest saliency that hasn't yet been processed.
         Sets the eye position to the center of the subscene area.
+        Without focus area, the most salient subscene is read from the scene saliency queue.
         """
-        max_saliency = 0
         new_ss = self.subscene
-        in_focus_ss = self.in_focus()
+        best_ss = None
+        if self.focus_area:
+            in_focus_ss = self.in_focus()
+            if self.focus_area:
+                best_ss = max(in_focus_ss, key=self.scene.saliency_key)
+        if not(self.focus_area):
+            best_ss = self.scene.most_salient()
         
-        for ss in in_focus_ss:
-            if ss.saliency > max_saliency:
-                max_saliency = ss.saliency
-                new_ss = ss
+        if best_ss and best_ss.saliency > 0:
+            new_ss = best_ss
 
         self.subscene = new_ss
 #        ############ Test of strategy of zoom-in first. #############
@@ -697,28 +945,26 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
         
         Notes:
             - The definition of what is "in focus" is incorrect
+            - Uses the scene spatial index (see SCENE.in_area()).
         """
         in_focus_ss = []
-        candidates = [ss for ss in self.scene.subscenes]
         
         if self.focus_area:
-            for ss in candidates:
-#                if ss.area != self.focus_area and self.focus_area.includes(ss.area):
-                if self.focus_area.includes(ss.area):
-                    in_focus_ss.append(ss)
-                    
+            in_focus_ss = self.scene.in_area(self.focus_area)
             if not(in_focus_ss): # No subscene in focus
                 self.focus_area = None
         
         if not(self.focus_area):
-            in_focus_ss = candidates
+            in_focus_ss = [ss for ss in self.scene.subscenes]
         
         return in_focus_ss
     
     def TD_guidance(self, verbose=1):
         """
+        Returns the TD request received ({'name':STR, 'area':((x,y), r)}), None if no request was received.
         """
         percept_schema_inst = self.inputs['from_visual_WM']
+        request = None
         if percept_schema_inst:
             self.focus_area = percept_schema_inst.content['area'] # Modify focus area
             if verbose>0 and self.focus_area:
@@ -731,6 +977,10 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
             in_focus_ss = self.in_focus()
             for ss in in_focus_ss:
                 ss.saliency = 1 # Boosts the saliency of all the subscenes in focus.
+            
+            request = {'name':percept_schema_inst.name, 'area':(self.focus_area.center(), self.focus_area.radius()) if self.focus_area else None}
+        
+        return request
         
     #######################
     ### DISPLAY METHODS ###
@@ -738,6 +988,7 @@ class SUBSCENE_RECOGNITION(SYSTEM_SCHEMA):
     def show_scene(self, img_file):
         """
         """
+        import viewer
         if self.scene:
             viewer.TCG_VIEWER.display_scene(self.scene, img_file)
     
@@ -791,7 +1042,6 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
         """
         """
         super(SCENE_PERCEPTION, self).reset()
-        self.params = {'recognition_time':10}
         self.scene = None
         self.current_subscene = None
         self.next_saccade = False
@@ -807,7 +1057,7 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
             self.next_saccade = True
         
         # Start saccade and subscene recognition process        
-        output = {'focus':None, 'subscene':None, 'saliency':None, 'next_saccade':None, 'uncertainty':None}
+        output = {'focus':None, 'subscene':None, 'saliency':None, 'next_saccade':None, 'uncertainty':None, 'TD_request':None}
         if self.next_saccade:
             self.get_subscene()
             self.next_saccade = False
@@ -834,7 +1084,7 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
                 self.subscene = None
         
         # TD guidance
-        self.TD_guidance()
+        output['TD_request'] = self.TD_guidance()
         
         self.outputs['to_output'] =  output
         
@@ -842,10 +1092,15 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
     def get_subscene(self):
         """
         Get the subscene in focus with highest saliency that hasn't yet been processed.
+        Without focus, the most salient subscene is read from the scene saliency queue.
         """
         max_saliency = 0
         new_ss = self.subscene
-        in_focus_ss = self.in_focus()
+        if self.focus:
+            in_focus_ss = self.in_focus()
+        else:
+            most_salient = self.scene.most_salient()
+            in_focus_ss = [most_salient] if most_salient else []
         
         for ss in in_focus_ss:
             saliency = self.scene.get_saliency(ss) 
@@ -876,8 +1131,10 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
     
     def TD_guidance(self):
         """
+        Returns the TD request received ({'name':STR, 'subscene':STR}), None if no request was received.
         """
         cpt_schema_inst_name = self.inputs['from_semantic_WM']
+        request = None
         if cpt_schema_inst_name:
             if self.verbose >0:
                 print "t:%i, requesting more information about %s." %(self.t, cpt_schema_inst_name)
@@ -887,6 +1144,9 @@ class SCENE_PERCEPTION(SYSTEM_SCHEMA):
                 print "t:%i, TD focus orientation to %s" %(self.t, self.focus)
             
             self.next_saccade = True # Even if the retrieval of the current subscene is not over, it retriggers saccade.
+            request = {'name':cpt_schema_inst_name, 'subscene':self.focus}
+        
+        return request
     
 #            in_focus_ss = self.in_focus()
 #            for ss in in_focus_ss:
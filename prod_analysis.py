@@ -9,30 +9,21 @@ import numpy as np
 
 #########################################
 ### GRAMMATICAL WM OUTPUTS PROCESSING ###
-def tree_data(assemblage, insts_used):
+def tree_data(record):
     """
-    Given an cxn_assemblage(Tree),  and the instances usedreturns the number of inner_nodes and outter_nodes (leaves)
+    Given a production record (see GRAMMATICAL_WM_P.production_record()), returns the outter_nodes (leaves) and inner_nodes of the cxn_assemblage (Tree)
+    restricted to the instances used.
     
     Args:
-        assemblage (ASSEMBLAGE): A CXN assemblage.
+        record (DICT): A production record.
     """
-    nodes = assemblage.schema_insts[:]
-    edges = assemblage.coop_links[:]
+    targets = set(inst_to for (inst_from, inst_to) in record['tree']['edges'])
     
     # compute outter nodes and inner node set
     outter_nodes = []
     inner_nodes = []
-    
-    while nodes:
-        n = nodes.pop()
-        inner = False
-        if not(n in insts_used):
-            continue
-        for e in edges:
-            if e.inst_to == n:
-                inner = True
-                break
-        if inner:
+    for n in record['tree']['nodes']:
+        if n in targets:
             inner_nodes.append(n)
         else:
             outter_nodes.append(n)
@@ -41,12 +32,12 @@ def tree_data(assemblage, insts_used):
 
 def syntactic_complexity(data):
     """
-    Given an the assemblage_out data state of a GRAMMATICAL_WM_P schema,
+    Given a list of production records of a GRAMMATICAL_WM_P schema,
     Returns the list of tree_data() applied to each output cxn_assemblage.
     """
     syn_complexity = {'nodes':[], 'inner_nodes':[]}
     for dat in data:
-        (outter_nodes, inner_nodes) = tree_data(dat['assemblage'], dat['insts_used'])
+        (outter_nodes, inner_nodes) = tree_data(dat)
         syn_complexity['nodes'].append(len(outter_nodes) + len(inner_nodes))
         syn_complexity['inner_nodes'].append(len(inner_nodes))
     return syn_complexity
@@ -54,15 +45,13 @@ def syntactic_complexity(data):
             
 def cxn_usage_count(data):
     """
-    Given an the assemblage_out data state of a GRAMMATICAL_WM_P schema,
+    Given a list of production records of a GRAMMATICAL_WM_P schema,
     Returns
         - a count of how many time each cxn type has been used.
     """
     cxn_usage = {}
     for d in data:
-        cxn_insts = [inst for inst in d['assemblage'].schema_insts if inst in d['insts_used']]
-        for inst in cxn_insts:
-            cxn_name = inst.content.name
+        for cxn_name in d['cxns']:
             if cxn_usage.has_key(cxn_name):
                 cxn_usage[cxn_name] += 1
             else:
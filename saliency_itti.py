@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Victor Barres
+
+Computes the Itti-Koch bottom-up saliency of scene images (replaces the offline Matlab SaliencyToolbox step, see saliency_matlab).
+
+The saliency data is returned as a saliency_matlab.SALIENCY_DATA, with the same structure as the one loaded from the .mat files:
+    - Dyadic gaussian pyramids for the intensity (I), color opponency (RG, BY) and orientation (gabor filters on I) channels.
+    - Center-surround feature maps |center - surround| for the center levels minLevel..maxLevel and the deltas minDelta..maxDelta.
+    - Conspicuity maps: normalized sums of the normalized feature maps of each feature.
+    - Saliency map: weighted sum of the normalized conspicuity maps, at the map level mapLevel, scaled to smOutputRange.
+
+References:
+    - Itti, Koch & Niebur (1998). A model of saliency-based visual attention for rapid scene analysis.
+    - Itti & Koch (2001). Feature combination strategies for saliency-based visual attention systems.
+    - Walther & Koch (2006). Modeling attention to salient proto-objects.
+
+Uses numpy and scipy.ndimage. Uses matplotlib.image to read the images.
+"""
+from __future__ import division
+import os
+import numpy as np
+from scipy import ndimage
+
+from saliency_matlab import SALIENCY_PARAMS, SALIENCY_DATA, SALIENCY_MAP, CONSPICUITY_MAP, ORIG_IMAGE, PYRAMID, PYRAMID_LEVEL, SALIENCY_FEATURE_DATA
+
+class ITTI_KOCH_SALIENCY(object):
+    """
+    Itti-Koch bottom-up saliency.
+
+    Data:
+        - params (SALIENCY_PARAMS): Uses features, weights, levelParams, normtype ('Iterative', 'LocalMax' or 'None'), numIter,
+        gaborParams, oriAngles and smOutputRange.
+
+    Notes:
+        - The pyramid levels are indexed from 1 (original image), as in the SaliencyToolbox.
+        - No noise is added to the maps (useRandom, noiseAmpl and noiseConst are ignored) so that the saliency data is deterministic.
+    """
+    PYR_FILTER = np.array([1, 4, 6, 4, 1])/16
+    EXCIT_SIG = 0.02 # Iterative normalization: excitation and inhibition widths (fraction of the map size) and coefficients.
+    INHIB_SIG = 0.25
+    EXCIT_CO = 0.5
+    INHIB_CO = 1.5
+    GLOBAL_INHIB = 0.02
+
+    def __init__(self, params=None):
+        self.params = params if params else SALIENCY_PARAMS()
+
+    def compute_file(self, file_name='scene.png', file_path='./'):
+        """
+        Computes and returns the SALIENCY_DATA of the image file_path/file_name.
+        """
+        img_file = os.path.join(file_path, file_name)
+        img = ITTI_KOCH_SALIENCY.load_image(img_file)
+        saliency_data = self.compute(img, img_name=file_name)
+        saliency_data.orig_image.fileName = img_file
+        return saliency_data
+
+    def compute(self, img, img_name=''):
+        """
+        Computes and returns the SALIENCY_DATA of the image img (ARRAY, rows x cols x 3 RGB values in [0,1]).
+        """
+        params = self.params
+        levels = params.levelParams
+        num_levels = levels['maxLevel'] + levels['maxDelta']
+
+        saliency_data = SALIENCY_DATA()
+        saliency_data.img_name = img_name
+        saliency_data.params = params
+        orig_image = ORIG_IMAGE()
+        orig_image.data = img
+        orig_image.type = 'RGB'
+        orig_image.size = list(img.shape[:2])
+        orig_image.dims = img.ndim
+        saliency_data.orig_image = orig_image
+
+        (r, g, b) = (img[:,:,0], img[:,:,1], img[:,:,2])
+        intensity = (r + g + b)/3
+
+        int_pyr = self.gaussian_pyramid(intensity, num_levels)
+        channels = {}
+        for feature in params.features:
+            if feature == 'Intensities':
+                channels[feature] = [('Intensity', int_pyr)]
+            elif feature == 'Color':
+                (rg, by) = ITTI_KOCH_SALIENCY.color_opponency(r, g, b)
+                channels[feature] = [('RG', self.gaussian_pyramid(rg, num_levels)), ('BY', self.gaussian_pyramid(by, num_levels))]
+            elif feature == 'Orientations':
+                channels[feature] = [('Gabor%i' %angle, self.gabor_pyramid(int_pyr, angle)) for angle in params.oriAngles]
+            else:
+                error_msg = "Unknown saliency feature %s" %feature
+                raise ValueError(error_msg)
+
+        map_shape = self.level_shape(img.shape[:2], levels['mapLevel'])
+        cs_levels = [(c, c + delta) for c in range(levels['minLevel'], levels['maxLevel'] + 1) for delta in range(levels['minDelta'], levels['maxDelta'] + 1)]
+
+        sal_map = np.zeros(map_shape)
+        for feature, weight in zip(params.features, params.weights):
+            feat_data = SALIENCY_FEATURE_DATA()
+            feat_data.label = feature
+            feat_data.csLevels = cs_levels
+            feat_data.FM = []
+            CM = np.zeros(map_shape)
+            for (label, pyr_levels) in channels[feature]:
+                pyr = PYRAMID()
+                pyr.label = label
+                pyr.type = params.pyramidType
+                for i, data in enumerate(pyr_levels):
+                    level = PYRAMID_LEVEL()
+                    level.label = '%s level %i' %(label, i + 1)
+                    level.data = data
+                    pyr.levels.append(level)
+                feat_data.pyramid.append(pyr)
+                for (c, s) in cs_levels:
+                    center = pyr_levels[c - 1]
+                    surround = ITTI_KOCH_SALIENCY.resize(pyr_levels[s - 1], center.shape)
+                    FM = ITTI_KOCH_SALIENCY.resize(np.abs(center - surround), map_shape)
+                    feat_data.FM.append(FM)
+                    CM += self.normalize(FM)
+            feat_data.CM = CONSPICUITY_MAP()
+            feat_data.CM.label = feature
+            feat_data.CM.data = self.normalize(CM)
+            saliency_data.feature_data.append(feat_data)
+            sal_map += weight*feat_data.CM.data
+
+        sal_map = self.normalize(sal_map/sum(params.weights))
+        if sal_map.max() > 0:
+            sal_map *= params.smOutputRange/sal_map.max()
+        saliency_data.saliency_map = SALIENCY_MAP()
+        saliency_data.saliency_map.data = sal_map
+        return saliency_data
+
+    ################
+    ### PYRAMIDS ###
+    ################
+    @staticmethod
+    def load_image(img_file):
+        """
+        Reads img_file and returns the RGB image as a float ARRAY with values in [0,1].
+        """
+        import matplotlib.image as mpimg
+        img = np.asarray(mpimg.imread(img_file), dtype=float)
+        if img.max() > 1:
+            img = img/255
+        if img.ndim == 2:
+            img = np.dstack([img, img, img])
+        return img[:,:,:3]
+
+    @staticmethod
+    def color_opponency(r, g, b):
+        """
+        Returns the red-green and blue-yellow opponency maps (Walther & Koch 2006), set to 0 where the image is too dark (max(r,g,b) < 0.1).
+        """
+        lum = np.maximum(np.maximum(r, g), b)
+        dark = lum < 0.1
+        lum[dark] = 1
+        rg = (r - g)/lum
+        by = (b - np.minimum(r, g))/lum
+        rg[dark] = 0
+        by[dark] = 0
+        return (rg, by)
+
+    @staticmethod
+    def level_shape(shape, level):
+        """
+        Returns the shape of the pyramid level (INT, level 1 is the original image) of an image of shape shape.
+        """
+        (rows, cols) = shape
+        for i in range(level - 1):
+            rows = max(1, (rows + 1)//2)
+            cols = max(1, (cols + 1)//2)
+        return (rows, cols)
+
+    def gaussian_pyramid(self, img, num_levels):
+        """
+        Returns the list of the num_levels levels of the dyadic gaussian pyramid of img (level 1 is img).
+        """
+        levels = [img]
+        for i in range(num_levels - 1):
+            blurred = ndimage.convolve1d(levels[-1], ITTI_KOCH_SALIENCY.PYR_FILTER, axis=0, mode='reflect')
+            blurred = ndimage.convolve1d(blurred, ITTI_KOCH_SALIENCY.PYR_FILTER, axis=1, mode='reflect')
+            levels.append(blurred[::2, ::2])
+        return levels
+
+    def gabor_kernels(self, angle):
+        """
+        Returns the zero mean gabor kernels ([ARRAY], one per phase) for the orientation angle (FLOAT, degrees).
+        """
+        gabor = self.params.gaborParams
+        half = gabor['filterSize']//2
+        (y, x) = np.mgrid[-half:half + 1, -half:half + 1]
+        theta = np.deg2rad(angle)
+        x_rot = x*np.cos(theta) + y*np.sin(theta)
+        y_rot = -x*np.sin(theta) + y*np.cos(theta)
+        envelope = np.exp(-(x_rot**2 + (gabor['elongation']*y_rot)**2)/(2*gabor['stddev']**2))
+        kernels = []
+        for phase in gabor['phases']:
+            kernel = envelope*np.cos(2*np.pi*x_rot/gabor['filterPeriod'] + np.deg2rad(phase))
+            kernel -= kernel.mean()
+            kernel /= np.abs(kernel).sum()
+            kernels.append(kernel)
+        return kernels
+
+    def gabor_pyramid(self, int_pyr, angle):
+        """
+        Returns the orientation pyramid for angle (FLOAT, degrees): energy of the gabor filters responses at each level of the intensity pyramid int_pyr.
+        """
+        kernels = self.gabor_kernels(angle)
+        return [sum(np.abs(ndimage.convolve(level, k, mode='reflect')) for k in kernels) for level in int_pyr]
+
+    ####################
+    ### MAPS METHODS ###
+    ####################
+    @staticmethod
+    def resize(img, shape):
+        """
+        Bilinear resampling of img (2D ARRAY) to shape (TUPLE).
+        """
+        for axis, n in enumerate(shape):
+            m = img.shape[axis]
+            if m == n:
+                continue
+            pos = np.clip((np.arange(n) + 0.5)*m/n - 0.5, 0, m - 1)
+            i0 = np.floor(pos).astype(int)
+            i1 = np.minimum(i0 + 1, m - 1)
+            w = pos - i0
+            if axis == 0:
+                w = w[:, np.newaxis]
+            img = np.take(img, i0, axis=axis)*(1 - w) + np.take(img, i1, axis=axis)*w
+        return img
+
+    def normalize(self, img):
+        """
+        Applies the normalization operator N(.) defined by params.normtype to img (2D ARRAY).
+            - 'Iterative': Itti & Koch (2001) iterative within-feature competition (difference of gaussians), map first scaled to [0,1].
+            - 'LocalMax': Itti et al. (1998), map scaled to [0,1] and multiplied by (1 - mean of the other local maxima)^2.
+            - 'None': map scaled to [0,1].
+        """
+        img = img - img.min()
+        img_max = img.max()
+        if img_max <= 0:
+            return np.zeros(img.shape)
+        img = img/img_max
+        normtype = self.params.normtype
+        if normtype == 'Iterative':
+            size = max(img.shape)
+            for i in range(int(self.params.numIter)):
+                excit = ndimage.gaussian_filter(img, ITTI_KOCH_SALIENCY.EXCIT_SIG*size, mode='constant')
+                inhib = ndimage.gaussian_filter(img, ITTI_KOCH_SALIENCY.INHIB_SIG*size, mode='constant')
+                img = np.maximum(img + ITTI_KOCH_SALIENCY.EXCIT_CO*excit - ITTI_KOCH_SALIENCY.INHIB_CO*inhib - ITTI_KOCH_SALIENCY.GLOBAL_INHIB, 0)
+            return img
+        elif normtype == 'LocalMax':
+            size = max(3, max(img.shape)//8)
+            peaks = (img == ndimage.maximum_filter(img, size=size, mode='constant')) & (img > 0) & (img < 1)
+            mean_max = img[peaks].mean() if peaks.any() else 0
+            return img*(1 - mean_max)**2
+        elif normtype == 'None':
+            return img
+        else:
+            error_msg = "Unknown saliency normalization %s" %normtype
+            raise ValueError(error_msg)
+
+###############################################################################
+if __name__ == '__main__':
+    saliency = ITTI_KOCH_SALIENCY()
+    saliency_data = saliency.compute_file('scene.png', './data/scenes/KC06_1_1/')
+    print saliency_data.saliency_map.data.shape
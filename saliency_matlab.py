@@ -5,11 +5,65 @@
 Defines the interface between the Matlab SaliencyToolbox and TCG
 
 Uses scipy.io to read .mat files.
+Uses numpy for the saliency map integral image.
 
 The matlab saliency toolbox should have already generated the .mat files containing bottom-up saliency information.
+
+The saliency data can be converted once into a folder of .npy files (one per array) described by a json manifest (see SALIENCY_DATA.save_npy()).
+Reloading from this folder is lazy: each array is memory-mapped from its .npy file only when first accessed (see SALIENCY_DATA.load_npy()).
 """
 from __future__ import division
-import scipy.io as sio
+import os
+import json
+import numpy as np
+
+def load_npy(npy_file):
+    """
+    Returns the array stored in npy_file, memory-mapped (read-only) unless it contains python objects.
+    """
+    try:
+        return np.load(npy_file, mmap_mode='r')
+    except ValueError:
+        return np.load(npy_file, allow_pickle=True)
+
+def to_json(value):
+    """
+    Returns value with the numpy arrays and scalars it contains converted to python lists and scalars.
+    """
+    if isinstance(value, np.ndarray):
+        return to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return dict([(k, to_json(v)) for k,v in value.iteritems()])
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
+
+class LAZY_ARRAYS(object):
+    """
+    Base class for the saliency data objects whose arrays can be memory-mapped on first access.
+    
+    Data:
+        - npy_files ({STR:STR}): Maps the array attributes that have not been accessed yet onto their .npy file (see set_npy()).
+    """
+    def __init__(self):
+        self.npy_files = {}
+    
+    def set_npy(self, attr, npy_file):
+        """
+        The array attribute attr (STR) will be loaded from npy_file (STR) when first accessed.
+        """
+        self.__dict__.pop(attr, None)
+        self.npy_files[attr] = npy_file
+    
+    def __getattr__(self, attr):
+        npy_files = self.__dict__.get('npy_files', {})
+        if attr in npy_files:
+            value = load_npy(npy_files.pop(attr))
+            setattr(self, attr, value)
+            return value
+        raise AttributeError(attr)
 
 class SALIENCY_PARAMS:
     """
@@ -59,7 +113,7 @@ class SALIENCY_PARAMS:
         self.visualizationStyle = 'Contour'
         self.exclusionMask =[]
 
-class ORIG_IMAGE:
+class ORIG_IMAGE(LAZY_ARRAYS):
     """
     Stores the original image information.
     Data:
@@ -70,13 +124,14 @@ class ORIG_IMAGE:
         - dims (INT)
     """
     def __init__(self):
+        LAZY_ARRAYS.__init__(self)
         self.fileName = None
         self.data = None
         self.type = None
         self.size = None
         self.dims = None
 
-class SALIENCY_MAP:
+class SALIENCY_MAP(LAZY_ARRAYS):
     """
     Stores the saliency map.
     Data:
@@ -84,26 +139,29 @@ class SALIENCY_MAP:
         - data (ARRAY)
     """
     def __init__(self):
+        LAZY_ARRAYS.__init__(self)
         self.label = 'SaliencyMap'
         self.data = None
 
-class CONSPICUITY_MAP:
+class CONSPICUITY_MAP(LAZY_ARRAYS):
     """
     Data:
         - label(STR)
         - data (ARRAY)
     """
     def __init__(self):
+        LAZY_ARRAYS.__init__(self)
         self.label = None
         self.data = None
 
-class PYRAMID_LEVEL:
+class PYRAMID_LEVEL(LAZY_ARRAYS):
     """
     Data:
         - label (STR)
         - data (ARRAY)
     """
     def __init__(self):
+        LAZY_ARRAYS.__init__(self)
         self.label = None
         self.data = None
 
@@ -119,7 +177,7 @@ class PYRAMID:
         self.type = None
         self.levels = []
 
-class SALIENCY_FEATURE_DATA:
+class SALIENCY_FEATURE_DATA(LAZY_ARRAYS):
     """
     Data:
         - label (STR)
@@ -129,6 +187,7 @@ class SALIENCY_FEATURE_DATA:
         - CM (CONSPICUITY_MAP)
     """
     def __init__(self):
+        LAZY_ARRAYS.__init__(self)
         self.label = None
         self.pyramid = []
         self.FM = []
@@ -143,6 +202,7 @@ class SALIENCY_DATA:
         - saliency_map (SALIENCY_MAP)
         - orig_image (ORIG_IMAGE)
         - params (SALIENCY_PARAMS)
+        - integral (ARRAY): Integral image of the saliency map (see area_saliency()). None until first needed.
     """
     def __init__(self):
         self.img_name = None
@@ -150,13 +210,166 @@ class SALIENCY_DATA:
         self.saliency_map = None
         self.orig_image = None
         self.params = None
-        
+        self.integral = None
+    
+    def build_integral(self):
+        """
+        Builds the integral image of the saliency map: integral[i,j] is the sum of the saliency map values over [0:i, 0:j].
+        """
+        sal_map = np.asarray(self.saliency_map.data, dtype=float)
+        self.integral = np.zeros((sal_map.shape[0] + 1, sal_map.shape[1] + 1))
+        self.integral[1:, 1:] = sal_map.cumsum(axis=0).cumsum(axis=1)
+    
+    def image_size(self):
+        """
+        Returns the (rows, cols) size of the original image.
+        """
+        if self.orig_image.size:
+            return tuple(self.orig_image.size[:2])
+        return np.shape(self.orig_image.data)[:2]
+    
+    def area_saliency(self, area, normalize=True):
+        """
+        Returns the mean saliency of the area (perceptual_schemas.AREA, in original image coordinates) in constant time, using the integral image.
+        If normalize is True, the value is divided by the saliency map maximum (to fall in [0,1]).
+        """
+        if self.integral is None:
+            self.build_integral()
+        (map_rows, map_cols) = (self.integral.shape[0] - 1, self.integral.shape[1] - 1)
+        (img_rows, img_cols) = self.image_size()
+        (row_scale, col_scale) = (map_rows/img_rows, map_cols/img_cols)
+        r0 = min(max(int(np.floor(area.x*row_scale)), 0), map_rows - 1)
+        c0 = min(max(int(np.floor(area.y*col_scale)), 0), map_cols - 1)
+        r1 = min(max(int(np.ceil((area.x + area.h)*row_scale)), r0 + 1), map_rows)
+        c1 = min(max(int(np.ceil((area.y + area.w)*col_scale)), c0 + 1), map_cols)
+        ii = self.integral
+        total = ii[r1, c1] - ii[r0, c1] - ii[r1, c0] + ii[r0, c0]
+        saliency = total/((r1 - r0)*(c1 - c0))
+        if normalize:
+            map_max = np.max(self.saliency_map.data)
+            saliency = saliency/map_max if map_max > 0 else 0
+        return saliency
+
 
+    #################
+    ### NPY CACHE ###
+    #################
+    MANIFEST = 'saliency.json'
+    
+    def save_npy(self, folder, key=None):
+        """
+        Saves the saliency data in folder (STR): one .npy file per array, described by the json manifest SALIENCY_DATA.MANIFEST.
+        The optional key (STR) is stored in the manifest (see load_npy()).
+        
+        Notes:
+            - The previous manifest is removed first and the new one is written last so that a partially written folder is never considered valid.
+            - Each array is written under a temporary name and then renamed (as in TCG_LOADER.cache_write()) so that a process that memory-mapped 
+            the previous version of a file keeps reading a complete file.
+        """
+        if not(os.path.isdir(folder)):
+            os.makedirs(folder)
+        manifest_file = os.path.join(folder, SALIENCY_DATA.MANIFEST)
+        if os.path.isfile(manifest_file):
+            os.remove(manifest_file)
+        
+        def save_array(name, array):
+            file_name = '%s.npy' %name
+            npy_file = os.path.join(folder, file_name)
+            tmp_file = '%s.%i.tmp' %(npy_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                np.save(f, np.asarray(array))
+            if os.path.isfile(npy_file):
+                os.remove(npy_file)
+            os.rename(tmp_file, npy_file)
+            return file_name
+        
+        manifest = {'key':key, 'img_name':self.img_name, 'params':to_json(vars(self.params)) if self.params else None}
+        manifest['saliency_map'] = {'label':self.saliency_map.label, 'data':save_array('saliency_map', self.saliency_map.data)}
+        orig_image = self.orig_image
+        manifest['orig_image'] = {'fileName':orig_image.fileName, 'type':orig_image.type, 'size':to_json(orig_image.size), 'dims':to_json(orig_image.dims), 
+                                   'data':save_array('orig_image', orig_image.data)}
+        manifest['feature_data'] = []
+        for i, feat_data in enumerate(self.feature_data):
+            feat = {'label':to_json(feat_data.label), 'csLevels':to_json(feat_data.csLevels), 'FM':save_array('FM_%i' %i, feat_data.FM),
+                    'CM':{'label':to_json(feat_data.CM.label), 'data':save_array('CM_%i' %i, feat_data.CM.data)}, 'pyramid':[]}
+            for j, pyr in enumerate(feat_data.pyramid):
+                levels = [{'label':to_json(level.label), 'data':save_array('pyr_%i_%i_%i' %(i, j, k), level.data)} for k, level in enumerate(pyr.levels)]
+                feat['pyramid'].append({'label':to_json(pyr.label), 'type':to_json(pyr.type), 'levels':levels})
+            manifest['feature_data'].append(feat)
+        
+        tmp_file = os.path.join(folder, '%s.%i.tmp' %(SALIENCY_DATA.MANIFEST, os.getpid()))
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+        if os.path.isfile(manifest_file):
+            os.remove(manifest_file)
+        os.rename(tmp_file, manifest_file)
+    
+    def load_npy(self, folder, key=None):
+        """
+        Loads the saliency data saved in folder (STR) by save_npy(). The arrays are only memory-mapped when first accessed.
+        Returns False if the folder has no manifest or if key (STR) does not match the manifest key (a None key is a cache miss, as in TCG_LOADER.cache_read()), True otherwise.
+        """
+        manifest_file = os.path.join(folder, SALIENCY_DATA.MANIFEST)
+        if not(os.path.isfile(manifest_file)):
+            return False
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if not(key) or manifest['key'] != key:
+            return False
+        
+        def npy(file_name):
+            return os.path.join(folder, file_name)
+        
+        self.img_name = manifest['img_name']
+        self.params = None
+        if manifest['params']:
+            self.params = SALIENCY_PARAMS()
+            self.params.__dict__.update(manifest['params'])
+        
+        self.saliency_map = SALIENCY_MAP()
+        self.saliency_map.label = manifest['saliency_map']['label']
+        self.saliency_map.set_npy('data', npy(manifest['saliency_map']['data']))
+        self.integral = None
+        
+        orig_image = manifest['orig_image']
+        self.orig_image = ORIG_IMAGE()
+        self.orig_image.fileName = orig_image['fileName']
+        self.orig_image.type = orig_image['type']
+        self.orig_image.size = orig_image['size']
+        self.orig_image.dims = orig_image['dims']
+        self.orig_image.set_npy('data', npy(orig_image['data']))
+        
+        self.feature_data = []
+        for feat in manifest['feature_data']:
+            feat_data = SALIENCY_FEATURE_DATA()
+            feat_data.label = feat['label']
+            feat_data.csLevels = feat['csLevels']
+            feat_data.set_npy('FM', npy(feat['FM']))
+            feat_data.CM = CONSPICUITY_MAP()
+            feat_data.CM.label = feat['CM']['label']
+            feat_data.CM.set_npy('data', npy(feat['CM']['data']))
+            for pyr in feat['pyramid']:
+                myPyr = PYRAMID()
+                myPyr.label = pyr['label']
+                myPyr.type = pyr['type']
+                for level in pyr['levels']:
+                    myLevel = PYRAMID_LEVEL()
+                    myLevel.label = level['label']
+                    myLevel.set_npy('data', npy(level['data']))
+                    myPyr.levels.append(myLevel)
+                feat_data.pyramid.append(myPyr)
+            self.feature_data.append(feat_data)
+        return True
+    
+    ###################
+    ### MAT LOADING ###
+    ###################
     def load(self, file_path):
         """
         Data:
             file_path (STR): path to the .mat file generated by TCG_saliency.m
         """
+        import scipy.io as sio
         mat_content= sio.loadmat(file_path, struct_as_record = False, squeeze_me=True)
         BU_saliency = mat_content['BU_saliency']
         
@@ -167,6 +380,7 @@ class SALIENCY_DATA:
         
         saliency_map = BU_saliency.sal_map
         self.saliency_map = self._load_saliency_map(saliency_map)
+        self.integral = None
         
         orig_image = BU_saliency.origImage
         self.orig_image = self._load_orig_image(orig_image)
@@ -228,6 +442,7 @@ class SALIENCY_DATA:
     def _load_feature_data(self, sal_data):
         """
         """
+        import scipy.io as sio
         myFeaturesData = []
         for feat in sal_data:
             feat_data = SALIENCY_FEATURE_DATA()
@@ -81,6 +81,7 @@ class SUB_SCENE(object):
         - anchor (PERCEPT_SCHEMA_INST): The perceptual anchor of the subscene. Should not be a relation.
         - uncertainty (INT): How uncertain is the perception of this region.
         - saliency (FLOAT):  Perceptual saliency of subscene
+        - scene (SCENE): The scene the subscene belongs to. Its saliency queue is updated when the saliency changes.
     """
     NEXT_ID = 0
     def __init__(self, name=''):
@@ -92,8 +93,19 @@ class SUB_SCENE(object):
         self.area = None
         self.anchor = None
         self.uncertainty = 0
+        self.scene = None
         self.saliency = 0
     
+    @property
+    def saliency(self):
+        return self._saliency
+    
+    @saliency.setter
+    def saliency(self, saliency):
+        self._saliency = saliency
+        if self.scene:
+            self.scene.update_saliency(self)
+    
     def add_per_schema(self, schema_inst, update_uncertainty=True):
         """
         Adds a percetual schema to the sub_scenes.
@@ -176,6 +188,132 @@ class SUB_SCENE(object):
         return data
         
 
+class SPATIAL_GRID(object):
+    """
+    Uniform grid index of objects located by a point.
+    
+    Data:
+        - cell_size (FLOAT)
+        - cells ({(INT, INT):[OBJ]}): Maps the grid cells onto the objects whose point falls in the cell.
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+    
+    def cell(self, point):
+        return (int(point[0]//self.cell_size), int(point[1]//self.cell_size))
+    
+    def insert(self, obj, point):
+        self.cells.setdefault(self.cell(point), []).append(obj)
+    
+    def query(self, x_min, x_max, y_min, y_max):
+        """
+        Returns the objects of the cells overlapping the box [x_min, x_max]x[y_min, y_max].
+        The objects whose point falls in the box are all returned, but some objects outside the box can be returned as well.
+        """
+        (i_min, j_min) = self.cell((x_min, y_min))
+        (i_max, j_max) = self.cell((x_max, y_max))
+        found = []
+        if (i_max - i_min + 1)*(j_max - j_min + 1) > len(self.cells):
+            for (i, j), objs in self.cells.iteritems():
+                if i_min <= i <= i_max and j_min <= j <= j_max:
+                    found.extend(objs)
+        else:
+            for i in range(i_min, i_max + 1):
+                for j in range(j_min, j_max + 1):
+                    found.extend(self.cells.get((i, j), []))
+        return found
+
+class SALIENCY_QUEUE(object):
+    """
+    Indexed binary max-heap: the priority of any element can be increased or decreased in O(log n).
+    
+    Data:
+        - heap ([OBJ]): The elements, in heap order.
+        - pos ({OBJ:INT}): Maps the elements onto their index in heap.
+        - priority ({OBJ:VALUE}): Maps the elements onto their priority.
+    """
+    def __init__(self):
+        self.heap = []
+        self.pos = {}
+        self.priority = {}
+    
+    def __len__(self):
+        return len(self.heap)
+    
+    def __contains__(self, obj):
+        return obj in self.pos
+    
+    def top(self):
+        """
+        Returns the element with the highest priority (None if the queue is empty).
+        """
+        return self.heap[0] if self.heap else None
+    
+    def push(self, obj, priority):
+        """
+        Adds obj with priority, or updates its priority if it is already in the queue.
+        """
+        if obj in self.pos:
+            self.update(obj, priority)
+            return
+        self.heap.append(obj)
+        self.pos[obj] = len(self.heap) - 1
+        self.priority[obj] = priority
+        self._sift_up(len(self.heap) - 1)
+    
+    def update(self, obj, priority):
+        """
+        Sets the priority of obj (increase or decrease key).
+        """
+        old_priority = self.priority[obj]
+        self.priority[obj] = priority
+        if priority > old_priority:
+            self._sift_up(self.pos[obj])
+        elif priority < old_priority:
+            self._sift_down(self.pos[obj])
+    
+    def remove(self, obj):
+        """
+        Removes obj from the queue.
+        """
+        i = self.pos.pop(obj)
+        del self.priority[obj]
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.pos[last] = i
+            self._sift_up(i)
+            self._sift_down(self.pos[last])
+    
+    def _swap(self, i, j):
+        heap = self.heap
+        (heap[i], heap[j]) = (heap[j], heap[i])
+        self.pos[heap[i]] = i
+        self.pos[heap[j]] = j
+    
+    def _sift_up(self, i):
+        priority = self.priority
+        while i > 0:
+            parent = (i - 1)//2
+            if priority[self.heap[i]] <= priority[self.heap[parent]]:
+                break
+            self._swap(i, parent)
+            i = parent
+    
+    def _sift_down(self, i):
+        priority = self.priority
+        n = len(self.heap)
+        while True:
+            largest = i
+            for child in (2*i + 1, 2*i + 2):
+                if child < n and priority[self.heap[child]] > priority[self.heap[largest]]:
+                    largest = child
+            if largest == i:
+                break
+            self._swap(i, largest)
+            i = largest
+
 class SCENE(object):
     """
     Scene being perceived.
@@ -185,13 +323,26 @@ class SCENE(object):
         - width, height (INT): Scene resolution
         - subscenes ([SUB_SCENE]): List of all subscenes associated with the scene.
         - schemas ([SCHEMA_INST]): List of perceptual schemas instances associated with the scene.
+        - subscene_index ({STR:SUB_SCENE}), schema_index ({STR:SCHEMA_INST}): Name indexes.
+        - order ({SUB_SCENE:INT}): Maps the subscenes onto their position in subscenes.
+        - grid (SPATIAL_GRID): Grid index of the subscenes by area center (see in_area()).
+        - saliency_queue (SALIENCY_QUEUE): The subscenes by decreasing saliency (ties broken by subscene order, see most_salient()).
+    
+    Notes:
+        - The indexes are maintained by add_subscene(). If the area of a subscene changes after it is added, build_index() has to be called.
     """
+    GRID_CELL_SIZE = 64
     
     def __init__(self):
         self.width = 0
         self.height = 0
         self.subscenes = []
         self.schemas = []
+        self.subscene_index = {}
+        self.schema_index = {}
+        self.order = {}
+        self.grid = SPATIAL_GRID(SCENE.GRID_CELL_SIZE)
+        self.saliency_queue = SALIENCY_QUEUE()
     
     def reset(self):
         """
@@ -201,24 +352,23 @@ class SCENE(object):
         self.height = 0
         self.subscenes = []
         self.schemas = []
+        self.subscene_index = {}
+        self.schema_index = {}
+        self.order = {}
+        self.grid = SPATIAL_GRID(SCENE.GRID_CELL_SIZE)
+        self.saliency_queue = SALIENCY_QUEUE()
 
     def find_schema(self, name):
         """
         Find schema with name 'name' (STR) in scene.
         """
-        for s in self.schemas:
-            if s.name == name:
-                return s
-        return None
+        return self.schema_index.get(name, None)
         
     def find_subscene(self, name):
         """
         Find subscene with name 'name' (STR) in scene.
         """
-        for ss in self.subscenes:
-            if ss.name == name:
-                return ss
-        return None
+        return self.subscene_index.get(name, None)
     
     def add_subscene(self, ss):
         """
@@ -234,10 +384,65 @@ class SCENE(object):
         
         # Add new schema
         self.subscenes.append(ss)
+        self.subscene_index[ss.name] = ss
         for schema_inst in ss.nodes + ss.edges:
             if not(self.find_schema(schema_inst.name)):
                 self.schemas.append(schema_inst)
+                self.schema_index[schema_inst.name] = schema_inst
+        self._index_subscene(ss)
         return True
+    
+    ###############
+    ### INDEXES ###
+    ###############
+    def _index_subscene(self, ss):
+        self.order[ss] = len(self.subscenes) - 1
+        ss.scene = self
+        if ss.area:
+            self.grid.insert(ss, ss.area.center())
+        self.saliency_queue.push(ss, self.saliency_key(ss))
+    
+    def build_index(self):
+        """
+        Rebuilds the spatial grid and saliency queue.
+        """
+        self.order = {}
+        self.grid = SPATIAL_GRID(SCENE.GRID_CELL_SIZE)
+        self.saliency_queue = SALIENCY_QUEUE()
+        subscenes = self.subscenes
+        self.subscenes = []
+        for ss in subscenes:
+            self.subscenes.append(ss)
+            self._index_subscene(ss)
+    
+    def saliency_key(self, ss):
+        """
+        Returns the priority of the subscene ss in the saliency queue: (saliency, -order).
+        """
+        return (ss.saliency, -self.order[ss])
+    
+    def update_saliency(self, ss):
+        """
+        Updates the position of the subscene ss in the saliency queue after its saliency changed.
+        """
+        if ss in self.saliency_queue:
+            self.saliency_queue.update(ss, self.saliency_key(ss))
+    
+    def most_salient(self):
+        """
+        Returns the subscene with highest saliency (first subscene in case of tie). None if the scene has no subscene.
+        """
+        return self.saliency_queue.top()
+    
+    def in_area(self, area):
+        """
+        Returns the subscenes (in scene order) whose area is included in area (AREA), see AREA.includes().
+        Only the subscenes whose center falls in the grid cells overlapped by area are tested.
+        """
+        candidates = self.grid.query(area.x, area.x + area.h, area.y, area.y + area.w)
+        found = [ss for ss in candidates if area.includes(ss.area)]
+        found.sort(key=lambda ss: self.order[ss])
+        return found
 
 class SCENE_LIGHT(object):
     """
@@ -247,12 +452,27 @@ class SCENE_LIGHT(object):
     Data:
         - subscenes ({STR:[CPT_INST]}): maps subscene names onto array of concept instances.
         - scene_structure (DICT): Directed acyclic graph dictionary with nodes as subscenes.
+        - anchor_index ({STR:STR}): Maps the anchor names onto the name of their subscene (see find_subscene()).
+        - parents_index ({STR:[STR]}): Maps the subscene names onto the names of their parents in scene_structure (see find_parents()).
+        - order ({STR:INT}): Maps the subscene names onto their position in the iteration order of subscenes.
+        - saliency_queue (SALIENCY_QUEUE): The subscene names by decreasing saliency (ties broken by order, see most_salient()).
+        - indexed (BOOL): True if the indexes are up to date.
+    
+    Notes:
+        - The indexes are built by build_index() (called by TCG_LOADER.load_scene_light()), and rebuilt on the next query if subscenes are added.
+        If scene_structure is modified directly, build_index() has to be called.
+        - The saliency queue is maintained by update_saliency().
     """
     def __init__(self):
         """
         """
         self.subscenes = {}
         self.scene_structure = {}
+        self.anchor_index = {}
+        self.parents_index = {}
+        self.order = {}
+        self.saliency_queue = SALIENCY_QUEUE()
+        self.indexed = False
     
     def reset(self):
         """
@@ -260,12 +480,42 @@ class SCENE_LIGHT(object):
         """
         self.subscenes = {}
         self.scene_structure = {}
+        self.anchor_index = {}
+        self.parents_index = {}
+        self.order = {}
+        self.saliency_queue = SALIENCY_QUEUE()
+        self.indexed = False
     
     def add_subscene(self, ss_name, content, saliency, anchor):
         """
         Add subscene to scene
         """
         self.subscenes[ss_name] = {"content":content, "saliency":saliency, "anchor":anchor}
+        self.indexed = False
+    
+    def build_index(self):
+        """
+        Builds the anchor, parents and saliency indexes.
+        The indexes follow the iteration order of subscenes and scene_structure, so that the queries return the same results as scanning them.
+        """
+        self.anchor_index = {}
+        self.order = {}
+        self.saliency_queue = SALIENCY_QUEUE()
+        for i, (ss_name, val) in enumerate(self.subscenes.iteritems()):
+            self.order[ss_name] = i
+            self.anchor_index.setdefault(val["anchor"].name, ss_name)
+            self.saliency_queue.push(ss_name, (val["saliency"], -i))
+        self.parents_index = {}
+        for name, daughters in self.scene_structure.iteritems():
+            for daughter in daughters:
+                parents = self.parents_index.setdefault(daughter, [])
+                if name not in parents:
+                    parents.append(name)
+        self.indexed = True
+    
+    def _check_index(self):
+        if not(self.indexed):
+            self.build_index()
 
     def find_subscene(self, anchor_name):
         """
@@ -273,10 +523,8 @@ class SCENE_LIGHT(object):
         Args:
             - anchor_name(STR): Name of an anchor schema inst
         """
-        subscenes = [ss_name for ss_name, val in self.subscenes.iteritems() if val["anchor"].name == anchor_name]
-        
-        subscene = subscenes[0] if subscenes else None
-        return subscene
+        self._check_index()
+        return self.anchor_index.get(anchor_name, None)
     
     def find_daughters(self, ss_name):
         """
@@ -289,12 +537,15 @@ class SCENE_LIGHT(object):
         """
         Finds the parents of the subscene with name ss_name in the scene_sturcture
         """
-        parents = []
-        for name, daughters in self.scene_structure.iteritems():
-            if ss_name in daughters:
-                parents.append(name)
-                
-        return parents
+        self._check_index()
+        return self.parents_index.get(ss_name, [])[:]
+    
+    def most_salient(self):
+        """
+        Returns the name of the subscene with highest saliency (None if the scene has no subscene).
+        """
+        self._check_index()
+        return self.saliency_queue.top()
         
     def get_content(self, ss_name):
         """
@@ -316,6 +567,8 @@ class SCENE_LIGHT(object):
         Updates the saliency of ss_name to saliency_val
         """
         self.subscenes[ss_name]['saliency'] = saliency_val
+        if self.indexed:
+            self.saliency_queue.update(ss_name, (saliency_val, -self.order[ss_name]))
         
     
     
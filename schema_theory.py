@@ -9,11 +9,12 @@ Dependencies:
     - time only to provide execution timing for procedural schema updating.
     - random
     - numpy to implement the schema instances activation values.
-    - matplotlib.plt to visualize WM state dynamics
+    - matplotlib.plt to visualize WM state dynamics (imported on first use)
     - networkx to visualize WM state
     - json to save simulation data in json format.
-    - pickle to save models.
+    - pickle to save models (gzip and hashlib to compress and deduplicate saved objects).
     - pprint for printing data
+    - heapq for the model event scheduler.
 """
 from __future__ import division
 import abc
@@ -21,10 +22,14 @@ import time
 import os
 import random
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import pickle
+import cPickle as pickle
+import gzip
+import hashlib
+import copy
 import pprint
+import weakref
+import heapq
+from collections import OrderedDict
 
 import networkx as nx
 import json
@@ -58,6 +63,7 @@ class PORT(object):
         - schema (SCHEMA): the schema the port is associated with.
         - type ('IN' or 'OUT'): type of port (input or output port)
         - value(): current value at the port.
+        - static (BOOL): If True, the value is published once and kept by the port (read-only value shared across time steps, e.g. LTM content).
     """
     TYPE_IN = 'IN'
     TYPE_OUT = 'OUT'
@@ -71,6 +77,7 @@ class PORT(object):
         PORT.ID_NEXT += 1
         self.type = port_type
         self.schema = port_schema
+        self.static = False
     
     def reset(self):
         """
@@ -117,8 +124,10 @@ class CONNECT(object):
         For now does not involve weight or delay!
         Sets the value of port_rom to the value of port_to.
         Resets the port_from value to None.
+        A static port_to keeps its published value until a new one is posted.
         """
-        self.port_to.value = self.port_from.value
+        if not(self.port_to.static) or self.port_from.value is not None:
+            self.port_to.value = self.port_from.value
         self.port_from.value = None
     
     def set_from(self, port):
@@ -182,6 +191,7 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         - activity (float): The activity level of the schema.
         - t (FLOAT): Time.
         - dt (FLOAT): Time step.
+        - plan ({'in':[(STR, PORT)], 'out':[(STR, PORT)]}): Compiled input and output slots (see compile()). None if not compiled.
     """
     def __init__(self, name=""):
         SCHEMA.__init__(self, name)
@@ -193,6 +203,7 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         self.activity = 0.0
         self.t = 0.0
         self.dt = 1.0
+        self.plan = None
     
     def reset(self):
         """
@@ -209,19 +220,40 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         self.t = 0
         self.dt = 1.0
     
+    def compile(self):
+        """
+        Compiles the input and output namespaces into the lists of (name, port) slots read by get() and written by post(), 
+        so that the port values are copied directly without port lookups by name.
+        The plan is discarded whenever a port is added or removed.
+        """
+        self.plan = {'in':[], 'out':[]}
+        for input_name in self.inputs:
+            self.plan['in'].append((input_name, self.find_port(input_name)))
+        for output_name in self.outputs:
+            self.plan['out'].append((output_name, self.find_port(output_name)))
+    
     def get(self):
         """
         Get all inputs and store them in the local self.inputs DICT. 
+        Static ports keep their value, the others are reset to None (see get_input()).
         """
-        for input_name in self.inputs.keys():
-            self.get_input(input_name)
+        if self.plan is None:
+            self.compile()
+        inputs = self.inputs
+        for input_name, port in self.plan['in']:
+            inputs[input_name] = port.value
+            if not(port.static):
+                port.value = None
     
     def post(self):
         """
         Post all the process outputs.
         """
-        for output_name, val in self.outputs.iteritems():
-            self.post_output(output_name, val)
+        if self.plan is None:
+            self.compile()
+        outputs = self.outputs
+        for output_name, port in self.plan['out']:
+            port.value = outputs[output_name]
     
     @abc.abstractmethod    
     def process(self):
@@ -241,11 +273,13 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         self.post()
         
         # Reset input and output namespace values.
-        for input_name in self.inputs.keys():
-            self.inputs[input_name] = None
+        inputs = self.inputs
+        for input_name, port in self.plan['in']:
+            inputs[input_name] = None
         
-        for output_name in self.outputs.keys():
-            self.outputs[output_name] = None
+        outputs = self.outputs
+        for output_name, port in self.plan['out']:
+            outputs[output_name] = None
     
     def add_port(self, port_type, port_name='', port_data=None, port_value=None):
         """
@@ -254,6 +288,7 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         If sucessessful, returns the port id. Else returns None.
         """
         new_port = PORT(port_type, port_schema=self, port_name=port_name, port_data=port_data, port_value=port_value)
+        self.plan = None
         
         if port_type == PORT.TYPE_IN:
             if self.inputs.has_key(new_port.name):
@@ -283,6 +318,7 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         self.out_ports = []
         self.inputs = {}
         self.outputs = {}
+        self.plan = None
     
     def set_params(self, params):
         """
@@ -312,7 +348,7 @@ class PROCEDURAL_SCHEMA(SCHEMA):
         
     def get_input(self, port_name):
         """
-        Return the current value of the port with name 'port_name', stores the value in the inputs namesapce, and resets the port value to None. If the port is not an input port, if multiple ports shared the same name or if the port is 
+        Return the current value of the port with name 'port_name', stores the value in the inputs namesapce, and resets the port value to None (static ports keep their value). If the port is not an input port, if multiple ports shared the same name or if the port is 
         not found, returns None.
         """
         port = self.find_port(port_name)
@@ -320,7 +356,8 @@ class PROCEDURAL_SCHEMA(SCHEMA):
             if self.inputs.has_key(port.name):
                 val = port.value
                 self.inputs[port.name] = val # Stores value in inputs namespace
-                port.value = None # Reset port value
+                if not(port.static):
+                    port.value = None # Reset port value
                 return val
         elif port and (port.type == PORT.TYPE_OUT):
             error_msg = "Port %s refers to an output port" % port_name
@@ -398,6 +435,56 @@ class SYSTEM_SCHEMA(PROCEDURAL_SCHEMA):
     def __init__(self, name=""):
         PROCEDURAL_SCHEMA.__init__(self, name)
         brain_mapping = BRAIN_MAPPING()
+    
+    def shared_content(self):
+        """
+        Returns the list of objects that copies of the system schema can share with it rather than duplicate (see MODEL.clone()).
+        Those objects should be treated as read-only during simulations.
+        """
+        return []
+    
+    def pending_inputs(self, port_names=None):
+        """
+        Returns True if one of the input ports (restricted to port_names ([STR]) if not None) holds a non-empty value to be read at the next update.
+        """
+        for port in self.in_ports:
+            if (port_names is None or port.name in port_names) and port.value:
+                return True
+        return False
+    
+    def needs_update(self):
+        """
+        Returns True if the schema needs to be updated at the current time step (see MODEL.update()).
+        Called by the model before the schema updates, once the port values have been propagated.
+        
+        Notes:
+            - Always True by default. A schema skipped by the model does not read its input ports, which keep their values.
+        """
+        return True
+    
+    def idle(self):
+        """
+        Returns True if updating the schema at the next time step would not change its state, other than through the passing of time (see skip_to()).
+        Called by the model scheduler (see MODEL.skip_idle_ticks()) once the port values have been propagated.
+        
+        Notes:
+            - Conservative by default: a schema is never idle unless it overrides this method.
+            - A schema waiting on an internal timer can be idle as long as it has registered the timer with set_timer().
+        """
+        return False
+    
+    def skip_to(self, t):
+        """
+        Brings the schema state to time t (FLOAT) after the model skipped the ticks during which the schema was idle.
+        """
+        self.t = t
+    
+    def set_timer(self, t):
+        """
+        Registers an internal timer with the model scheduler so that the schema is updated at time t (FLOAT) even if the model is idle.
+        """
+        if self.model:
+            self.model.schedule(t, 'timer', self.name)
 
 class FUNCTION_SCHEMA(PROCEDURAL_SCHEMA):
     """
@@ -669,16 +756,64 @@ class LTM(SYSTEM_SCHEMA):
     Data:
         - schemas ([SCHEMA]): Schema content of the long term memory
         - connections ([{from:schema1, to:schema2, weight:w}]): List of weighted connections between schemas (for future use if LTM needs to be defined as schema network)
+        - name_index ({STR:[SCHEMA]}): Maps schema names onto the schemas carrying that name. Maintained by add_schema.
+        - published (BOOL): True once the schemas have been posted on the output ports.
+    
+    Notes:
+        - The output ports are static: the schemas are posted once and shared read-only with the connected schemas.
     """
     def __init__(self, name=''):
         SYSTEM_SCHEMA.__init__(self,name)
         self.schemas = []
         self.connections = []
+        self.name_index = {}
+        self.published = False
+    
+    def reset(self):
+        """
+        """
+        super(LTM, self).reset()
+        self.published = False
+    
+    def add_port(self, port_type, port_name='', port_data=None, port_value=None):
+        """
+        LTM output ports are static (see PORT).
+        """
+        port_id = super(LTM, self).add_port(port_type, port_name, port_data, port_value)
+        if port_type == PORT.TYPE_OUT:
+            self.out_ports[-1].static = True
+        return port_id
+    
+    def update(self):
+        """
+        Posts the schemas once (see needs_update()).
+        """
+        super(LTM, self).update()
+        self.published = True
+    
+    def needs_update(self):
+        """
+        Only updated until the schemas are published.
+        """
+        return not(self.published)
 
     def add_schema(self, schema):
         if schema.LTM != self:
             schema.set_LTM(self) # Link the schema to this LTM object
         self.schemas.append(schema)
+        self.name_index.setdefault(schema.name, []).append(schema)
+    
+    def shared_content(self):
+        """
+        The schemas and their indexes are shared between copies of the LTM.
+        """
+        return [self.schemas, self.connections, self.name_index]
+    
+    def idle(self):
+        """
+        The LTM content does not change during simulations.
+        """
+        return True
     
     def add_connection(self, from_schema, to_schema, weight):
         self.connections.append({'from':from_schema, 'to':to_schema, 'weight':weight})
@@ -687,7 +822,7 @@ class LTM(SYSTEM_SCHEMA):
         """
         Returns the list of schemas with name = name(STR)
         """
-        res = [schema for schema in self.schemas if schema.name == name]
+        res = self.name_index.get(name, [])
         if not(res):
             return None
         else:
@@ -714,7 +849,8 @@ class WM(SYSTEM_SCHEMA):
         - params (DICT):
         - activity (float): The activity level of the schema.
     Data:
-        - schema_insts ([SCHEMA_INST]):
+        - insts (OrderedDict{STR:SCHEMA_INST}): Maps instance names onto the instances currently in WM, in order of insertion.
+        - schema_insts ([SCHEMA_INST]): Read-only list of the instances in WM, in order of insertion.
         - coop_links ([COOP_LINK]):
         - comp_links ([COMP_LINK]):
         - params (DICT): {'dyn': {'tau':FLOAT, 'int_weight':FLOAT, 'ext_weight':FLOAT,'act_rest':FLOAT,'k':FLOAT, 'noise_mean':FLOAT, 'noise_var':FLOAT},
@@ -730,7 +866,7 @@ class WM(SYSTEM_SCHEMA):
     """
     def __init__(self, name=''):
         SYSTEM_SCHEMA.__init__(self,name)
-        self.schema_insts = []
+        self.insts = OrderedDict()
         self.coop_links = []
         self.comp_links = []
         self.params['dyn'] = {'tau':10.0, 'int_weight':1.0, 'ext_weight':1.0, 'act_rest':0.001, 'k':10.0, 'noise_mean':0.0, 'noise_std':0.1}
@@ -744,21 +880,31 @@ class WM(SYSTEM_SCHEMA):
         Reset state of the schema
         """
         super(WM, self).reset()
-        self.schema_insts = []
+        self.insts = OrderedDict()
         self.coop_links = []
         self.comp_links = []
         self.save_state = {'insts':{}, 
                            'WM_activity': {'t':[], 'act':[], 'comp':[], 'coop':[], 
                                            'c2_network':{'num_insts':[], 'num_coop_links':[], 'num_comp_links':[]}}}
     
+    @property
+    def schema_insts(self):
+        return self.insts.values()
+    
     ########################
     ### INSTANCE METHODS ###
     ########################
+    def has_instance(self, schema_inst):
+        """
+        Returns True if schema_inst (SCHEMA_INST) is in WM, False otherwise.
+        """
+        return self.insts.get(schema_inst.name, None) is schema_inst
+    
     def add_instance(self, schema_inst, act0=None):
-        if schema_inst in self.schema_insts:
+        if self.has_instance(schema_inst):
             return False
             
-        self.schema_insts.append(schema_inst)
+        self.insts[schema_inst.name] = schema_inst
         schema_inst.system = self
         
         if not(act0):
@@ -778,7 +924,10 @@ class WM(SYSTEM_SCHEMA):
         """
         Removes the instance and all the associated C2-links
         """
-        self.schema_insts.remove(schema_inst)
+        if not(self.has_instance(schema_inst)):
+            error_msg = "%s is not in WM" %schema_inst.name
+            raise ValueError(error_msg)
+        del self.insts[schema_inst.name]
         for flink in self.coop_links[:]:
                     if (flink.inst_from == schema_inst) or (flink.inst_to == schema_inst):
                         self.coop_links.remove(flink)
@@ -792,7 +941,7 @@ class WM(SYSTEM_SCHEMA):
         Args:
             schema_inst_name (STR): name of a schema instance.
         """
-        schema_inst = next((inst for inst in self.schema_insts if inst.name == schema_inst_name), None)
+        schema_inst = self.insts.get(schema_inst_name, None)
         return schema_inst
         
     def add_coop_link(self, inst_from, port_from, inst_to, port_to, qual=1.0, weight=None, coop_asymetry=None):
@@ -800,7 +949,7 @@ class WM(SYSTEM_SCHEMA):
         Add a cooperation link between two instances.
         A cooperation link can only be added if the two instances are not already in competition.
         """
-        if (inst_from not in self.schema_insts) or (inst_to not in self.schema_insts):
+        if not(self.has_instance(inst_from)) or not(self.has_instance(inst_to)):
             raise ValueError("Cannot add cooperation link. Either %s or %s are not in WM." %(inst_from.name, inst_to.name))            
             
         result_1 = self.find_comp_links(inst_from=inst_from, inst_to=inst_to)
@@ -857,7 +1006,7 @@ class WM(SYSTEM_SCHEMA):
         A competition link can only be added if the two instances are not already in cooperation.
         
         """
-        if (inst_from not in self.schema_insts) or (inst_to not in self.schema_insts):
+        if not(self.has_instance(inst_from)) or not(self.has_instance(inst_to)):
             raise ValueError("Cannot add competition link. Either %s or %s are not in WM." %(inst_from.name, inst_to.name))
             
         result_1 = self.find_coop_links(inst_from=inst_from, inst_to=inst_to)
@@ -951,7 +1100,7 @@ class WM(SYSTEM_SCHEMA):
         """
         Removes from WM all the dead instances.
         """
-        for inst in self.schema_insts[:]:
+        for inst in self.schema_insts:
             if not inst.alive:
                 self.remove_instance(inst)
     
@@ -1071,7 +1220,7 @@ class WM(SYSTEM_SCHEMA):
         self.save_state['WM_activity']['comp'].append(tot_comp)
         self.save_state['WM_activity']['coop'].append(tot_coop)
         
-        self.save_state['WM_activity']['c2_network']['num_insts'].append(len(self.schema_insts))
+        self.save_state['WM_activity']['c2_network']['num_insts'].append(len(self.insts))
         self.save_state['WM_activity']['c2_network']['num_coop_links'].append(len(self.coop_links))
         self.save_state['WM_activity']['c2_network']['num_comp_links'].append(len(self.comp_links))
 
@@ -1127,6 +1276,7 @@ class WM(SYSTEM_SCHEMA):
         Note:
             - I am computing the density considering all links as unweighted and bidirectional.This does not take into account the assymetry coef or the weights.
         """
+        import matplotlib.pyplot as plt
         if folder and not(os.path.exists(folder)):
             os.mkdir(folder)
             
@@ -1221,6 +1371,8 @@ class WM(SYSTEM_SCHEMA):
         """
         step (INT): step betwween time values read (t_vals = range(0, max_time, step))
         """
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
         if folder and not(os.path.exists(folder)):
             os.mkdir(folder)
             
@@ -1301,6 +1453,7 @@ class WM(SYSTEM_SCHEMA):
             - NetworkX display methods are quite bad. Migrate to DOT format or to another way of 
             rendering the graph.
         """
+        import matplotlib.pyplot as plt
         state = nx.DiGraph()
         for inst in self.schema_insts:
             state.add_node(inst.name, activation=inst.activity)
@@ -1341,17 +1494,47 @@ class F_LINK(object):
         - inst_to (SCHEMA_INST)
         - weight (FLOAT)
         - asymmetry_coef (FLOAT): 0 <= asymmetry_coef <= 1
-        - weight_func (STR): String code of a lambda function to update weigths at each f-link update. Lambda function lambda x,y,x : f(x,y,z) that takes three arguments: x = current weight, y = activation of inst_from, z = activation of inst_to, and returns a new weight.
+        - weight_rule (STR): Name of the weight update rule applied at each f-link update (see WEIGHT_RULES).
+    
+    Class data:
+        - WEIGHT_RULES ({STR:FUNCTION}): Registry of the weight update rules. A rule f(x,y,z) takes three arguments: x = current weight, y = activation of inst_from, z = activation of inst_to, and returns a new weight.
+        The 'identity' rule (lambda x,y,z:x) is None: the weight is left unchanged.
+    
+    Notes:
+        - The links only store the name of their rule, so that they can be copied and pickled without the rule function.
     """
-    def __init__(self, inst_from=None, inst_to=None, weight=0.0, asymmetry_coef=0.0, weight_func_str='lambda x,y,z:x'):
+    WEIGHT_RULES = {'identity':None}
+    RULE_ALIASES = {'lambda x,y,z:x':'identity'}
+    
+    def __init__(self, inst_from=None, inst_to=None, weight=0.0, asymmetry_coef=0.0, weight_rule='identity'):
         """
         """
         self.inst_from = inst_from
         self.inst_to = inst_to
         self.weight = float(weight)
         self.asymmetry_coef = float(asymmetry_coef)
-        self.weight_func_str = weight_func_str
-        exec('self.weight_func = ' + weight_func_str)
+        self.weight_rule = F_LINK.get_weight_rule(weight_rule)
+    
+    @staticmethod
+    def add_weight_rule(name, rule):
+        """
+        Registers the weight update rule (FUNCTION or None for the identity) under name (STR).
+        """
+        F_LINK.WEIGHT_RULES[name] = rule
+    
+    @staticmethod
+    def get_weight_rule(weight_rule):
+        """
+        Returns the name of the registered rule for weight_rule (STR), the name of a registered rule or the source code of a lambda function.
+        Lambda sources are compiled once and registered under their source code.
+        """
+        weight_rule = F_LINK.RULE_ALIASES.get(weight_rule, weight_rule)
+        if weight_rule not in F_LINK.WEIGHT_RULES:
+            if not(weight_rule.strip().startswith('lambda')):
+                error_msg = "Unknown weight rule %s" % weight_rule
+                raise ValueError(error_msg)
+            F_LINK.add_weight_rule(weight_rule, eval(weight_rule))
+        return weight_rule
     
     def update_weight(self, new_weight):
         self.weight = float(new_weight)
@@ -1361,11 +1544,14 @@ class F_LINK(object):
         """
         self.inst_to.act_port_in.value.append(self.inst_from.act_port_out.value*self.weight) # Activation can be propagated in both directions depending on asymmetry coef.
         self.inst_from.act_port_in.value.append(self.inst_to.act_port_out.value*self.weight*(1-self.asymmetry_coef))
-        new_weight = self.weight_func(self.weight, self.inst_from.activity, self.inst_to.activity)
-        self.update_weight(new_weight)
+        rule = F_LINK.WEIGHT_RULES.get(self.weight_rule, False)
+        if rule is False: # Lambda source rule not compiled yet in this process (e.g. unpickled link).
+            rule = F_LINK.WEIGHT_RULES[F_LINK.get_weight_rule(self.weight_rule)]
+        if rule: # The identity rule is a no-op.
+            self.update_weight(rule(self.weight, self.inst_from.activity, self.inst_to.activity))
     
     def copy(self):
-        new_flink = F_LINK(inst_from=self.inst_from, inst_to=self.inst_to, weight=self.weight, asymmetry_coef=self.asymmetry_coef, weight_func_str=self.weight_func_str)
+        new_flink = F_LINK(inst_from=self.inst_from, inst_to=self.inst_to, weight=self.weight, asymmetry_coef=self.asymmetry_coef, weight_rule=self.weight_rule)
         return new_flink
         
     ####################
@@ -1374,7 +1560,7 @@ class F_LINK(object):
     def get_info(self):
         """
         """
-        data = {"inst_from":self.inst_from.name, "inst_to":self.inst_to.name, "weight":self.weight, "asymmetry_coef":self.asymmetry_coef, "weight_func_str":self.weight_func_str}
+        data = {"inst_from":self.inst_from.name, "inst_to":self.inst_to.name, "weight":self.weight, "asymmetry_coef":self.asymmetry_coef, "weight_rule":self.weight_rule}
         return data
     
 class COOP_LINK(F_LINK):
@@ -1386,21 +1572,24 @@ class COOP_LINK(F_LINK):
         - inst_to (SCHEMA_INST)
         - weight (FLOAT)
         - asymmetry_coef (FLOAT): 0 <= asymmetry_coef <= 1
-        - weight_func (STR): String code of a lambda function to update weigths at each f-link update. Lambda function lambda x,y,x : f(x,y,z) that takes three arguments: x = current weight, y = activation of inst_from, z = activation of inst_to, and returns a new weight.
+        - weight_rule (STR): Name of the weight update rule applied at each f-link update (see F_LINK.WEIGHT_RULES).
     
     Data:        
-        - connect (CONNECT)
+        - connect (CONNECT): Its weight follows the link weight (see update_weight()).
     """
-    def __init__(self, inst_from=None, inst_to=None, weight=1.0, asymmetry_coef=0.0, weight_func_str='lambda x,y,z:x'):
+    def __init__(self, inst_from=None, inst_to=None, weight=1.0, asymmetry_coef=0.0, weight_rule='identity'):
         """
         """
-        F_LINK.__init__(self, inst_from, inst_to, weight, asymmetry_coef, weight_func_str)
+        F_LINK.__init__(self, inst_from, inst_to, weight, asymmetry_coef, weight_rule)
         self.connect = CONNECT()
     
-    def set_connect(self, port_from, port_to, weight=0.0, delay=0.0):
+    def set_connect(self, port_from, port_to, weight=None, delay=0.0):
+        """
+        If weight is None, the connect weight is set to the link weight.
+        """
         self.connect.port_from = port_from
         self.connect.port_to = port_to
-        self.connect.weight = float(weight)
+        self.connect.weight = float(self.weight if weight is None else weight)
         self.connect.delay = float(delay)
     
     def update_weight(self, new_weight):
@@ -1411,7 +1600,7 @@ class COOP_LINK(F_LINK):
         return self.connect.port_from and self.connect.port_to
     
     def copy(self):
-        new_flink = COOP_LINK(inst_from=self.inst_from, inst_to=self.inst_to, weight=self.weight, asymmetry_coef=self.asymmetry_coef, weight_func_str=self.weight_func_str)
+        new_flink = COOP_LINK(inst_from=self.inst_from, inst_to=self.inst_to, weight=self.weight, asymmetry_coef=self.asymmetry_coef, weight_rule=self.weight_rule)
         new_flink.connect = self.connect.copy()
         return new_flink
     
@@ -1434,12 +1623,12 @@ class COMP_LINK(F_LINK):
         - inst_to (SCHEMA_INST)
         - weight (FLOAT)
         - asymmetry_coef (float): 0 <= asymmetry_coef <= 1
-        - weight_func_str (STR): String code of a lambda function to update weigths at each f-link update. Lambda function lambda x,y,x : f(x,y,z) that takes three arguments: x = current weight, y = activation of inst_from, z = activation of inst_to, and returns a new weight.
+        - weight_rule (STR): Name of the weight update rule applied at each f-link update (see F_LINK.WEIGHT_RULES).
     """
-    def __init__(self, inst_from=None, inst_to=None, weight=-1.0, asymmetry_coef=0.0, weight_func_str='lambda x,y,z:x'): #Symmetric links
+    def __init__(self, inst_from=None, inst_to=None, weight=-1.0, asymmetry_coef=0.0, weight_rule='identity'): #Symmetric links
         """
         """
-        F_LINK.__init__(self, inst_from, inst_to, weight, asymmetry_coef, weight_func_str)
+        F_LINK.__init__(self, inst_from, inst_to, weight, asymmetry_coef, weight_rule)
 
 class ASSEMBLAGE(FUNCTION_SCHEMA):
     """
@@ -1696,6 +1885,19 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         - set_up_time (INT): Number of time steps the system is ran so that all its sub-systems are in proper initial states.
         - verbose (BOOL): If True, print execution information.
         - sim_data (DICT): stores the simulation data.
+        - scheduler ([(FLOAT, INT, STR, DATA)]): Priority queue (heapq) of timed events (t, order, event_type, data). event_type is:
+            - 'input': data is the system input to set at time t.
+            - 'generator': data is (generator, offset). At time t, the generator yields (input, next_time, ...). input is set and the next call is scheduled at next_time + offset.
+            - 'timer': data is the name of the system schema that set the timer (see SYSTEM_SCHEMA.set_timer()).
+        - skip_idle (BOOL): If True, skip_idle_ticks() skips the ticks during which all the system schemas are idle.
+        - plan (DICT): Compiled execution plan (see compile()). None if not compiled.
+            - 'schemas' ([(STR, SYSTEM_SCHEMA)]): The schemas in update order.
+            - 'links' ([(STR, PORT, PORT)]): (from schema name, port_from, port_to) for each connection, in propagation order.
+            - 'outputs' ([(STR, PORT)]): (schema name, port) for each output port.
+    
+    Notes:
+        - An event scheduled at time t is processed by the update that starts at self.t == t (see process_events()).
+        - The skipped ticks are not stored in sim_data and do not appear in the schemas histories.
     """
     T0 = 0.0
     TIME_STEP = 1.0
@@ -1714,6 +1916,10 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         self.set_up_time = MODEL.SET_UP_TIME
         self.verbose = False
         self.sim_data = {'model':{}, 'system_states':{}}
+        self.scheduler = []
+        self.num_events = 0
+        self.skip_idle = False
+        self.plan = None
         
     def reset(self):
         """
@@ -1723,6 +1929,8 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         self.outputs = {}
         self.t = MODEL.T0
         self.sim_data = {'model':{}, 'system_states':{}}
+        self.scheduler = []
+        self.num_events = 0
         for schema_name in self.schemas:
             schema = self.schemas[schema_name]
             schema.t = self.t
@@ -1738,9 +1946,12 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         port_from = from_schema.find_port(from_port)
         port_to = to_schema.find_port(to_port)
         if port_from and port_to:
+            if port_from.static:
+                port_to.static = True
             new_connect = CONNECT(name=name, port_from=port_from, port_to=port_to, weight=weight, delay=delay)
             self.connections.append(new_connect)
             new_connect.model = self
+            self.plan = None
             return True
         else:
             return False
@@ -1758,6 +1969,7 @@ class MODEL(SYSTEM_OF_SYSTEMS):
             else:
                 self.schemas[schema.name] = schema
                 schema.model = self
+        self.plan = None
         
         self.params = self.get_params() # update the params value to account for new parameters.
     
@@ -1765,11 +1977,13 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         """
         """
         self.input_ports = ports
+        self.plan = None
     
     def set_output_ports(self, ports):
         """
         """
         self.output_ports = ports
+        self.plan = None
     
     def set_input(self, sys_input):
         """
@@ -1785,9 +1999,13 @@ class MODEL(SYSTEM_OF_SYSTEMS):
             - schema_name (str): name of the target schema
             - param_path (str): String giving the path to the param using . chain (e.g. "dynamics.activation' would set the path to params['dynamics']['activation'])
             - param_value (): New value of the parameter
+        
+        Notes:
+            - The canonical saved state of the model is discarded (see st_save()) so that the next canonical save records the new parameter value.
         """
         schema = self.schemas[schema_name]
         schema.update_param(param_path, param_value)
+        ST_CANONICAL.pop(self, None)
     
     def update_params(self, params):
         """
@@ -1821,27 +2039,109 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         self.t is not updated, simulation results not saved.
         """
         for t in range(self.set_up_time):
-             # Update all the schema states
-            for schema_name, schema in self.schemas.iteritems():
-                init_t = time.time()
-                schema.update()
-                end_t = time.time()
-                schema.t = self.t
-                if self.verbose:
-                    print 'Update %s, (%f s)' %(schema_name, end_t - init_t)
-            
-            # Propagate value through connections
-            for connection in self.connections:
-                connection.update()
+            updated = self.update_schemas()
+            self.propagate(updated)
+        
+    #################
+    ### SCHEDULER ###
+    #################
+    def schedule(self, t, event_type, data=None):
+        """
+        Adds the event (event_type (STR), data) at time t (FLOAT) to the scheduler (see MODEL data).
+        Timers set several times for the same time and schema are only scheduled once.
+        """
+        if event_type == 'timer':
+            for event in self.scheduler:
+                if event[0] == t and event[2] == 'timer' and event[3] == data:
+                    return
+        heapq.heappush(self.scheduler, (t, self.num_events, event_type, data))
+        self.num_events += 1
+    
+    def schedule_input(self, t, sys_input):
+        """
+        Schedules sys_input to be the system input at time t (FLOAT).
+        """
+        self.schedule(t, 'input', sys_input)
+    
+    def schedule_generator(self, generator, offset=0):
+        """
+        Schedules the inputs yielded by generator, such as SEM_GENERATOR.sem_generator() or UTTER_GENERATOR.utter_generator().
+        The generators yield tuples (input, next_time, ...): the first yield only provides the time of the first input.
+        
+        Args:
+            - generator (GENERATOR)
+            - offset (FLOAT): Added to the generator times to get model times.
+        """
+        next_time = generator.next()[1]
+        if next_time != None:
+            self.schedule(next_time + offset, 'generator', (generator, offset))
+    
+    def next_event_time(self):
+        """
+        Returns the time of the next scheduled event (None if no event is scheduled).
+        """
+        return self.scheduler[0][0] if self.scheduler else None
+    
+    def process_events(self):
+        """
+        Processes all the events scheduled at or before the current time self.t.
+        Returns the list of processed events [(t, event_type, data)].
+        """
+        events = []
+        while self.scheduler and self.scheduler[0][0] <= self.t:
+            (t, num, event_type, data) = heapq.heappop(self.scheduler)
+            if event_type == 'input':
+                self.set_input(data)
+            elif event_type == 'generator':
+                (generator, offset) = data
+                res = generator.next()
+                self.set_input(res[0])
+                if res[1] != None:
+                    self.schedule(res[1] + offset, 'generator', data)
+            events.append((t, event_type, data))
+        return events
+    
+    def idle(self):
+        """
+        Returns True if no input is waiting to be read and all the system schemas are idle (see SYSTEM_SCHEMA.idle()).
+        """
+        if self.input is not None:
+            return False
+        for schema in self.schemas.itervalues():
+            if not(schema.idle()):
+                return False
+        return True
+    
+    def skip_idle_ticks(self, max_time=None):
+        """
+        If self.skip_idle is True and the model is idle, advances time to the next scheduled event (or to max_time (FLOAT) if no event is scheduled before).
+        The schemas are brought to the new time with skip_to().
+        Returns the number of skipped ticks.
+        """
+        if not(self.skip_idle) or not(self.idle()):
+            return 0
+        next_t = self.next_event_time()
+        if next_t is None or (max_time is not None and next_t > max_time):
+            next_t = max_time
+        if next_t is None or next_t <= self.t:
+            return 0
+        num_ticks = int(round((next_t - self.t)/self.dt))
+        self.t = next_t
+        for schema in self.schemas.itervalues():
+            schema.skip_to(self.t)
+        return num_ticks
         
     def update(self):
         """
         By defaults:
+            - Processes the scheduled events.
             - Gets system input
-            - Updates all the schemas.
-            - Propage port values through connections.
+            - Updates the schemas that need an update (see SYSTEM_SCHEMA.needs_update()).
+            - Propage the port values of the updated schemas through connections.
             - Update system outputs.
         """
+        self.process_events()
+        
         # Update time
         self.t += self.dt
         
@@ -1850,30 +2150,73 @@ class MODEL(SYSTEM_OF_SYSTEMS):
             port.value = self.input
             self.input = None
         
-        # Update all the schema states
-        for schema_name, schema in self.schemas.iteritems():
-            init_t = time.time()
-            schema.update()
-            end_t = time.time()
-            schema.t = self.t
-            if self.verbose:
-                print 'Update %s, (%f s)' %(schema_name, end_t - init_t)
+        # Update the schema states
+        updated = self.update_schemas()
         
         # Propagate value through connections
-        for connection in self.connections:
-            connection.update()
+        self.propagate(updated)
         
         # Update the system output
-        self.outputs[self.t] = {}
-        for port in self.output_ports:
-            self.outputs[self.t][port.schema.name] = port.value
+        outputs = {}
+        for schema_name, port in self.plan['outputs']:
+            outputs[schema_name] = port.value
             port.value = None
+        self.outputs[self.t] = outputs
         
         # Save simulation data
         if not(self.sim_data['model']):
             self.sim_data['model'] = self.get_info()
         self.sim_data[self.t] = self.get_state()    
     
+    def update_schemas(self):
+        """
+        Updates the schemas that need an update (see SYSTEM_SCHEMA.needs_update()) and brings all the schemas to the current time.
+        Returns the set of the names of the updated schemas.
+        """
+        if self.plan is None:
+            self.compile()
+        updated = set()
+        for schema_name, schema in self.plan['schemas']:
+            if schema.needs_update():
+                init_t = time.time()
+                schema.update()
+                end_t = time.time()
+                updated.add(schema_name)
+                if self.verbose:
+                    print 'Update %s, (%f s)' %(schema_name, end_t - init_t)
+            schema.t = self.t
+        return updated
+    
+    def propagate(self, updated):
+        """
+        Propagates the port values through the connections leaving the schemas whose names are in updated (SET).
+        The output ports of the other schemas have not changed since the last propagation.
+        Same message passing as CONNECT.update(), applied to the compiled links.
+        """
+        if self.plan is None:
+            self.compile()
+        for schema_name, port_from, port_to in self.plan['links']:
+            if schema_name in updated:
+                if not(port_to.static) or port_from.value is not None:
+                    port_to.value = port_from.value
+                port_from.value = None
+    
+    def compile(self):
+        """
+        Compiles the schemas, ports and connections into the execution plan used at each time step (see MODEL data).
+        The schemas port slots are compiled as well (see PROCEDURAL_SCHEMA.compile()).
+        Called automatically on the first update after the model is built or modified.
+        """
+        plan = {'schemas':[], 'links':[], 'outputs':[]}
+        for schema_name, schema in self.schemas.iteritems():
+            schema.compile()
+            plan['schemas'].append((schema_name, schema))
+        for connection in self.connections:
+            plan['links'].append((connection.port_from.schema.name, connection.port_from, connection.port_to))
+        for port in (self.output_ports or []):
+            plan['outputs'].append((port.schema.name, port))
+        self.plan = plan
+    
     def set_default_params(self, params=None):
         """
         Set default model parameters to params if params != None. Else set default params to self.params.
@@ -1889,6 +2232,24 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         Resets the params to the default parameters
         """
         self.params = self.default_params.copy()
+    
+    def clone(self):
+        """
+        Returns an independent copy of the model, reset to its initial state.
+        The objects returned by the shared_content() method of each system schema (e.g. LTM content) are shared with the 
+        original model rather than duplicated, all the rest (schemas, ports, connections, parameters) is copied.
+        
+        Notes:
+            - Meant to be used on a model that has just been built (a prototype) to cheaply build multiple models.
+        """
+        memo = {}
+        for schema in self.schemas.itervalues():
+            for obj in schema.shared_content():
+                if obj is not None:
+                    memo[id(obj)] = obj
+        new_model = copy.deepcopy(self, memo)
+        new_model.reset()
+        return new_model
         
     
     ####################
@@ -1947,6 +2308,7 @@ class MODEL(SYSTEM_OF_SYSTEMS):
         """
         import subprocess
         import pydot
+        import matplotlib.pyplot as plt
         
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
@@ -2017,25 +2379,127 @@ class MODEL(SYSTEM_OF_SYSTEMS):
 ############################
 ##### MODULE FUNCTIONS #####
 ############################
-def st_save(my_object, object_name, path,extension='st'):
+ST_MANIFEST = 'manifest.json'
+ST_OBJECTS = 'objects'
+ST_CANONICAL = weakref.WeakKeyDictionary() # Pickles of the objects saved with st_save(canonical=True), as they were when first saved.
+
+def _st_manifest_file(path):
     """
-    Saves an object using pickle.
+    Returns the name of the manifest file of the folder path.
+    """
+    return os.path.join(path, ST_MANIFEST)
+
+def st_manifest(path):
     """
-    file_name = '%s%s.%s' %(path,object_name,extension)
+    Returns the manifest of the folder path ({} if there is none).
+    
+    The manifest maps each file name saved with st_save(dedup=True) to:
+        - 'file' (STR): the path of the content file, relative to path.
+        - 'digest' (STR): sha1 digest of the pickled object.
+        - 'compress' (BOOL): whether the content file is gzip compressed.
+    """
+    file_name = _st_manifest_file(path)
+    if not(os.path.exists(file_name)):
+        return {}
+    with open(file_name, 'r') as f:
+        return json.load(f)
+
+def _st_write(data, file_name, compress):
+    """
+    Writes the pickled data to file_name (through a temp file so that readers never see a partial file).
+    """
+    tmp_name = '%s.%i.tmp' %(file_name, os.getpid())
+    if compress:
+        f = gzip.open(tmp_name, 'wb')
+    else:
+        f = open(tmp_name, 'wb')
+    with f:
+        f.write(data)
+    if os.path.isfile(file_name):
+        os.remove(file_name)
+    os.rename(tmp_name, file_name)
+
+def st_save(my_object, object_name, path, extension='st', compress=True, dedup=True, store=None, canonical=False):
+    """
+    Saves an object using pickle (highest binary protocol).
+    
+    Args:
+        - my_object (): Object to save.
+        - object_name (STR): Name of the object.
+        - path (STR): Folder in which the object is saved.
+        - extension (STR): Extension of the saved file name.
+        - compress (BOOL): If True, the pickle is gzip compressed.
+        - dedup (BOOL): If True, the pickle is stored once under its content digest and the file name is recorded in the manifest of path.
+        - store (STR): Folder holding the content files (defaults to path). Using a common store for several folders shares identical objects between them.
+        - canonical (BOOL): If True, the object is saved in the state it had the first time it was saved with canonical=True
+        (for a MODEL, the first time since its parameters were last changed with update_params() or update_schema_param()).
+    
+    Returns:
+        - file_name (STR): The name under which the object can be loaded with st_load.
+        
+    Notes:
+        - Identical objects are only written once per store. Objects that are modified between saves (e.g. a model or a sem_gen saved before each of 
+        the runs of a simulation, whose runtime state changes during the runs) need canonical=True to be identical.
+        - st_load only reads the manifest and the requested content file.
+    """
+    file_name = '%s.%s' %(object_name, extension)
     if not(os.path.exists(path)):
-            os.mkdir(path)
-    with open(file_name, 'w') as f:
-        pickle.dump(my_object, f)
+        os.makedirs(path)
+    data = ST_CANONICAL.get(my_object, None) if canonical else None
+    if data is None:
+        data = pickle.dumps(my_object, pickle.HIGHEST_PROTOCOL)
+        if canonical:
+            ST_CANONICAL[my_object] = data
+    if not(dedup):
+        _st_write(data, os.path.join(path, file_name), compress)
+        return file_name
+    
+    digest = hashlib.sha1(data).hexdigest()
+    objects_folder = os.path.join(store if store else path, ST_OBJECTS)
+    if not(os.path.exists(objects_folder)):
+        os.makedirs(objects_folder)
+    content_file = os.path.join(objects_folder, digest + ('.pkl.gz' if compress else '.pkl'))
+    if not(os.path.exists(content_file)):
+        _st_write(data, content_file, compress)
+    
+    manifest = st_manifest(path)
+    manifest[file_name] = {'file':os.path.relpath(content_file, path), 'digest':digest, 'compress':compress}
+    tmp_name = '%s.%i.tmp' %(_st_manifest_file(path), os.getpid())
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, sort_keys=True, indent=1)
+    if os.path.isfile(_st_manifest_file(path)):
+        os.remove(_st_manifest_file(path))
+    os.rename(tmp_name, _st_manifest_file(path))
+    return file_name
 
 def st_load(object_name,path):
     """
-    Loads an object using pickle.
+    Loads an object saved with st_save.
+    
+    Args:
+        - object_name (STR): File name of the object (e.g. 'sem_gen.st').
+        - path (STR): Folder in which the object was saved.
+    
+    Notes:
+        - Objects recorded in the manifest of path are read from their content file.
+        - Otherwise the file path + object_name is read directly. Gzip compressed, binary and the former protocol 0 text pickles are supported.
     """
-    file_name = path + object_name
-    with open(file_name, 'r') as f:
-        my_object  = pickle.load(f)
-        return my_object
-    return None
+    entry = st_manifest(path).get(object_name, None)
+    if entry:
+        file_name = os.path.join(path, entry['file'])
+    else:
+        file_name = os.path.join(path, object_name)
+    
+    with open(file_name, 'rb') as f:
+        magic = f.read(2)
+    if magic == '\x1f\x8b': # gzip
+        with gzip.open(file_name, 'rb') as f:
+            return pickle.load(f)
+    if magic[:1] == '\x80': # binary protocol (>= 2)
+        with open(file_name, 'rb') as f:
+            return pickle.load(f)
+    with open(file_name, 'r') as f: # protocol 0 text pickle
+        return pickle.load(f)
         
 ###############################################################################
 if __name__=="__main__":
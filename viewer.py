@@ -14,11 +14,6 @@ import SimpleHTTPServer
 import SocketServer
 import webbrowser
 import subprocess
-import pydot
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import numpy as np
-from PIL import Image
 import construction
 import percept
 import perceptual_schemas
@@ -103,6 +98,7 @@ class TCG_VIEWER:
         Create graph image for the conceptual knowledge.
         Uses graphviz with pydot implementation.
         """        
+        import pydot
         prog = 'neato'
         file_type = 'svg'
         
@@ -141,6 +137,7 @@ class TCG_VIEWER:
         Create graph image for the percetual knowledge.
         Uses graphviz with pydot implementation.
         """  
+        import pydot
         prog = 'neato'
         file_type = 'svg'
         
@@ -181,6 +178,7 @@ class TCG_VIEWER:
         Create graph image for the conceputalizer.
         Uses graphviz with pydot implementation.
         """        
+        import pydot
         prog = 'dot'
         file_type = 'svg'
         
@@ -228,6 +226,7 @@ class TCG_VIEWER:
         
         Obsolete, check format of display_cxn
         """        
+        import pydot
         prog = 'dot'
         file_type = 'svg'
         
@@ -287,6 +286,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the conceptual knowledge.
         """
+        import pydot
         font_name = 'consolas'
         font_size = '16'
         color = 'black'
@@ -318,6 +318,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the perceptual knowledge.
         """
+        import pydot
         font_name = 'consolas'
         font_size = '16'
         color = 'black'
@@ -354,6 +355,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the conceptualization.
         """
+        import pydot
         font_name = 'consolas'
         font_size = '16'
         color = 'black'
@@ -404,6 +406,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the construction.
         """
+        import pydot
         font_size = '16'
         font_name = 'consolas'
         
@@ -492,6 +495,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the construction instance
         """
+        import pydot
         label = '<<FONT FACE="%s"><TABLE BORDER="0" ALIGN="LEFT"><TR><TD ALIGN="LEFT">name: %s</TD></TR><TR><TD ALIGN="LEFT">activity: %.1f</TD></TR></TABLE></FONT>>' %('consolas', cxn_inst.name, cxn_inst.activity)
         cluster_name = cxn_inst.name        
         inst_cluster = pydot.Cluster(cluster_name, label=label, color='black', fill='white')
@@ -521,6 +525,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing the C2 graph, with the instances as nodes without display instances content.
         """
+        import pydot
         font_size = '14'
         font_name = 'consolas'
         inst_shape = 'box'
@@ -550,6 +555,7 @@ class TCG_VIEWER:
         """
         Returns a DOT cluster containing all the information regarding the C2 between cxn instances.
         """
+        import pydot
         
         C2_cluster = pydot.Cluster('C2_cluster', label='', color='white', fill='white')
         splines='splines' # I am not sure that this works...
@@ -576,6 +582,7 @@ class TCG_VIEWER:
         Args:
             - SemRep (Networkx.DiGraph): State of visWM.
         """
+        import pydot
         node_font_size = '14'
         edge_font_size = '12'
         style_unexpressed = 'filled'
@@ -610,6 +617,7 @@ class TCG_VIEWER:
         
         NOTE: would need to add phonological WM
         """        
+        import pydot
         font_name = 'consolas'
         cover_style = 'dashed'
         edge_color = 'grey'
@@ -657,6 +665,7 @@ class TCG_VIEWER:
         Note:
             - Node position is defined by instances position.
         """
+        import pydot
         node_font_size = '14'
         edge_font_size = '12'
         style = 'filled'
@@ -691,6 +700,7 @@ class TCG_VIEWER:
     
     @staticmethod        
     def _create_WMs_cluster(visWM, semWM, gramWM, concise=True):
+        import pydot
         font_name = 'consolas'
         cover_color = 'grey'
         cover_style = 'dashed'
@@ -727,6 +737,8 @@ class TCG_VIEWER:
         Args:
             - cxn (CXN): the construction object to be displayed.
         """        
+        import pydot
+        import matplotlib.pyplot as plt
         tmp_folder = folder   
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -765,6 +777,8 @@ class TCG_VIEWER:
         """
         Display a construction instance.
         """
+        import pydot
+        import matplotlib.pyplot as plt
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -798,6 +812,7 @@ class TCG_VIEWER:
         Nicer display for assemblage.
         Should have a concise=True/False option (concise does not show the inside of cxn. Ideally, clicking on a cxn would expand it)
         """
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -834,6 +849,7 @@ class TCG_VIEWER:
         """
         Nicer display for wm state.
         """
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -864,6 +880,7 @@ class TCG_VIEWER:
         Create graph images for the semanic working memory
         Uses graphviz with pydot implementation.
         """        
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -898,6 +915,7 @@ class TCG_VIEWER:
         Create graph images for the ling working memory (semantic WM + grammatical WM)
         Uses graphviz with pydot implementation.
         """        
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -934,6 +952,7 @@ class TCG_VIEWER:
         Create graph images for the visual working memory.
         Uses graphviz with pydot implementation.
         """
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -958,6 +977,7 @@ class TCG_VIEWER:
         """
         Create graph images for including both visual and linguisitc working memory.
         """
+        import pydot
         tmp_folder = folder
         if not(os.path.exists(tmp_folder)):
             os.mkdir(tmp_folder)
@@ -986,6 +1006,10 @@ class TCG_VIEWER:
     def display_scene(scene, img_file):
         """
         """
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+        import numpy as np
+        from PIL import Image
         # Load scene image
         imgPIL = Image.open(img_file)
         
@@ -1049,6 +1073,9 @@ class TCG_VIEWER:
             - img_file
             - ssradius (BOOL): If True, fixtion radius is set to the value of the fixated subscene's radius.
         """
+        import matplotlib.pyplot as plt
+        import numpy as np
+        from PIL import Image
         HEAD_SIZE = 20
         RADIUS_FIX = 80.0
         COLOR_FIX = 'b'
@@ -1086,6 +1113,7 @@ class TCG_VIEWER:
     def display_saliencymap(saliency_map):
         """
         """
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.title('saliency map')
         plt.plot(saliency_map)